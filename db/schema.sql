@@ -15,10 +15,14 @@ CREATE TABLE students (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
--- Posts table (main submissions)
+-- Posts table (main submissions), range-partitioned by posted_at with one
+-- partition per term, created on demand by the ingest and archived by
+-- ingest/partitions.py. There is no default partition.
+-- Unique keys must include the partition key; an Ed thread's posted_at
+-- never changes, so (ed_post_id, posted_at) identifies a post.
 CREATE TABLE posts (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    ed_post_id BIGINT UNIQUE NOT NULL,
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    ed_post_id BIGINT NOT NULL,
     ed_thread_id BIGINT,
     title TEXT NOT NULL,
     content TEXT,
@@ -29,36 +33,49 @@ CREATE TABLE posts (
     url TEXT,
     category TEXT, -- Participation D, etc.
     tags TEXT[], -- ['Muon', 'MuP', 'Shampoo', etc.]
+    topics TEXT[], -- canonical topics extracted at ingest time
+    homework_number INTEGER, -- parsed from "HW06" / "Homework 12" in the title
     search_vector TSVECTOR,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
+    content_html TEXT, -- content pre-rendered to HTML (math included) by ingest/render.py
+    content_html_hash TEXT, -- md5 of the render version + content that content_html came from
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, posted_at),
+    UNIQUE (ed_post_id, posted_at)
+) PARTITION BY RANGE (posted_at);
 
--- Attachments table
+-- Attachments table, partitioned like its posts (post_posted_at = posts.posted_at)
 CREATE TABLE attachments (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    post_id UUID REFERENCES posts(id) ON DELETE CASCADE,
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    post_id UUID NOT NULL,
+    post_posted_at TIMESTAMP WITH TIME ZONE NOT NULL,
     filename TEXT NOT NULL,
     file_type TEXT,
     file_size BIGINT,
-    ed_attachment_id TEXT UNIQUE,
+    ed_attachment_id TEXT,
     download_url TEXT,
     preview_url TEXT,
     is_image BOOLEAN DEFAULT FALSE,
     is_pdf BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-);
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (id, post_posted_at),
+    UNIQUE (ed_attachment_id, post_posted_at),
+    FOREIGN KEY (post_id, post_posted_at) REFERENCES posts(id, posted_at) ON DELETE CASCADE
+) PARTITION BY RANGE (post_posted_at);
 
--- Extracted links table
+-- Extracted links table, partitioned like its posts
 CREATE TABLE links (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    post_id UUID REFERENCES posts(id) ON DELETE CASCADE,
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    post_id UUID NOT NULL,
+    post_posted_at TIMESTAMP WITH TIME ZONE NOT NULL,
     url TEXT NOT NULL,
     title TEXT,
     link_type TEXT, -- 'github', 'personal', 'documentation', 'other'
     domain TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    UNIQUE(post_id, url)
-);
+    PRIMARY KEY (id, post_posted_at),
+    UNIQUE(post_id, url, post_posted_at),
+    FOREIGN KEY (post_id, post_posted_at) REFERENCES posts(id, posted_at) ON DELETE CASCADE
+) PARTITION BY RANGE (post_posted_at);
 
 -- Ingestion tracking
 CREATE TABLE ingestion_runs (
@@ -69,7 +86,222 @@ CREATE TABLE ingestion_runs (
     posts_created INTEGER DEFAULT 0,
     posts_updated INTEGER DEFAULT 0,
     errors TEXT[],
-    status TEXT DEFAULT 'running' -- 'running', 'completed', 'failed'
+    status TEXT DEFAULT 'running', -- 'running', 'completed', 'failed'
+    profile_dir TEXT, -- artifacts of a --profile run (pstats, memory, slowest threads)
+    profile_summary JSONB -- wall time, peak traced memory and slowest threads of that run
+);
+
+-- Work queue shared by ingest workers (ingest/jobs.py). Jobs are claimed with
+-- FOR UPDATE SKIP LOCKED and held under a lease (locked_until); a job whose
+-- lease expires is visible again, and failures are retried with backoff up to
+-- max_attempts. dedupe_key makes enqueueing idempotent.
+CREATE TABLE jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL, -- 'fetch_page', 'process_thread', 'enrich_links', 'download_attachment', 'refresh_derived'
+    payload JSONB NOT NULL DEFAULT '{}',
+    dedupe_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), -- not claimable before this
+    locked_by TEXT, -- worker holding the lease
+    locked_until TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Sequenced change feed of posts (ingest/changes.py), written by trigger in
+-- the mutating transaction. seq is drawn without any lock, so it does not
+-- follow commit order; consumers read in (txid, seq) order and only up to
+-- the oldest transaction still running, below which nothing can commit.
+CREATE TABLE post_changes (
+    seq BIGSERIAL PRIMARY KEY,
+    post_id UUID NOT NULL,
+    ed_post_id BIGINT NOT NULL,
+    posted_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    op TEXT NOT NULL, -- 'create', 'update', 'hide', 'unhide', 'delete'
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    changed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Position (txid, seq) of the last post change each consumer has processed
+CREATE TABLE change_consumers (
+    name TEXT PRIMARY KEY,
+    last_txid XID8 NOT NULL DEFAULT '0',
+    last_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Dead letters: Ed threads that failed to fetch, process or store. The retry
+-- pass (`python -m sync retry`) re-fetches due threads with exponential
+-- backoff; after max attempts a thread is 'dead' until retried with --all.
+CREATE TABLE failed_threads (
+    thread_id BIGINT PRIMARY KEY, -- Ed thread ID (posts.ed_post_id)
+    stage TEXT NOT NULL, -- 'fetch', 'process', 'store'
+    error_class TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'dead'
+    next_retry_at TIMESTAMP WITH TIME ZONE,
+    first_failed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_failed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Precomputed related posts (TF-IDF cosine neighbours, maintained by ingest).
+-- posts.id alone is not a unique key of the partitioned table, so there are no
+-- foreign keys here; RelatedPostsIndex.update() drops rows of removed posts.
+CREATE TABLE related_posts (
+    post_id UUID NOT NULL,
+    related_post_id UUID NOT NULL,
+    score REAL NOT NULL,
+    rank SMALLINT NOT NULL,
+    PRIMARY KEY (post_id, related_post_id)
+);
+
+-- Content hash each post's neighbours were last computed from
+CREATE TABLE related_posts_state (
+    post_id UUID PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Corpus (post count, document frequency per term) of the last full related-posts
+-- build; incremental updates rescore everything once the corpus drifts from it
+CREATE TABLE related_posts_corpus (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    post_count INTEGER NOT NULL,
+    document_frequency JSONB NOT NULL,
+    built_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Post counts per filter facet ('tag', 'topic', 'homework', 'author'), kept in sync by trigger
+CREATE TABLE facet_counts (
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL,
+    post_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (facet, value)
+);
+
+-- Distinct titles, author names, tags, topics and homework labels of visible
+-- posts for autocomplete and typo-tolerant lookups, kept in sync by trigger.
+-- Terms no visible post carries any more are deleted.
+CREATE TABLE search_terms (
+    kind TEXT NOT NULL, -- 'title', 'author', 'tag', 'topic' or 'homework'
+    term TEXT NOT NULL,
+    weight REAL NOT NULL, -- ranking weight of the kind, see search_term_weight()
+    post_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (kind, term)
+);
+
+-- Daily participation rollups for the dashboard, merged from each run's delta
+-- by ingest/analytics.py. Days are calendar days in ANALYTICS_TIMEZONE.
+CREATE TABLE daily_student_posts (
+    day DATE NOT NULL,
+    author_id UUID NOT NULL,
+    post_count INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (day, author_id)
+);
+
+CREATE TABLE daily_tag_posts (
+    day DATE NOT NULL,
+    tag TEXT NOT NULL,
+    post_count INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (day, tag)
+);
+
+CREATE TABLE daily_homework_posts (
+    day DATE NOT NULL,
+    homework_number INTEGER NOT NULL,
+    post_count INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (day, homework_number)
+);
+
+-- Time to first submission per homework, in hours from its first visible post
+CREATE TABLE homework_submission_stats (
+    homework_number INTEGER PRIMARY KEY,
+    students INTEGER NOT NULL, -- students with at least one post on the homework
+    opened_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_first_submission_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    median_hours_to_first_submission REAL,
+    p90_hours_to_first_submission REAL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- What each visible post was last counted as in the rollups
+CREATE TABLE analytics_rollup_state (
+    post_id UUID PRIMARY KEY,
+    day DATE NOT NULL,
+    author_id UUID,
+    homework_number INTEGER,
+    tags TEXT[] NOT NULL
+);
+
+-- Unlogged staging tables for COPY-based bulk imports (Database.bulk_upsert_posts);
+-- seq orders duplicates so the last copy of a row wins
+CREATE UNLOGGED TABLE staging_students (
+    seq BIGSERIAL,
+    ed_user_id BIGINT,
+    display_name TEXT,
+    email TEXT
+);
+
+CREATE UNLOGGED TABLE staging_posts (
+    seq BIGSERIAL,
+    ed_post_id BIGINT,
+    ed_thread_id BIGINT,
+    title TEXT,
+    content TEXT,
+    author_ed_user_id BIGINT,
+    posted_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    url TEXT,
+    category TEXT,
+    tags TEXT[],
+    topics TEXT[],
+    homework_number INTEGER
+);
+
+CREATE UNLOGGED TABLE staging_attachments (
+    seq BIGSERIAL,
+    ed_post_id BIGINT,
+    filename TEXT,
+    file_type TEXT,
+    file_size BIGINT,
+    ed_attachment_id TEXT,
+    download_url TEXT,
+    preview_url TEXT,
+    is_image BOOLEAN,
+    is_pdf BOOLEAN
+);
+
+CREATE UNLOGGED TABLE staging_links (
+    seq BIGSERIAL,
+    ed_post_id BIGINT,
+    url TEXT,
+    title TEXT,
+    link_type TEXT,
+    domain TEXT
+);
+
+-- Signed facet and search-term contributions of a bulk import's posts, taken
+-- before and after the merge and added onto facet_counts and search_terms
+CREATE UNLOGGED TABLE staging_facet_deltas (
+    facet TEXT,
+    value TEXT,
+    delta INTEGER
+);
+
+CREATE UNLOGGED TABLE staging_term_deltas (
+    kind TEXT,
+    term TEXT,
+    delta INTEGER
 );
 
 -- Site configuration
@@ -84,14 +316,38 @@ CREATE INDEX idx_posts_search_vector ON posts USING GIN(search_vector);
 CREATE INDEX idx_posts_author_id ON posts(author_id);
 CREATE INDEX idx_posts_posted_at ON posts(posted_at DESC);
 CREATE INDEX idx_posts_tags ON posts USING GIN(tags);
+CREATE INDEX idx_posts_topics ON posts USING GIN(topics);
+CREATE INDEX idx_posts_homework_number ON posts(homework_number);
 CREATE INDEX idx_attachments_post_id ON attachments(post_id);
 CREATE INDEX idx_links_post_id ON links(post_id);
+CREATE INDEX idx_related_posts_related_post_id ON related_posts(related_post_id);
 CREATE INDEX idx_students_display_name ON students(display_name);
 CREATE INDEX idx_students_ed_user_id ON students(ed_user_id);
+CREATE INDEX idx_ingestion_runs_started_at ON ingestion_runs(started_at);
+CREATE INDEX idx_jobs_queued_run_at ON jobs(run_at) WHERE status = 'queued';
+CREATE INDEX idx_jobs_running_locked_until ON jobs(locked_until) WHERE status = 'running';
+CREATE INDEX idx_jobs_finished_at ON jobs(finished_at) WHERE status IN ('done', 'failed');
+CREATE INDEX idx_failed_threads_next_retry_at ON failed_threads(next_retry_at) WHERE status = 'pending';
+CREATE INDEX idx_post_changes_post_id ON post_changes(post_id);
+CREATE INDEX idx_post_changes_position ON post_changes(txid, seq);
+CREATE INDEX idx_daily_student_posts_author_id ON daily_student_posts(author_id, day);
+
+-- Trigram index on lowercased titles, backs the participation title filter (prune)
+CREATE INDEX idx_posts_title_lower_trgm ON posts USING GIN (LOWER(title) gin_trgm_ops);
+
+-- Autocomplete: trigram index for fuzzy and infix matches, text_pattern_ops for
+-- prefixes shorter than a trigram
+CREATE INDEX idx_search_terms_term_trgm ON search_terms USING GIN (LOWER(term) gin_trgm_ops);
+CREATE INDEX idx_search_terms_term_prefix ON search_terms (LOWER(term) text_pattern_ops);
 
 -- Full-text search trigger function
 CREATE OR REPLACE FUNCTION update_search_vector() RETURNS TRIGGER AS $$
 BEGIN
+    -- Bulk imports compute search vectors set-based in the merge statement
+    IF current_setting('edthing.bulk_load', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+
     NEW.search_vector :=
         setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
         setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
@@ -99,14 +355,274 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- Trigger to update search vector
+-- Trigger to update search vector (only when the indexed text changes)
 CREATE TRIGGER trigger_update_search_vector
-    BEFORE INSERT OR UPDATE ON posts
+    BEFORE INSERT OR UPDATE OF title, content ON posts
     FOR EACH ROW EXECUTE FUNCTION update_search_vector();
 
+-- Facet count maintenance: adds delta to every facet value of one post
+CREATE OR REPLACE FUNCTION adjust_facet_counts(
+    p_tags TEXT[], p_topics TEXT[], p_homework_number INTEGER, p_author_id UUID, delta INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO facet_counts (facet, value, post_count)
+    SELECT DISTINCT f.facet, f.value, delta
+    FROM (
+        SELECT 'tag' AS facet, unnest(p_tags) AS value
+        UNION ALL
+        SELECT 'topic', unnest(p_topics)
+        UNION ALL
+        SELECT 'homework', p_homework_number::TEXT WHERE p_homework_number IS NOT NULL
+        UNION ALL
+        SELECT 'author', p_author_id::TEXT WHERE p_author_id IS NOT NULL
+    ) f
+    WHERE f.value IS NOT NULL
+    ON CONFLICT (facet, value) DO UPDATE SET
+        post_count = facet_counts.post_count + EXCLUDED.post_count,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only visible posts are counted, so hiding a post decrements its facets
+CREATE OR REPLACE FUNCTION update_facet_counts() RETURNS TRIGGER AS $$
+BEGIN
+    -- Bulk imports apply the staged posts' deltas in one statement instead
+    IF current_setting('edthing.bulk_load', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE'
+        AND (OLD.tags, OLD.topics, OLD.homework_number, OLD.author_id, COALESCE(OLD.is_hidden, FALSE))
+            IS NOT DISTINCT FROM
+            (NEW.tags, NEW.topics, NEW.homework_number, NEW.author_id, COALESCE(NEW.is_hidden, FALSE))
+    THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND NOT COALESCE(OLD.is_hidden, FALSE) THEN
+        PERFORM adjust_facet_counts(OLD.tags, OLD.topics, OLD.homework_number, OLD.author_id, -1);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NOT COALESCE(NEW.is_hidden, FALSE) THEN
+        PERFORM adjust_facet_counts(NEW.tags, NEW.topics, NEW.homework_number, NEW.author_id, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_update_facet_counts
+    AFTER INSERT OR DELETE OR UPDATE OF tags, topics, homework_number, author_id, is_hidden ON posts
+    FOR EACH ROW EXECUTE FUNCTION update_facet_counts();
+
+-- Autocomplete term maintenance. Titles rank above names, names above tags
+-- and topics, and homework labels last.
+CREATE OR REPLACE FUNCTION search_term_weight(p_kind TEXT) RETURNS REAL AS $$
+    SELECT CASE p_kind
+        WHEN 'title' THEN 1.0
+        WHEN 'author' THEN 0.9
+        WHEN 'tag' THEN 0.8
+        WHEN 'topic' THEN 0.8
+        ELSE 0.6
+    END::REAL;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- The distinct (kind, term) pairs one post contributes; hidden students contribute no name
+CREATE OR REPLACE FUNCTION post_search_terms(
+    p_title TEXT, p_tags TEXT[], p_topics TEXT[], p_homework_number INTEGER, p_author_id UUID
+) RETURNS TABLE (kind TEXT, term TEXT) AS $$
+    SELECT DISTINCT t.kind, btrim(t.term)
+    FROM (
+        SELECT 'title' AS kind, p_title AS term
+        UNION ALL
+        SELECT 'tag', unnest(p_tags)
+        UNION ALL
+        SELECT 'topic', unnest(p_topics)
+        UNION ALL
+        SELECT 'homework', 'HW ' || p_homework_number WHERE p_homework_number IS NOT NULL
+        UNION ALL
+        SELECT 'author', s.display_name FROM students s
+        WHERE s.id = p_author_id AND NOT COALESCE(s.is_hidden, FALSE)
+    ) t
+    WHERE btrim(t.term) <> '';
+$$ LANGUAGE sql STABLE;
+
+-- Adds delta to the post_count of each (kind, term) pair, dropping terms that reach zero
+CREATE OR REPLACE FUNCTION adjust_search_terms(p_kinds TEXT[], p_terms TEXT[], delta INTEGER) RETURNS VOID AS $$
+BEGIN
+    IF p_kinds IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO search_terms (kind, term, weight, post_count)
+    SELECT u.kind, u.term, search_term_weight(u.kind), delta
+    FROM unnest(p_kinds, p_terms) AS u(kind, term)
+    ORDER BY u.kind, u.term -- a fixed lock order across concurrent writers
+    ON CONFLICT (kind, term) DO UPDATE SET
+        post_count = search_terms.post_count + EXCLUDED.post_count,
+        updated_at = NOW();
+
+    IF delta < 0 THEN
+        DELETE FROM search_terms st
+        USING unnest(p_kinds, p_terms) AS u(kind, term)
+        WHERE st.kind = u.kind AND st.term = u.term AND st.post_count <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Like facet counts, only visible posts contribute terms
+CREATE OR REPLACE FUNCTION update_search_terms() RETURNS TRIGGER AS $$
+DECLARE
+    kinds TEXT[];
+    terms TEXT[];
+BEGIN
+    -- Bulk imports apply the staged posts' deltas in one statement instead
+    IF current_setting('edthing.bulk_load', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE'
+        AND (OLD.title, OLD.tags, OLD.topics, OLD.homework_number, OLD.author_id, COALESCE(OLD.is_hidden, FALSE))
+            IS NOT DISTINCT FROM
+            (NEW.title, NEW.tags, NEW.topics, NEW.homework_number, NEW.author_id, COALESCE(NEW.is_hidden, FALSE))
+    THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND NOT COALESCE(OLD.is_hidden, FALSE) THEN
+        SELECT array_agg(t.kind), array_agg(t.term) INTO kinds, terms
+        FROM post_search_terms(OLD.title, OLD.tags, OLD.topics, OLD.homework_number, OLD.author_id) t;
+        PERFORM adjust_search_terms(kinds, terms, -1);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NOT COALESCE(NEW.is_hidden, FALSE) THEN
+        SELECT array_agg(t.kind), array_agg(t.term) INTO kinds, terms
+        FROM post_search_terms(NEW.title, NEW.tags, NEW.topics, NEW.homework_number, NEW.author_id) t;
+        PERFORM adjust_search_terms(kinds, terms, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_update_search_terms
+    AFTER INSERT OR DELETE OR UPDATE OF title, tags, topics, homework_number, author_id, is_hidden ON posts
+    FOR EACH ROW EXECUTE FUNCTION update_search_terms();
+
+-- Renaming or hiding a student moves the name's count for all their visible posts
+CREATE OR REPLACE FUNCTION update_student_search_terms() RETURNS TRIGGER AS $$
+DECLARE
+    post_total INTEGER;
+BEGIN
+    IF current_setting('edthing.bulk_load', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF (btrim(OLD.display_name), COALESCE(OLD.is_hidden, FALSE))
+        IS NOT DISTINCT FROM (btrim(NEW.display_name), COALESCE(NEW.is_hidden, FALSE))
+    THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT COUNT(*) INTO post_total FROM posts WHERE author_id = NEW.id AND NOT COALESCE(is_hidden, FALSE);
+    IF post_total = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    IF NOT COALESCE(OLD.is_hidden, FALSE) AND btrim(OLD.display_name) <> '' THEN
+        PERFORM adjust_search_terms(ARRAY['author'], ARRAY[btrim(OLD.display_name)], -post_total);
+    END IF;
+    IF NOT COALESCE(NEW.is_hidden, FALSE) AND btrim(NEW.display_name) <> '' THEN
+        PERFORM adjust_search_terms(ARRAY['author'], ARRAY[btrim(NEW.display_name)], post_total);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_update_student_search_terms
+    AFTER UPDATE OF display_name, is_hidden ON students
+    FOR EACH ROW EXECUTE FUNCTION update_student_search_terms();
+
+-- Change feed: appends one post_changes row per change. An 'update' is
+-- dropped when the transaction already recorded a change of the same post,
+-- so a post written together with its attachments and links logs once.
+CREATE OR REPLACE FUNCTION append_post_change(
+    p_post_id UUID, p_ed_post_id BIGINT, p_posted_at TIMESTAMP WITH TIME ZONE, p_op TEXT
+) RETURNS VOID AS $$
+BEGIN
+    IF p_op = 'update' AND EXISTS (
+        SELECT 1 FROM post_changes WHERE post_id = p_post_id AND txid = pg_current_xact_id()
+    ) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO post_changes (post_id, ed_post_id, posted_at, op)
+    VALUES (p_post_id, p_ed_post_id, p_posted_at, p_op);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Derived columns (search_vector, content_html) are not changes
+CREATE OR REPLACE FUNCTION record_post_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM append_post_change(NEW.id, NEW.ed_post_id, NEW.posted_at, 'create');
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM append_post_change(OLD.id, OLD.ed_post_id, OLD.posted_at, 'delete');
+    ELSIF COALESCE(OLD.is_hidden, FALSE) <> COALESCE(NEW.is_hidden, FALSE) THEN
+        PERFORM append_post_change(NEW.id, NEW.ed_post_id, NEW.posted_at,
+                                   CASE WHEN NEW.is_hidden THEN 'hide' ELSE 'unhide' END);
+    ELSIF (OLD.ed_thread_id, OLD.title, OLD.content, OLD.author_id, OLD.updated_at, OLD.url,
+           OLD.category, OLD.tags, OLD.topics, OLD.homework_number)
+        IS DISTINCT FROM
+          (NEW.ed_thread_id, NEW.title, NEW.content, NEW.author_id, NEW.updated_at, NEW.url,
+           NEW.category, NEW.tags, NEW.topics, NEW.homework_number)
+    THEN
+        PERFORM append_post_change(NEW.id, NEW.ed_post_id, NEW.posted_at, 'update');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_record_post_change
+    AFTER INSERT OR DELETE OR UPDATE OF ed_thread_id, title, content, author_id, updated_at, url,
+        category, tags, topics, homework_number, is_hidden ON posts
+    FOR EACH ROW EXECUTE FUNCTION record_post_change();
+
+-- Attachment and link changes are updates of their post (skipped when the
+-- post itself is being deleted and they go with it)
+CREATE OR REPLACE FUNCTION record_post_child_change() RETURNS TRIGGER AS $$
+DECLARE
+    child RECORD;
+    parent_ed_post_id BIGINT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        child := OLD;
+    ELSE
+        child := NEW;
+    END IF;
+
+    SELECT ed_post_id INTO parent_ed_post_id
+    FROM posts WHERE id = child.post_id AND posted_at = child.post_posted_at;
+    IF FOUND THEN
+        PERFORM append_post_change(child.post_id, parent_ed_post_id, child.post_posted_at, 'update');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_record_attachment_change
+    AFTER INSERT OR UPDATE OR DELETE ON attachments
+    FOR EACH ROW EXECUTE FUNCTION record_post_child_change();
+
+CREATE TRIGGER trigger_record_link_change
+    AFTER INSERT OR UPDATE OR DELETE ON links
+    FOR EACH ROW EXECUTE FUNCTION record_post_child_change();
+
 -- Insert default site configuration
 INSERT INTO site_config (key, value) VALUES
 ('participation_rules', '{
+    "title_patterns": ["participation d"],
     "keywords": ["Muon", "MuP", "Shampoo", "uP", "participation"],
     "allowed_categories": ["Participation D"],
     "tag_mappings": {
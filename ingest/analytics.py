@@ -0,0 +1,274 @@
+"""
+Participation analytics rollups for the dashboard
+
+Maintains daily post counts per student, per tag and per homework, and
+time-to-first-submission per homework, so the dashboard reads a few hundred
+pre-aggregated rows instead of scanning posts.
+
+Each update only looks at the delta since the last one: the posts the
+change feed (ingest/changes.py, consumer 'analytics-rollups') reports as
+changed are diffed against analytics_rollup_state (what every post was last
+counted as), and the changed posts are aggregated with NumPy into signed
+per-key deltas (-1 for the old contribution, +1 for the new one) that are
+added onto the stored counts. First submissions are minimums rather than
+sums, so they are recomputed for the homeworks the delta touches. Updates
+take a transaction-level advisory lock, so concurrent runs apply one after
+the other. Only a full rebuild, or the first update before the consumer is
+registered, diffs every post.
+"""
+import logging
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from changes import ChangeFeed, PostChange
+
+logger = logging.getLogger(__name__)
+
+CHANGE_CONSUMER = 'analytics-rollups'
+
+ROLLUP_TABLES = ('daily_student_posts', 'daily_tag_posts', 'daily_homework_posts', 'homework_submission_stats')
+
+
+def aggregate(columns: Sequence[np.ndarray], weights: np.ndarray) -> List[Tuple]:
+    """
+    Sum `weights` per distinct key, a key being one value from each column.
+
+    Returns (key..., total) tuples; keys whose contributions cancel out are
+    dropped.
+    """
+    if not len(weights):
+        return []
+
+    uniques, codes = [], []
+    for column in columns:
+        values, inverse = np.unique(column, return_inverse=True)
+        uniques.append(values)
+        codes.append(inverse)
+    shape = tuple(len(values) for values in uniques)
+
+    keys, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+    totals = np.rint(np.bincount(inverse, weights=weights)).astype(np.int64)
+    nonzero = totals != 0
+    positions = np.unravel_index(keys[nonzero], shape)
+    return list(zip(
+        *(values[position].tolist() for values, position in zip(uniques, positions)),
+        totals[nonzero].tolist(),
+    ))
+
+
+def first_submission_stats(homework: np.ndarray, authors: np.ndarray,
+                           seconds: np.ndarray) -> Dict[int, Dict[str, Any]]:
+    """
+    Time-to-first-submission per homework.
+
+    `seconds` are posting times as Unix timestamps. A homework opens with its
+    first visible post; each student's first submission is measured in hours
+    from then.
+    """
+    if not len(homework):
+        return {}
+
+    order = np.lexsort((seconds, authors, homework))
+    homework, authors, seconds = homework[order], authors[order], seconds[order]
+
+    # First row of each (homework, author) run is that student's first submission
+    first = np.ones(len(homework), dtype=bool)
+    first[1:] = (homework[1:] != homework[:-1]) | (authors[1:] != authors[:-1])
+    homework, first_seconds = homework[first], seconds[first]
+
+    stats = {}
+    starts = np.flatnonzero(np.r_[True, homework[1:] != homework[:-1]])
+    for start, end in zip(starts, np.r_[starts[1:], len(homework)]):
+        firsts = first_seconds[start:end]
+        opened = firsts.min()
+        hours = (firsts - opened) / 3600.0
+        stats[int(homework[start])] = {
+            'students': int(end - start),
+            'opened_at': int(opened),
+            'last_first_submission_at': int(firsts.max()),
+            'median_hours': float(np.median(hours)),
+            'p90_hours': float(np.percentile(hours, 90)),
+        }
+    return stats
+
+
+class AnalyticsRollups:
+    """Maintains the daily participation rollup tables"""
+
+    def __init__(self, db, timezone: str = 'UTC'):
+        self.db = db
+        # Days are calendar days in the course's timezone
+        self.timezone = timezone
+
+    def update(self, full: bool = False) -> Dict[str, int]:
+        """Merge posts changed since the last update (or rebuild everything with full=True)"""
+        feed = ChangeFeed(self.db)
+        stats = {'changed': 0, 'homeworks': 0}
+
+        def add(result: Dict[str, int]):
+            for key, value in result.items():
+                stats[key] += value
+
+        if full or not feed.is_registered(CHANGE_CONSUMER):
+            # Registered first, so changes made during the diff are delivered afterwards
+            feed.register(CHANGE_CONSUMER)
+            add(self._apply(None, truncate=full))
+
+        def handle(changes: List[PostChange]):
+            add(self._apply(sorted({(change.post_id, change.posted_at) for change in changes})))
+
+        feed.consume(CHANGE_CONSUMER, handle)
+        return stats
+
+    def _apply(self, posts: Optional[List[Tuple[str, Any]]], truncate: bool = False) -> Dict[str, int]:
+        """
+        Diff posts against analytics_rollup_state and merge the difference.
+
+        `posts` are the (id, posted_at) keys to look at; None diffs every post.
+        Applying the same posts twice finds nothing the second time, so a
+        redelivered change-feed batch is harmless.
+        """
+        if posts is None:
+            visible_posts, state = "posts p", "analytics_rollup_state"
+            params = {'timezone': self.timezone}
+        else:
+            visible_posts = """posts p
+                JOIN unnest(%(ids)s::uuid[], %(posted_at)s::timestamptz[]) AS c(id, posted_at)
+                  ON p.id = c.id AND p.posted_at = c.posted_at"""
+            state = "(SELECT * FROM analytics_rollup_state WHERE post_id = ANY(%(ids)s::uuid[]))"
+            params = {'timezone': self.timezone, 'ids': [key[0] for key in posts],
+                      'posted_at': [key[1] for key in posts]}
+
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                # Concurrent updates would both read the same delta and count it twice
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('edthing.analytics_rollups'))")
+                if truncate:
+                    cursor.execute(f"TRUNCATE {', '.join(ROLLUP_TABLES)}, analytics_rollup_state")
+
+                cursor.execute(f"""
+                    WITH visible AS (
+                        SELECT p.id, (p.posted_at AT TIME ZONE %(timezone)s)::date AS day, p.author_id,
+                               p.homework_number, COALESCE(p.tags, '{{}}') AS tags
+                        FROM {visible_posts}
+                        WHERE p.is_hidden = false
+                    )
+                    SELECT COALESCE(v.id, s.post_id)::text,
+                           v.id IS NOT NULL, v.day, v.author_id::text, v.homework_number, v.tags,
+                           s.post_id IS NOT NULL, s.day, s.author_id::text, s.homework_number, s.tags
+                    FROM visible v
+                    FULL JOIN {state} s ON s.post_id = v.id
+                    WHERE v.id IS NULL OR s.post_id IS NULL
+                       OR v.day IS DISTINCT FROM s.day
+                       OR v.author_id IS DISTINCT FROM s.author_id
+                       OR v.homework_number IS DISTINCT FROM s.homework_number
+                       OR v.tags IS DISTINCT FROM s.tags
+                """, params)
+                delta = cursor.fetchall()
+
+                if not delta:
+                    if truncate:
+                        conn.commit()
+                    else:
+                        conn.rollback()
+                    return {'changed': 0, 'homeworks': 0}
+
+                homeworks = self._merge_counts(cursor, delta)
+                self._update_state(cursor, delta)
+                self._refresh_homeworks(cursor, homeworks)
+
+            conn.commit()
+            logger.info(f"Analytics rollups updated: {len(delta)} posts changed, {len(homeworks)} homeworks refreshed")
+            return {'changed': len(delta), 'homeworks': len(homeworks)}
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _merge_counts(self, cursor, delta: List[tuple]) -> List[int]:
+        """Add the delta's signed contributions to the daily counts; returns the homeworks touched"""
+        # Each changed post contributes its new state with +1 and its previously counted state with -1
+        sides = [
+            (day, author_id, homework, tags, sign)
+            for row in delta
+            for present, day, author_id, homework, tags, sign in (
+                (row[1], row[2], row[3], row[4], row[5], 1.0),
+                (row[6], row[7], row[8], row[9], row[10], -1.0),
+            )
+            if present
+        ]
+        days = np.array([side[0] for side in sides], dtype='datetime64[D]')
+        authors = np.array([side[1] or '' for side in sides], dtype=object)
+        homework = np.array([-1 if side[2] is None else side[2] for side in sides], dtype=np.int64)
+        signs = np.array([side[4] for side in sides], dtype=np.float64)
+
+        has_author = authors != ''
+        has_homework = homework >= 0
+        tag_counts = np.array([len(side[3] or ()) for side in sides], dtype=np.int64)
+        tags = np.array([tag for side in sides for tag in side[3] or ()], dtype=object)
+
+        self._add(cursor, 'daily_student_posts', 'author_id', aggregate(
+            (days[has_author], authors[has_author]), signs[has_author]))
+        self._add(cursor, 'daily_tag_posts', 'tag', aggregate(
+            (np.repeat(days, tag_counts), tags), np.repeat(signs, tag_counts)))
+        self._add(cursor, 'daily_homework_posts', 'homework_number', aggregate(
+            (days[has_homework], homework[has_homework]), signs[has_homework]))
+
+        return sorted(set(homework[has_homework].tolist()))
+
+    def _add(self, cursor, table: str, key: str, rows: List[Tuple]):
+        if not rows:
+            return
+        execute_values(cursor, f"""
+            INSERT INTO {table} AS r (day, {key}, post_count) VALUES %s
+            ON CONFLICT (day, {key}) DO UPDATE SET
+                post_count = r.post_count + EXCLUDED.post_count,
+                updated_at = NOW()
+        """, rows)
+        cursor.execute(
+            f"DELETE FROM {table} WHERE day = ANY(%s::date[]) AND post_count <= 0",
+            (sorted({row[0] for row in rows}),)
+        )
+
+    def _update_state(self, cursor, delta: List[tuple]):
+        """Record what each changed post is now counted as"""
+        cursor.execute(
+            "DELETE FROM analytics_rollup_state WHERE post_id = ANY(%s::uuid[])",
+            ([row[0] for row in delta],)
+        )
+        current = [(row[0], row[2], row[3], row[4], list(row[5])) for row in delta if row[1]]
+        if current:
+            execute_values(cursor, """
+                INSERT INTO analytics_rollup_state (post_id, day, author_id, homework_number, tags) VALUES %s
+            """, current, template="(%s::uuid, %s, %s::uuid, %s, %s::text[])")
+
+    def _refresh_homeworks(self, cursor, homeworks: List[int]):
+        """Recompute time-to-first-submission for the given homeworks"""
+        if not homeworks:
+            return
+
+        cursor.execute("""
+            SELECT homework_number, author_id::text, EXTRACT(EPOCH FROM posted_at)::bigint
+            FROM posts
+            WHERE is_hidden = false AND author_id IS NOT NULL AND homework_number = ANY(%s)
+        """, (homeworks,))
+        rows = cursor.fetchall()
+        stats = first_submission_stats(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=object),
+            np.array([row[2] for row in rows], dtype=np.int64),
+        )
+
+        cursor.execute("DELETE FROM homework_submission_stats WHERE homework_number = ANY(%s)", (homeworks,))
+        if stats:
+            execute_values(cursor, """
+                INSERT INTO homework_submission_stats (
+                    homework_number, students, opened_at, last_first_submission_at,
+                    median_hours_to_first_submission, p90_hours_to_first_submission
+                ) VALUES %s
+            """, [
+                (number, s['students'], s['opened_at'], s['last_first_submission_at'], s['median_hours'], s['p90_hours'])
+                for number, s in sorted(stats.items())
+            ], template="(%s, %s, to_timestamp(%s), to_timestamp(%s), %s, %s)")
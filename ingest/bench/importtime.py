@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Import-time report for the ingest CLI
+
+Runs `python -X importtime` on the CLI entry point in a fresh interpreter,
+prints the slowest imports and fails if startup pulls in modules that
+should only be loaded on demand or exceeds the time budget.
+
+Usage (from the ingest directory):
+    python bench/importtime.py [--budget-ms 300] [--top 15]
+"""
+import os
+import re
+import sys
+import subprocess
+from typing import List, Set, Tuple
+
+import click
+
+INGEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy modules that only specific commands need; importing the CLI must not load them
+LAZY_MODULES = ['bs4', 'requests', 'schedule', 'edapi', 'numpy', 'scipy', 'markdown_it']
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(statement: str) -> List[Tuple[str, int, int, int]]:
+    """Run a statement under -X importtime, returning (module, depth, self_us, cumulative_us)"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=INGEST_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f"`{statement}` failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            entries.append((match.group(4), depth, int(match.group(1)), int(match.group(2))))
+    return entries
+
+
+def statement_total(entries: List[Tuple[str, int, int, int]], baseline: Set[str]) -> int:
+    """Cumulative time of top-level imports caused by the statement, not interpreter startup"""
+    return sum(
+        cumulative for module, depth, _, cumulative in entries
+        if depth == 0 and module not in baseline
+    )
+
+
+@click.command()
+@click.option('--statement', default='import sync', show_default=True, help='Statement to time')
+@click.option('--budget-ms', default=300, show_default=True, help='Fail above this total import time')
+@click.option('--top', default=15, show_default=True, help='Number of slowest imports to show')
+def main(statement, budget_ms, top):
+    """Report import time of the ingest CLI and check it stays lazy"""
+    baseline = {module for module, _, _, _ in measure('pass')}
+    entries = [entry for entry in measure(statement) if entry[0] not in baseline]
+    total_ms = statement_total(entries, baseline) / 1000
+
+    click.echo(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module, _, self_us, cumulative_us in sorted(entries, key=lambda e: e[3], reverse=True)[:top]:
+        click.echo(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+    click.echo(f"\nTotal import time for `{statement}`: {total_ms:.1f} ms (budget {budget_ms} ms)")
+
+    imported = {module.split('.')[0] for module, _, _, _ in entries}
+    eager = [module for module in LAZY_MODULES if module in imported]
+    failures = []
+    if eager:
+        failures.append(f"modules imported eagerly: {', '.join(eager)}")
+    if total_ms > budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget of {budget_ms} ms")
+
+    if failures:
+        raise click.ClickException('; '.join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Memory and serialization cost of processed-post records
+
+Builds a synthetic corpus of processed posts twice, as the slotted records
+from records.py and as the nested dicts process_post used to return, and
+reports the memory each batch holds (tracemalloc) and the time to turn it
+into COPY staging rows, CSV rows and spool lines.
+
+Usage (from the ingest directory):
+    python bench/recordsize.py [--posts 100000] [--links 3] [--attachments 2]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Any, Tuple
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import Author, Attachment, Link, Post  # noqa: E402
+from pipeline import CsvSink  # noqa: E402
+
+TOPICS = ['Muon', 'MuP', 'Shampoo', 'SOAP', 'AdamW', 'Lion']
+
+
+def synthetic_posts(count: int, links: int, attachments: int, seed: int = 7) -> List[Post]:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 6, tzinfo=timezone.utc)
+    posts = []
+    for i in range(count):
+        homework = rng.randint(1, 12)
+        posted_at = start + timedelta(minutes=rng.randint(0, 60 * 24 * 120))
+        posts.append(Post(
+            ed_post_id=1_000_000 + i,
+            ed_thread_id=1_000_000 + i,
+            title=f"Special Participation D: HW{homework} notes {i}",
+            content=f"Post {i} about {rng.choice(TOPICS)}. " * rng.randint(5, 40),
+            posted_at=posted_at,
+            updated_at=posted_at + timedelta(hours=rng.randint(0, 48)),
+            url=f"https://edstem.org/us/courses/1/discussion/{1_000_000 + i}",
+            category='Participation D',
+            tags=rng.sample(TOPICS, 2),
+            topics=rng.sample(TOPICS, 1),
+            homework_number=homework,
+            attachments=[
+                Attachment(filename=f"notes-{i}-{j}.pdf", file_type='application/pdf', file_size=rng.randint(1, 10**6),
+                           ed_attachment_id=f"att-{i}-{j}", download_url=f"https://static.edusercontent.com/{i}/{j}",
+                           is_pdf=True)
+                for j in range(attachments)
+            ],
+            links=[
+                Link(url=f"https://github.com/student{i}/repo{j}", link_type='github', domain='github.com')
+                for j in range(links)
+            ],
+            author=Author(ed_user_id=rng.randint(1, 5000), display_name=f"Student {i % 5000}",
+                          email=f"s{i % 5000}@example.edu"),
+        ))
+    return posts
+
+
+def legacy_csv_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    """CSV row as CsvSink built it from the nested dicts"""
+    posted_at = record.get('posted_at')
+    homework_number = record.get('homework_number')
+    return {
+        'id': record['ed_post_id'],
+        'title': record.get('title', ''),
+        'author': (record.get('author_info') or {}).get('display_name', 'Unknown'),
+        'content': record.get('content', ''),
+        'posted_at': posted_at.isoformat() if isinstance(posted_at, datetime) else (posted_at or ''),
+        'url': record.get('url', ''),
+        'links': '; '.join(link['url'] for link in record.get('links', [])),
+        'attachments': '; '.join(att['filename'] for att in record.get('attachments', []) if att.get('filename')),
+        'homework': homework_number if homework_number is not None else '',
+        'topics': '; '.join(record.get('topics', [])),
+        'content_html': record.get('content_html') or '',
+    }
+
+
+def legacy_staging_rows(record: Dict[str, Any]) -> Tuple[tuple, List[tuple], List[tuple]]:
+    """Staging rows as bulk_upsert_posts built them from the nested dicts"""
+    author_info = record.get('author_info') or {}
+    post_row = (
+        record['ed_post_id'], record.get('ed_thread_id'), record['title'], record.get('content'),
+        author_info.get('ed_user_id'), record['posted_at'], record.get('updated_at'), record.get('url'),
+        record.get('category'), record.get('tags', []), record.get('topics', []), record.get('homework_number')
+    )
+    attachment_rows = [
+        (record['ed_post_id'], att['filename'], att.get('file_type'), att.get('file_size'),
+         str(att['ed_attachment_id']) if att.get('ed_attachment_id') is not None else None,
+         att.get('download_url'), att.get('preview_url'), att.get('is_image', False), att.get('is_pdf', False))
+        for att in record.get('attachments') or []
+    ]
+    link_rows = [
+        (record['ed_post_id'], link['url'], link.get('title'), link.get('link_type'), link.get('domain'))
+        for link in record.get('links') or []
+    ]
+    return post_row, attachment_rows, link_rows
+
+
+def records_staging_rows(record: Post) -> Tuple[tuple, List[tuple], List[tuple]]:
+    return (
+        record.staging_row(),
+        [(record.ed_post_id,) + attachment.db_row() for attachment in record.attachments],
+        [(record.ed_post_id,) + link.db_row() for link in record.links],
+    )
+
+
+def held_bytes(build: Callable[[], List[Any]]) -> Tuple[List[Any], int]:
+    """Build a batch and return it with the bytes it still holds"""
+    gc.collect()
+    tracemalloc.start()
+    batch = build()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return batch, held
+
+
+def seconds(work: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    work()
+    return time.perf_counter() - started
+
+
+@click.command()
+@click.option('--posts', default=100000, show_default=True, help='Synthetic posts per batch')
+@click.option('--links', default=3, show_default=True, help='Links per post')
+@click.option('--attachments', default=2, show_default=True, help='Attachments per post')
+def main(posts, links, attachments):
+    """Compare slotted records with the nested dicts they replaced"""
+    source = synthetic_posts(posts, links, attachments)
+    # Strings are shared between both batches, so only the containers are compared
+    records, records_bytes = held_bytes(lambda: [Post.from_spool(post.to_spool()) for post in source])
+    dicts, dicts_bytes = held_bytes(lambda: [post.to_dict() for post in source])
+    del source
+
+    click.echo(f"{posts} posts, {links} links and {attachments} attachments each")
+    click.echo(f"{'':24}{'dicts':>12}{'records':>12}")
+    click.echo(f"{'held memory (MiB)':24}{dicts_bytes / 2**20:>12.1f}{records_bytes / 2**20:>12.1f}")
+    click.echo(f"{'bytes per post':24}{dicts_bytes / posts:>12.0f}{records_bytes / posts:>12.0f}")
+
+    timings = [
+        ('COPY staging rows (s)',
+         lambda: [legacy_staging_rows(record) for record in dicts],
+         lambda: [records_staging_rows(record) for record in records]),
+        ('CSV rows (s)',
+         lambda: [legacy_csv_row(record) for record in dicts],
+         lambda: [record.csv_row() for record in records]),
+        ('spool lines (s)',
+         lambda: [json.dumps(record, default=str) for record in dicts],
+         lambda: [json.dumps(record.to_spool()) for record in records]),
+    ]
+    for label, legacy, typed in timings:
+        click.echo(f"{label:24}{seconds(legacy):>12.3f}{seconds(typed):>12.3f}")
+
+    assert [list(row.values()) for row in map(legacy_csv_row, dicts[:100])] == \
+        [list(row) for row in (record.csv_row() for record in records[:100])], 'CSV rows differ'
+    assert CsvSink.FIELDNAMES == list(legacy_csv_row(dicts[0]))
+    saved = 1 - records_bytes / dicts_bytes
+    click.echo(f"\nRecords hold {saved:.0%} less memory than dicts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Consumer API for the post change feed
+
+Every create, update, hide, unhide and delete of a post (attachments and
+links included) is appended to post_changes by trigger, in the transaction
+that made it, with its sequence number and transaction id. Derived
+artifacts (exports, caches, search indexes) keep their own offset in
+change_consumers and only look at what changed since:
+
+    feed = ChangeFeed(db)
+    feed.register('csv-export')          # starts at the latest change
+    feed.consume('csv-export', handler)  # handler(changes) per batch, then the offset advances
+
+A handler that raises leaves the offset where it was, so the batch is
+delivered again. Changes name the post; consumers re-read its current row
+(or drop it on 'delete').
+
+Writers do not serialize on the feed, so seq order is not commit order: a
+transaction that drew seq 10 may commit after one that drew seq 11. Offsets
+are therefore (txid, seq) positions, and reads stop below the oldest
+transaction still running (pg_snapshot_xmin), since every later commit has
+a txid at or above it. A long transaction such as a bulk load holds the
+feed back until it commits; writers themselves never wait.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# txid of the change with a given seq; a seq no longer retained maps to the start of the feed
+SEQ_TXID = "COALESCE((SELECT txid FROM post_changes WHERE seq = %s), '0'::xid8)"
+
+
+class PostChange(NamedTuple):
+    seq: int
+    post_id: str
+    ed_post_id: int
+    posted_at: datetime
+    op: str
+    changed_at: datetime
+    txid: int
+
+
+class ChangeFeed:
+    """Reads post_changes and tracks per-consumer offsets"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def register(self, consumer: str, from_seq: Optional[int] = None) -> int:
+        """
+        Create a consumer's offset if it does not exist yet; returns its offset.
+
+        A new consumer starts at the oldest running transaction (it builds its
+        artifact from scratch first, so changes from transactions still in
+        flight are delivered, possibly again), or after `from_seq`.
+        """
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                if from_seq is None:
+                    cursor.execute("""
+                        INSERT INTO change_consumers (name, last_txid, last_seq)
+                        VALUES (%s, pg_snapshot_xmin(pg_current_snapshot()), 0)
+                        ON CONFLICT (name) DO NOTHING
+                    """, (consumer,))
+                else:
+                    cursor.execute(f"""
+                        INSERT INTO change_consumers (name, last_txid, last_seq)
+                        VALUES (%s, {SEQ_TXID}, %s)
+                        ON CONFLICT (name) DO NOTHING
+                    """, (consumer, from_seq, from_seq))
+                cursor.execute("SELECT last_seq FROM change_consumers WHERE name = %s", (consumer,))
+                offset = cursor.fetchone()[0]
+            conn.commit()
+            return offset
+        except Exception as e:
+            logger.error(f"Failed to register change consumer {consumer}: {e}")
+            conn.rollback()
+            raise
+
+    def is_registered(self, consumer: str) -> bool:
+        """Whether the consumer has an offset yet"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM change_consumers WHERE name = %s", (consumer,))
+                registered = cursor.fetchone() is not None
+            conn.commit()
+            return registered
+        except Exception:
+            conn.rollback()
+            raise
+
+    def read(self, consumer: str, limit: int = DEFAULT_BATCH_SIZE) -> List[PostChange]:
+        """The next `limit` changes after the consumer's offset, without advancing it"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT last_seq FROM change_consumers WHERE name = %s", (consumer,))
+                row = cursor.fetchone()
+                if row is None:
+                    raise ValueError(f"Unknown change consumer {consumer}; register it first")
+                # Transactions below the snapshot's xmin are all finished, so no
+                # change can still appear before the last one read
+                cursor.execute("""
+                    SELECT p.seq, p.post_id::text, p.ed_post_id, p.posted_at, p.op, p.changed_at,
+                           p.txid::text::bigint
+                    FROM change_consumers c
+                    JOIN post_changes p ON (p.txid, p.seq) > (c.last_txid, c.last_seq)
+                    WHERE c.name = %s AND p.txid < pg_snapshot_xmin(pg_current_snapshot())
+                    ORDER BY p.txid, p.seq
+                    LIMIT %s
+                """, (consumer, limit))
+                changes = [PostChange(*change) for change in cursor.fetchall()]
+            conn.commit()
+            return changes
+        except Exception:
+            conn.rollback()
+            raise
+
+    def ack(self, consumer: str, change: PostChange):
+        """Record that the consumer has processed every change up to and including `change`"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE change_consumers SET last_txid = %s::text::xid8, last_seq = %s, updated_at = NOW()
+                    WHERE name = %s AND (last_txid, last_seq) < (%s::text::xid8, %s)
+                """, (change.txid, change.seq, consumer, change.txid, change.seq))
+                if cursor.rowcount != 1:
+                    cursor.execute("SELECT 1 FROM change_consumers WHERE name = %s", (consumer,))
+                    if cursor.fetchone() is None:
+                        raise ValueError(f"Unknown change consumer {consumer}; register it first")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def consume(self, consumer: str, handler: Callable[[List[PostChange]], None],
+                batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+        """Feed pending changes to `handler` batch by batch, acknowledging each; returns the number handled"""
+        handled = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            changes = self.read(consumer, batch_size)
+            if not changes:
+                break
+            handler(changes)
+            self.ack(consumer, changes[-1])
+            handled += len(changes)
+            batches += 1
+        if handled:
+            logger.info(f"Change consumer {consumer} processed {handled} changes")
+        return handled
+
+    def seek(self, consumer: str, seq: int):
+        """
+        Move a consumer's offset to just after the change `seq`, backwards
+        included (e.g. to replay after a rebuild). A seq that is no longer
+        retained, such as 0, replays the whole retained feed.
+        """
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO change_consumers (name, last_txid, last_seq) VALUES (%s, {SEQ_TXID}, %s)
+                    ON CONFLICT (name) DO UPDATE SET
+                        last_txid = EXCLUDED.last_txid, last_seq = EXCLUDED.last_seq, updated_at = NOW()
+                """, (consumer, seq, seq))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def offsets(self) -> Dict[str, Dict[str, int]]:
+        """Offset and number of pending changes per consumer"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT c.name, c.last_seq, COUNT(p.seq)
+                    FROM change_consumers c
+                    LEFT JOIN post_changes p ON (p.txid, p.seq) > (c.last_txid, c.last_seq)
+                    GROUP BY c.name, c.last_seq
+                    ORDER BY c.name
+                """)
+                offsets = {name: {'offset': last_seq, 'pending': pending}
+                           for name, last_seq, pending in cursor.fetchall()}
+            conn.commit()
+            return offsets
+        except Exception:
+            conn.rollback()
+            raise
+
+    def prune(self, keep_days: int) -> int:
+        """Delete changes older than keep_days that every consumer has already processed"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM post_changes p
+                    WHERE p.changed_at < NOW() - make_interval(days => %s)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM change_consumers c
+                          WHERE (p.txid, p.seq) > (c.last_txid, c.last_seq)
+                      )
+                """, (keep_days,))
+                deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to prune post changes: {e}")
+            conn.rollback()
+            raise
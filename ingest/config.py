@@ -2,12 +2,24 @@
 Configuration management for EdThing ingestion service
 """
 import os
-import json
+import copy
 import logging
-from typing import Dict, List, Any
+from typing import Dict, Any
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PARTICIPATION_RULES = {
+    "title_patterns": ["participation d"],
+    "keywords": ["Muon", "MuP", "Shampoo", "uP", "participation"],
+    "allowed_categories": ["Participation D"],
+    "tag_mappings": {
+        "Muon": ["Muon", "MUON"],
+        "MuP": ["MuP", "MUP", "μP"],
+        "Shampoo": ["Shampoo", "SHAMPOO"],
+        "uP": ["uP", "UP", "μP"]
+    }
+}
+
 class Config:
     def __init__(self):
         # Database
@@ -19,12 +31,34 @@ class Config:
 
         # Ingestion settings
         self.sync_interval_minutes = int(os.getenv('SYNC_INTERVAL_MINUTES', '60'))
+        # Local durable spool that fetched posts are written to before Postgres
+        self.spool_dir = os.getenv('SPOOL_DIR', '/app/spool')
+        # Ingestion run history kept by the retention job
+        self.ingestion_runs_retention_days = int(os.getenv('INGESTION_RUNS_RETENTION_DAYS', '90'))
+        # Markdown/KaTeX pre-rendering (0 workers means one per CPU)
+        self.render_workers = int(os.getenv('RENDER_WORKERS', '0'))
+        self.katex_command = os.getenv('KATEX_COMMAND', 'node')
+        # Calendar days of the analytics rollups (changing it needs `python -m sync rollups --full`)
+        self.analytics_timezone = os.getenv('ANALYTICS_TIMEZONE', 'UTC')
+        # Per-run profiling artifacts (cProfile, tracemalloc, slowest threads); PROFILE=1 profiles every run
+        self.profile_dir = os.getenv('PROFILE_DIR', '/app/profiles')
+        self.profile = os.getenv('PROFILE', '').lower() in ('1', 'true', 'yes')
+        # Where queue workers copy post attachments (unset: attachments are not downloaded)
+        self.attachments_dir = os.getenv('ATTACHMENTS_DIR')
+        # Push-triggered sync endpoint of the continuous worker (port 0 disables it)
+        self.sync_secret = os.getenv('SYNC_SECRET')
+        self.trigger_host = os.getenv('TRIGGER_HOST', '127.0.0.1')
+        self.trigger_port = int(os.getenv('TRIGGER_PORT', '8765'))
+        self.trigger_debounce_seconds = float(os.getenv('TRIGGER_DEBOUNCE_SECONDS', '5'))
+        self.trigger_max_wait_seconds = float(os.getenv('TRIGGER_MAX_WAIT_SECONDS', '30'))
 
-        # Validate required config
-        self._validate()
+    def validate(self):
+        """
+        Validate configuration required to talk to Ed.
 
-    def _validate(self):
-        """Validate required configuration"""
+        Deferred until a command actually fetches from Ed, so --help and
+        database-only commands work without credentials.
+        """
         required = ['ed_api_token', 'ed_course_id']
         missing = [key for key in required if not getattr(self, key)]
 
@@ -41,32 +75,14 @@ class Config:
                     return result[0]
                 else:
                     # Return default rules
-                    return {
-                        "keywords": ["Muon", "MuP", "Shampoo", "uP", "participation"],
-                        "allowed_categories": ["Participation D"],
-                        "tag_mappings": {
-                            "Muon": ["Muon", "MUON"],
-                            "MuP": ["MuP", "MUP", "μP"],
-                            "Shampoo": ["Shampoo", "SHAMPOO"],
-                            "uP": ["uP", "UP", "μP"]
-                        }
-                    }
+                    return self._get_default_participation_rules()
         except Exception as e:
             logger.warning(f"Failed to load participation rules from DB: {e}")
             return self._get_default_participation_rules()
 
     def _get_default_participation_rules(self) -> Dict[str, Any]:
         """Default participation rules"""
-        return {
-            "keywords": ["Muon", "MuP", "Shampoo", "uP", "participation"],
-            "allowed_categories": ["Participation D"],
-            "tag_mappings": {
-                "Muon": ["Muon", "MUON"],
-                "MuP": ["MuP", "MUP", "μP"],
-                "Shampoo": ["Shampoo", "SHAMPOO"],
-                "uP": ["uP", "UP", "μP"]
-            }
-        }
+        return copy.deepcopy(DEFAULT_PARTICIPATION_RULES)
 
 # Global config instance
 config = Config()
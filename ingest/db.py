@@ -2,18 +2,70 @@
 Database operations for EdThing ingestion
 """
 import psycopg2
-from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extras import RealDictCursor, Json, execute_values, execute_batch
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
+import io
 import uuid
 
+from partitions import ensure_partitions
+from records import Post
+from jobs import BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS, DEFAULT_MAX_ATTEMPTS
+
 logger = logging.getLogger(__name__)
 
+ATTACHMENT_COLUMNS = (
+    'filename', 'file_type', 'file_size', 'ed_attachment_id',
+    'download_url', 'preview_url', 'is_image', 'is_pdf'
+)
+LINK_COLUMNS = ('url', 'title', 'link_type', 'domain')
+STAGING_TABLES = (
+    'staging_students', 'staging_posts', 'staging_attachments', 'staging_links',
+    'staging_facet_deltas', 'staging_term_deltas'
+)
+
+# Facet values the visible rows of {posts} contribute to facet_counts
+FACET_VALUES_SQL = """
+    SELECT 'tag' AS facet, unnest(tags) AS value FROM {posts} WHERE NOT COALESCE(is_hidden, FALSE)
+    UNION ALL
+    SELECT 'topic', unnest(topics) FROM {posts} WHERE NOT COALESCE(is_hidden, FALSE)
+    UNION ALL
+    SELECT 'homework', homework_number::TEXT FROM {posts}
+    WHERE NOT COALESCE(is_hidden, FALSE) AND homework_number IS NOT NULL
+    UNION ALL
+    SELECT 'author', author_id::TEXT FROM {posts}
+    WHERE NOT COALESCE(is_hidden, FALSE) AND author_id IS NOT NULL
+"""
+
+
+def _copy_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_value(value: Any) -> str:
+    """Render a value as a COPY text-format field"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        elements = (
+            'NULL' if element is None
+            else '"' + str(element).replace('\\', '\\\\').replace('"', '\\"') + '"'
+            for element in value
+        )
+        return _copy_escape('{' + ','.join(elements) + '}')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return _copy_escape(str(value))
+
 class Database:
     def __init__(self, connection_string: str):
         self.connection_string = connection_string
         self._connection = None
+        # Terms whose partitions are known to exist
+        self._known_terms = set()
 
     def connect(self):
         """Get database connection"""
@@ -21,6 +73,23 @@ class Database:
             self._connection = psycopg2.connect(self.connection_string)
         return self._connection
 
+    def is_available(self) -> bool:
+        """Check that the database is reachable, reconnecting if needed"""
+        try:
+            conn = self.connect()
+            conn.rollback()
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Database unavailable: {e}")
+            self.close()
+            return False
+
+    def ensure_partitions(self, timestamps) -> List[str]:
+        """Create term partitions for these posted_at values if needed"""
+        return ensure_partitions(self.connect(), timestamps, self._known_terms)
+
     def close(self):
         """Close database connection"""
         if self._connection:
@@ -45,16 +114,16 @@ class Database:
             logger.error(f"Failed to get last ingestion time: {e}")
             return None
 
-    def start_ingestion_run(self) -> str:
-        """Start a new ingestion run and return its ID"""
+    def start_ingestion_run(self, run_id: Optional[str] = None, started_at: Optional[datetime] = None) -> str:
+        """Start a new ingestion run and return its ID; `started_at` backdates a run recorded after the fact"""
         conn = self.connect()
-        run_id = str(uuid.uuid4())
+        run_id = run_id or str(uuid.uuid4())
         try:
             with conn.cursor() as cursor:
                 cursor.execute("""
-                    INSERT INTO ingestion_runs (id, status)
-                    VALUES (%s, 'running')
-                """, (run_id,))
+                    INSERT INTO ingestion_runs (id, started_at, status)
+                    VALUES (%s, COALESCE(%s, NOW()), 'running')
+                """, (run_id, started_at))
             conn.commit()
             return run_id
         except Exception as e:
@@ -88,6 +157,39 @@ class Database:
             logger.error(f"Failed to complete ingestion run: {e}")
             conn.rollback()
 
+    def record_run_profile(self, run_id: str, profile_dir: str, summary: Dict[str, Any]):
+        """Attach a profiled run's artifact directory and summary to its ingestion_runs row"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE ingestion_runs SET profile_dir = %s, profile_summary = %s WHERE id = %s
+                """, (profile_dir, Json(summary), run_id))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to record profile of ingestion run {run_id}: {e}")
+            conn.rollback()
+
+    def prune_ingestion_runs(self, keep_days: int, keep_latest: int = 20) -> int:
+        """Delete ingestion runs older than keep_days, always keeping the newest keep_latest"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM ingestion_runs
+                    WHERE started_at < NOW() - make_interval(days => %s)
+                      AND id NOT IN (
+                          SELECT id FROM ingestion_runs ORDER BY started_at DESC LIMIT %s
+                      )
+                """, (keep_days, keep_latest))
+                deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to prune ingestion runs: {e}")
+            conn.rollback()
+            raise
+
     def upsert_student(self, ed_user_id: int, display_name: str, email: str = None) -> str:
         """Upsert a student and return their ID"""
         conn = self.connect()
@@ -100,9 +202,15 @@ class Database:
                         display_name = EXCLUDED.display_name,
                         email = EXCLUDED.email,
                         updated_at = NOW()
+                    WHERE (students.display_name, students.email)
+                        IS DISTINCT FROM (EXCLUDED.display_name, EXCLUDED.email)
                     RETURNING id
                 """, (ed_user_id, display_name, email))
                 result = cursor.fetchone()
+                if not result:
+                    # Unchanged row: the guarded DO UPDATE returns nothing
+                    cursor.execute("SELECT id FROM students WHERE ed_user_id = %s", (ed_user_id,))
+                    result = cursor.fetchone()
                 conn.commit()
                 return str(result[0]) if result else None
         except Exception as e:
@@ -110,119 +218,687 @@ class Database:
             conn.rollback()
             return None
 
-    def upsert_post(self, post_data: Dict[str, Any]) -> bool:
-        """Upsert a post"""
+    def upsert_post(self, post: Post, author_id: Optional[str] = None) -> Optional[str]:
+        """
+        Upsert a post and sync its attachments and links.
+
+        `author_id` is the students.id of the post's author.
+
+        Returns 'created', 'updated' or 'unchanged', or None on failure.
+        Unchanged posts are not rewritten, so the search vector trigger
+        only runs when a post actually changes.
+        """
         conn = self.connect()
         try:
+            self.ensure_partitions([post.posted_at])
             with conn.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO posts (
                         ed_post_id, ed_thread_id, title, content, author_id,
-                        posted_at, updated_at, url, category, tags
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (ed_post_id) DO UPDATE SET
+                        posted_at, updated_at, url, category, tags,
+                        topics, homework_number
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (ed_post_id, posted_at) DO UPDATE SET
                         title = EXCLUDED.title,
                         content = EXCLUDED.content,
                         updated_at = EXCLUDED.updated_at,
                         url = EXCLUDED.url,
                         category = EXCLUDED.category,
-                        tags = EXCLUDED.tags
-                    RETURNING id
+                        tags = EXCLUDED.tags,
+                        topics = EXCLUDED.topics,
+                        homework_number = EXCLUDED.homework_number
+                    WHERE (posts.title, posts.content, posts.updated_at, posts.url,
+                           posts.category, posts.tags, posts.topics, posts.homework_number)
+                        IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.content, EXCLUDED.updated_at, EXCLUDED.url,
+                                          EXCLUDED.category, EXCLUDED.tags, EXCLUDED.topics,
+                                          EXCLUDED.homework_number)
+                    RETURNING id, posted_at, (xmax = 0) AS inserted
                 """, (
-                    post_data['ed_post_id'],
-                    post_data.get('ed_thread_id'),
-                    post_data['title'],
-                    post_data.get('content'),
-                    post_data.get('author_id'),
-                    post_data['posted_at'],
-                    post_data.get('updated_at'),
-                    post_data.get('url'),
-                    post_data.get('category'),
-                    post_data.get('tags', [])
+                    post.ed_post_id,
+                    post.ed_thread_id,
+                    post.title,
+                    post.content,
+                    author_id,
+                    post.posted_at,
+                    post.updated_at,
+                    post.url,
+                    post.category,
+                    post.tags,
+                    post.topics,
+                    post.homework_number
                 ))
                 result = cursor.fetchone()
-                post_id = str(result[0]) if result else None
+                if result:
+                    status = 'created' if result[2] else 'updated'
+                else:
+                    cursor.execute(
+                        "SELECT id, posted_at FROM posts WHERE ed_post_id = %s AND posted_at = %s",
+                        (post.ed_post_id, post.posted_at)
+                    )
+                    result = cursor.fetchone()
+                    status = 'unchanged'
+                post_id, posted_at = str(result[0]), result[1]
+
+                # Child rows are diffed even for unchanged posts, since link
+                # titles and attachment metadata can change independently
+                child_changes = self._sync_child_rows(
+                    cursor, 'attachments', post_id, posted_at, ATTACHMENT_COLUMNS, (3, 0),
+                    [attachment.db_row() for attachment in post.attachments]
+                ) + self._sync_child_rows(
+                    cursor, 'links', post_id, posted_at, LINK_COLUMNS, (0,),
+                    [link.db_row() for link in post.links]
+                )
 
-                if post_id:
-                    # Handle attachments
-                    if post_data.get('attachments'):
-                        self._upsert_attachments(post_id, post_data['attachments'])
+                if status == 'unchanged' and child_changes:
+                    status = 'updated'
 
-                    # Handle links
-                    if post_data.get('links'):
-                        self._upsert_links(post_id, post_data['links'])
+                # Stored now, so an earlier dead letter of this thread is resolved
+                cursor.execute("DELETE FROM failed_threads WHERE thread_id = %s", (post.ed_post_id,))
 
                 conn.commit()
-                return True
+                return status
         except Exception as e:
-            logger.error(f"Failed to upsert post {post_data.get('ed_post_id')}: {e}")
+            logger.error(f"Failed to upsert post {post.ed_post_id}: {e}")
             conn.rollback()
-            return False
+            # Callers only see None; keep the error class for the retry pass
+            self.record_failed_threads([(post.ed_post_id, 'store', e)])
+            return None
 
-    def _upsert_attachments(self, post_id: str, attachments: List[Dict[str, Any]]):
-        """Upsert attachments for a post"""
-        if not attachments:
-            return
+    def _sync_child_rows(self, cursor, table: str, post_id: str, posted_at: datetime,
+                         columns: Tuple[str, ...], key_indexes: Tuple[int, ...], rows: List[tuple]) -> int:
+        """
+        Bring a post's child rows in line with `rows` by set difference.
+
+        Rows are identified by the values at `key_indexes`; only stale keys are
+        deleted, new keys inserted and rows whose other values differ updated.
+        Every statement is keyed by the post's posted_at so it touches only the
+        post's term partition.
+        """
+        cursor.execute(
+            f"SELECT id, {', '.join(columns)} FROM {table} WHERE post_id = %s AND post_posted_at = %s",
+            (post_id, posted_at)
+        )
+        existing = {}
+        for row in cursor.fetchall():
+            values = tuple(row[1:])
+            existing[tuple(values[i] for i in key_indexes)] = (row[0], values)
+
+        # Later duplicates win, matching what a unique constraint would keep
+        desired = {tuple(values[i] for i in key_indexes): values for values in rows}
+
+        stale_ids = [existing[key][0] for key in existing.keys() - desired.keys()]
+        added = [(post_id, posted_at) + desired[key] for key in desired.keys() - existing.keys()]
+        changed = [
+            desired[key] + (existing[key][0], posted_at)
+            for key in desired.keys() & existing.keys()
+            if existing[key][1] != desired[key]
+        ]
+
+        if stale_ids:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id = ANY(%s::uuid[]) AND post_posted_at = %s",
+                (stale_ids, posted_at)
+            )
+
+        if added:
+            execute_values(cursor, f"""
+                INSERT INTO {table} (post_id, post_posted_at, {', '.join(columns)}) VALUES %s
+            """, added)
+
+        if changed:
+            assignments = ', '.join(f"{column} = %s" for column in columns)
+            execute_batch(cursor, f"UPDATE {table} SET {assignments} WHERE id = %s AND post_posted_at = %s", changed)
+
+        return len(stale_ids) + len(added) + len(changed)
+
+    def bulk_upsert_posts(self, posts: List[Post]) -> Dict[str, int]:
+        """
+        Bulk-load processed posts with their authors, attachments and links.
+
+        Rows are streamed with COPY into the unlogged staging tables and merged
+        into the real tables with one set-based statement per table, all in one
+        transaction. Search vectors are computed in bulk rather than by the
+        per-row triggers, and facet counts and search terms are adjusted by the
+        staged posts' before/after contributions, so a batch costs the same
+        however large the table already is. Returns created/updated/unchanged
+        counts with the same meaning as upsert_post; raises on failure.
+        """
+        students, post_rows, attachment_rows, link_rows = [], [], [], []
+        for post in posts:
+            if post.author:
+                students.append((post.author.ed_user_id, post.author.display_name, post.author.email))
+            post_rows.append(post.staging_row())
+            attachment_rows.extend((post.ed_post_id,) + attachment.db_row() for attachment in post.attachments)
+            link_rows.extend((post.ed_post_id,) + link.db_row() for link in post.links)
 
         conn = self.connect()
         try:
+            self.ensure_partitions(post.posted_at for post in posts)
             with conn.cursor() as cursor:
-                # Delete existing attachments for this post
-                cursor.execute("DELETE FROM attachments WHERE post_id = %s", (post_id,))
+                # One bulk load at a time owns the staging tables
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('edthing.bulk_load'))")
+                cursor.execute("SET LOCAL edthing.bulk_load = 'on'")
+                cursor.execute(f"TRUNCATE {', '.join(STAGING_TABLES)} RESTART IDENTITY")
+
+                self._copy_rows(cursor, 'staging_students', ('ed_user_id', 'display_name', 'email'), students)
+                self._copy_rows(cursor, 'staging_posts', (
+                    'ed_post_id', 'ed_thread_id', 'title', 'content', 'author_ed_user_id', 'posted_at',
+                    'updated_at', 'url', 'category', 'tags', 'topics', 'homework_number'
+                ), post_rows)
+                self._copy_rows(cursor, 'staging_attachments', ('ed_post_id',) + ATTACHMENT_COLUMNS, attachment_rows)
+                self._copy_rows(cursor, 'staging_links', ('ed_post_id',) + LINK_COLUMNS, link_rows)
+
+                renamed = self._renamed_students(cursor)
+                self._stage_derived_deltas(cursor, renamed, -1)
+
+                cursor.execute("""
+                    INSERT INTO students (ed_user_id, display_name, email)
+                    SELECT DISTINCT ON (ed_user_id) ed_user_id, display_name, email
+                    FROM staging_students
+                    ORDER BY ed_user_id, seq DESC
+                    ON CONFLICT (ed_user_id) DO UPDATE SET
+                        display_name = EXCLUDED.display_name,
+                        email = EXCLUDED.email,
+                        updated_at = NOW()
+                    WHERE (students.display_name, students.email)
+                        IS DISTINCT FROM (EXCLUDED.display_name, EXCLUDED.email)
+                """)
+
+                cursor.execute("""
+                    INSERT INTO posts (
+                        ed_post_id, ed_thread_id, title, content, author_id,
+                        posted_at, updated_at, url, category, tags,
+                        topics, homework_number, search_vector
+                    )
+                    SELECT DISTINCT ON (s.ed_post_id)
+                        s.ed_post_id, s.ed_thread_id, s.title, s.content, st.id,
+                        s.posted_at, s.updated_at, s.url, s.category, s.tags,
+                        s.topics, s.homework_number,
+                        setweight(to_tsvector('english', coalesce(s.title, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(s.content, '')), 'B')
+                    FROM staging_posts s
+                    LEFT JOIN students st ON st.ed_user_id = s.author_ed_user_id
+                    ORDER BY s.ed_post_id, s.seq DESC
+                    ON CONFLICT (ed_post_id, posted_at) DO UPDATE SET
+                        title = EXCLUDED.title,
+                        content = EXCLUDED.content,
+                        updated_at = EXCLUDED.updated_at,
+                        url = EXCLUDED.url,
+                        category = EXCLUDED.category,
+                        tags = EXCLUDED.tags,
+                        topics = EXCLUDED.topics,
+                        homework_number = EXCLUDED.homework_number,
+                        search_vector = EXCLUDED.search_vector
+                    WHERE (posts.title, posts.content, posts.updated_at, posts.url,
+                           posts.category, posts.tags, posts.topics, posts.homework_number)
+                        IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.content, EXCLUDED.updated_at, EXCLUDED.url,
+                                          EXCLUDED.category, EXCLUDED.tags, EXCLUDED.topics,
+                                          EXCLUDED.homework_number)
+                    RETURNING id, (xmax = 0) AS inserted
+                """)
+                created, updated = set(), set()
+                for post_id, inserted in cursor.fetchall():
+                    (created if inserted else updated).add(post_id)
+
+                child_changed = self._merge_staged_children(
+                    cursor, 'attachments', 'staging_attachments', ATTACHMENT_COLUMNS, ('ed_attachment_id', 'filename')
+                ) | self._merge_staged_children(cursor, 'links', 'staging_links', LINK_COLUMNS, ('url',))
+
+                self._stage_derived_deltas(cursor, renamed, 1)
+                self._apply_derived_deltas(cursor)
 
-                # Insert new attachments
-                values = []
-                for att in attachments:
-                    values.append((
-                        post_id,
-                        att['filename'],
-                        att.get('file_type'),
-                        att.get('file_size'),
-                        att.get('ed_attachment_id'),
-                        att.get('download_url'),
-                        att.get('preview_url'),
-                        att.get('is_image', False),
-                        att.get('is_pdf', False)
-                    ))
+                cursor.execute("SELECT COUNT(DISTINCT ed_post_id) FROM staging_posts")
+                staged = cursor.fetchone()[0]
+                cursor.execute("""
+                    DELETE FROM failed_threads f USING staging_posts s WHERE f.thread_id = s.ed_post_id
+                """)
+                # Leave the staging tables empty rather than holding a copy of the batch
+                cursor.execute(f"TRUNCATE {', '.join(STAGING_TABLES)}")
+            conn.commit()
 
-                execute_values(cursor, """
-                    INSERT INTO attachments (
-                        post_id, filename, file_type, file_size, ed_attachment_id,
-                        download_url, preview_url, is_image, is_pdf
-                    ) VALUES %s
-                """, values)
+            updated |= child_changed - created
+            return {
+                'created': len(created),
+                'updated': len(updated),
+                'unchanged': staged - len(created) - len(updated),
+            }
         except Exception as e:
-            logger.error(f"Failed to upsert attachments for post {post_id}: {e}")
+            logger.error(f"Bulk load of {len(posts)} posts failed: {e}")
+            conn.rollback()
+            raise
 
-    def _upsert_links(self, post_id: str, links: List[Dict[str, Any]]):
-        """Upsert links for a post"""
-        if not links:
+    def _copy_rows(self, cursor, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+        """Stream rows into a table with COPY FROM STDIN (text format)"""
+        if not rows:
             return
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+    def _renamed_students(self, cursor) -> List[str]:
+        """IDs of existing students whose staged display name differs from the stored one"""
+        cursor.execute("""
+            SELECT st.id::text
+            FROM students st
+            JOIN (
+                SELECT DISTINCT ON (ed_user_id) ed_user_id, display_name
+                FROM staging_students
+                ORDER BY ed_user_id, seq DESC
+            ) s ON s.ed_user_id = st.ed_user_id
+            WHERE btrim(st.display_name) IS DISTINCT FROM btrim(s.display_name)
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+    def _stage_derived_deltas(self, cursor, renamed: List[str], sign: int):
+        """
+        Record `sign` times the facet values and search terms of the posts a
+        bulk load can change: the staged posts, and every post of a renamed
+        student (their author term moves). Called with -1 before the merge and
+        +1 after it.
+        """
+        affected = """
+            WITH affected AS MATERIALIZED (
+                SELECT p.title, p.tags, p.topics, p.homework_number, p.author_id, p.is_hidden
+                FROM posts p
+                JOIN (SELECT DISTINCT ed_post_id, posted_at FROM staging_posts) s
+                  ON s.ed_post_id = p.ed_post_id AND s.posted_at = p.posted_at
+                UNION ALL
+                SELECT p.title, p.tags, p.topics, p.homework_number, p.author_id, p.is_hidden
+                FROM posts p
+                WHERE p.author_id = ANY(%(renamed)s::uuid[])
+                  AND NOT EXISTS (
+                      SELECT 1 FROM staging_posts s
+                      WHERE s.ed_post_id = p.ed_post_id AND s.posted_at = p.posted_at
+                  )
+            )
+        """
+        params = {'renamed': renamed, 'sign': sign}
+        cursor.execute(f"""
+            {affected}
+            INSERT INTO staging_facet_deltas (facet, value, delta)
+            SELECT facet, value, %(sign)s * COUNT(*)
+            FROM ({FACET_VALUES_SQL.format(posts='affected')}) f
+            GROUP BY facet, value
+        """, params)
+        cursor.execute(f"""
+            {affected}
+            INSERT INTO staging_term_deltas (kind, term, delta)
+            SELECT t.kind, t.term, %(sign)s * COUNT(*)
+            FROM affected p
+            CROSS JOIN LATERAL post_search_terms(p.title, p.tags, p.topics, p.homework_number, p.author_id) t
+            WHERE NOT COALESCE(p.is_hidden, FALSE)
+            GROUP BY t.kind, t.term
+        """, params)
+
+    def _apply_derived_deltas(self, cursor):
+        """Add the staged deltas to facet_counts and search_terms, dropping values no post carries any more"""
+        cursor.execute("""
+            INSERT INTO facet_counts AS f (facet, value, post_count)
+            SELECT facet, value, SUM(delta) FROM staging_facet_deltas
+            GROUP BY facet, value
+            HAVING SUM(delta) <> 0
+            ORDER BY facet, value
+            ON CONFLICT (facet, value) DO UPDATE SET
+                post_count = f.post_count + EXCLUDED.post_count,
+                updated_at = NOW()
+        """)
+        cursor.execute("""
+            DELETE FROM facet_counts f USING staging_facet_deltas d
+            WHERE f.facet = d.facet AND f.value = d.value AND f.post_count <= 0
+        """)
+        cursor.execute("""
+            INSERT INTO search_terms AS st (kind, term, weight, post_count)
+            SELECT kind, term, search_term_weight(kind), SUM(delta) FROM staging_term_deltas
+            GROUP BY kind, term
+            HAVING SUM(delta) <> 0
+            ORDER BY kind, term
+            ON CONFLICT (kind, term) DO UPDATE SET
+                post_count = st.post_count + EXCLUDED.post_count,
+                updated_at = NOW()
+        """)
+        cursor.execute("""
+            DELETE FROM search_terms st USING staging_term_deltas d
+            WHERE st.kind = d.kind AND st.term = d.term AND st.post_count <= 0
+        """)
 
+    def _merge_staged_children(self, cursor, table: str, staging_table: str,
+                               columns: Tuple[str, ...], key_columns: Tuple[str, ...]) -> set:
+        """
+        Set-based counterpart of _sync_child_rows for every staged post at once.
+
+        Returns the IDs of posts whose child rows changed.
+        """
+        value_columns = [column for column in columns if column not in key_columns]
+        key_match = ' AND '.join(f"c.{column} IS NOT DISTINCT FROM s.{column}" for column in key_columns)
+        # Staged (ed_post_id, posted_at) keys let every posts lookup prune to one partition
+        cursor.execute(f"""
+            WITH staged_posts AS MATERIALIZED (
+                SELECT DISTINCT ON (ed_post_id) ed_post_id, posted_at
+                FROM staging_posts
+                ORDER BY ed_post_id, seq DESC
+            ), staged AS (
+                SELECT DISTINCT ON (s.ed_post_id, {', '.join(f's.{column}' for column in key_columns)})
+                    p.id AS post_id, p.posted_at AS post_posted_at, {', '.join(f's.{column}' for column in columns)}
+                FROM {staging_table} s
+                JOIN staged_posts sp ON sp.ed_post_id = s.ed_post_id
+                JOIN posts p ON p.ed_post_id = sp.ed_post_id AND p.posted_at = sp.posted_at
+                ORDER BY s.ed_post_id, {', '.join(f's.{column}' for column in key_columns)}, s.seq DESC
+            ), deleted AS (
+                DELETE FROM {table} c
+                USING staged_posts sp, posts p
+                WHERE p.ed_post_id = sp.ed_post_id AND p.posted_at = sp.posted_at
+                  AND c.post_id = p.id AND c.post_posted_at = p.posted_at
+                  AND NOT EXISTS (SELECT 1 FROM staged s WHERE s.post_id = c.post_id AND {key_match})
+                RETURNING c.post_id
+            ), updated AS (
+                UPDATE {table} c SET {', '.join(f"{column} = s.{column}" for column in value_columns)}
+                FROM staged s
+                WHERE s.post_id = c.post_id AND s.post_posted_at = c.post_posted_at AND {key_match}
+                  AND ({', '.join(f'c.{column}' for column in value_columns)})
+                      IS DISTINCT FROM ({', '.join(f's.{column}' for column in value_columns)})
+                RETURNING c.post_id
+            ), inserted AS (
+                INSERT INTO {table} (post_id, post_posted_at, {', '.join(columns)})
+                SELECT s.post_id, s.post_posted_at, {', '.join(f's.{column}' for column in columns)}
+                FROM staged s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} c
+                    WHERE c.post_id = s.post_id AND c.post_posted_at = s.post_posted_at AND {key_match}
+                )
+                ON CONFLICT DO NOTHING
+                RETURNING post_id
+            )
+            SELECT post_id FROM deleted
+            UNION SELECT post_id FROM updated
+            UNION SELECT post_id FROM inserted
+        """)
+        return {row[0] for row in cursor.fetchall()}
+
+    def backfill_facets(self, extract) -> int:
+        """
+        Fill topics/homework_number for posts ingested before facet extraction.
+
+        `extract` maps (title, content) to (topics, homework_number).
+        """
         conn = self.connect()
         try:
             with conn.cursor() as cursor:
-                # Delete existing links for this post
-                cursor.execute("DELETE FROM links WHERE post_id = %s", (post_id,))
+                cursor.execute("SELECT id, title, content FROM posts WHERE topics IS NULL")
+                values = [(str(row[0]),) + tuple(extract(row[1], row[2])) for row in cursor.fetchall()]
+                if values:
+                    execute_batch(cursor, """
+                        UPDATE posts SET topics = %s, homework_number = %s WHERE id = %s
+                    """, [(topics, homework_number, post_id) for post_id, topics, homework_number in values])
+            conn.commit()
+            return len(values)
+        except Exception as e:
+            logger.error(f"Failed to backfill facets: {e}")
+            conn.rollback()
+            raise
 
-                # Insert new links
-                values = []
-                for link in links:
-                    values.append((
-                        post_id,
-                        link['url'],
-                        link.get('title'),
-                        link.get('link_type'),
-                        link.get('domain')
-                    ))
+    def rebuild_facet_counts(self) -> int:
+        """Recompute facet_counts from scratch, returning the number of facet values"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                count = self._rebuild_facet_counts(cursor)
+            conn.commit()
+            return count
+        except Exception as e:
+            logger.error(f"Failed to rebuild facet counts: {e}")
+            conn.rollback()
+            raise
+
+    def _rebuild_facet_counts(self, cursor) -> int:
+        cursor.execute("LOCK TABLE facet_counts IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM facet_counts")
+        cursor.execute(f"""
+            INSERT INTO facet_counts (facet, value, post_count)
+            SELECT facet, value, COUNT(*)
+            FROM ({FACET_VALUES_SQL.format(posts='posts')}) f
+            GROUP BY facet, value
+        """)
+        return cursor.rowcount
+
+    def rebuild_search_terms(self) -> int:
+        """Recompute search_terms from scratch, returning the number of terms"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                count = self._rebuild_search_terms(cursor)
+            conn.commit()
+            return count
+        except Exception as e:
+            logger.error(f"Failed to rebuild search terms: {e}")
+            conn.rollback()
+            raise
+
+    def _rebuild_search_terms(self, cursor) -> int:
+        cursor.execute("LOCK TABLE search_terms IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM search_terms")
+        cursor.execute("""
+            INSERT INTO search_terms (kind, term, weight, post_count)
+            SELECT t.kind, t.term, search_term_weight(t.kind), COUNT(*)
+            FROM posts p
+            CROSS JOIN LATERAL post_search_terms(p.title, p.tags, p.topics, p.homework_number, p.author_id) t
+            WHERE NOT COALESCE(p.is_hidden, FALSE)
+            GROUP BY t.kind, t.term
+        """)
+        return cursor.rowcount
+
+    def suggest_search_terms(self, query: str, limit: int = 10,
+                             kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Autocomplete suggestions for a partial query.
+
+        Terms starting with the query come first; other terms match by trigram
+        word similarity, so typos still find them. Ties go to the kind's weight
+        and then to the terms on more posts.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        prefix = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conn = self.connect()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT kind, term, post_count,
+                           LOWER(term) LIKE %(prefix)s AS is_prefix,
+                           word_similarity(%(query)s, LOWER(term)) AS similarity
+                    FROM search_terms
+                    WHERE (LOWER(term) LIKE %(prefix)s OR %(query)s <%% LOWER(term))
+                      AND (%(kinds)s::text[] IS NULL OR kind = ANY(%(kinds)s::text[]))
+                    ORDER BY is_prefix DESC, weight * word_similarity(%(query)s, LOWER(term)) DESC,
+                             post_count DESC, term
+                    LIMIT %(limit)s
+                """, {'query': query, 'prefix': prefix, 'kinds': kinds, 'limit': limit})
+                suggestions = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
+            return suggestions
+        except Exception as e:
+            logger.error(f"Failed to suggest search terms for {query!r}: {e}")
+            conn.rollback()
+            raise
 
-                execute_values(cursor, """
-                    INSERT INTO links (
-                        post_id, url, title, link_type, domain
-                    ) VALUES %s
-                """, values)
+    def get_site_config(self, key: str) -> Optional[Any]:
+        """Get a site_config value by key"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT value FROM site_config WHERE key = %s", (key,))
+                result = cursor.fetchone()
+                return result[0] if result else None
+        except Exception as e:
+            logger.error(f"Failed to get site config {key}: {e}")
+            conn.rollback()
+            return None
+
+    def get_post_versions(self) -> Dict[int, datetime]:
+        """Get the stored Ed updated_at of every post, keyed by Ed post ID"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT ed_post_id, updated_at FROM posts WHERE updated_at IS NOT NULL")
+                return {row[0]: row[1] for row in cursor.fetchall()}
         except Exception as e:
-            logger.error(f"Failed to upsert links for post {post_id}: {e}")
+            logger.error(f"Failed to get post versions: {e}")
+            conn.rollback()
+            return {}
+
+    def get_link_titles(self, ed_post_id: int) -> Dict[str, str]:
+        """Stored link titles of a post, keyed by URL"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT l.url, l.title FROM links l
+                    JOIN posts p ON p.id = l.post_id AND p.posted_at = l.post_posted_at
+                    WHERE p.ed_post_id = %s AND l.title IS NOT NULL
+                """, (ed_post_id,))
+                return {row[0]: row[1] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Failed to get link titles for post {ed_post_id}: {e}")
+            conn.rollback()
+            raise
+
+    def update_link_titles(self, ed_post_id: int, posted_at: datetime, titles: Dict[str, str]) -> int:
+        """Set titles of a post's links by URL, returning the number of links changed"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id FROM posts WHERE ed_post_id = %s AND posted_at = %s", (ed_post_id, posted_at)
+                )
+                row = cursor.fetchone()
+                updated = 0
+                if row:
+                    for url, title in titles.items():
+                        cursor.execute("""
+                            UPDATE links SET title = %s
+                            WHERE post_id = %s AND post_posted_at = %s AND url = %s
+                              AND title IS DISTINCT FROM %s
+                        """, (title, row[0], posted_at, url, title))
+                        updated += cursor.rowcount
+            conn.commit()
+            return updated
+        except Exception as e:
+            logger.error(f"Failed to update link titles for post {ed_post_id}: {e}")
+            conn.rollback()
+            raise
+
+    def record_failed_threads(self, failures: List[Tuple[int, str, BaseException]],
+                              max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """
+        Dead-letter threads that failed to fetch, process or store.
+
+        `failures` are (Ed thread ID, stage, exception). Each further failure
+        of a thread doubles its retry delay like a job's backoff; after
+        max_attempts it is marked dead and only retried on request.
+        """
+        rows = [
+            (thread_id, stage, type(error).__name__, str(error)[:2000])
+            for thread_id, stage, error in failures if thread_id is not None
+        ]
+        if not rows:
+            return 0
+
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO failed_threads AS f (thread_id, stage, error_class, error, next_retry_at)
+                    SELECT DISTINCT ON (thread_id) thread_id, stage, error_class, error,
+                           NOW() + make_interval(secs => %(base)s)
+                    FROM unnest(%(thread_ids)s::bigint[], %(stages)s::text[], %(classes)s::text[], %(errors)s::text[])
+                        AS v(thread_id, stage, error_class, error)
+                    ON CONFLICT (thread_id) DO UPDATE SET
+                        stage = EXCLUDED.stage,
+                        error_class = EXCLUDED.error_class,
+                        error = EXCLUDED.error,
+                        attempts = f.attempts + 1,
+                        status = CASE WHEN f.attempts + 1 >= %(max_attempts)s THEN 'dead' ELSE 'pending' END,
+                        next_retry_at = CASE WHEN f.attempts + 1 >= %(max_attempts)s THEN NULL
+                            ELSE NOW() + make_interval(secs => LEAST(%(base)s * power(2, f.attempts), %(cap)s)) END,
+                        last_failed_at = NOW()
+                """, {
+                    'thread_ids': [row[0] for row in rows],
+                    'stages': [row[1] for row in rows],
+                    'classes': [row[2] for row in rows],
+                    'errors': [row[3] for row in rows],
+                    'base': BACKOFF_BASE_SECONDS,
+                    'cap': BACKOFF_MAX_SECONDS,
+                    'max_attempts': max_attempts,
+                })
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Failed to record failed threads: {e}")
+            conn.rollback()
+            return 0
+
+    def get_due_failed_threads(self, limit: int = 100, include_dead: bool = False) -> Dict[int, datetime]:
+        """Dead-lettered threads whose retry is due (or every one with include_dead=True), with when they last failed"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                if include_dead:
+                    cursor.execute("""
+                        SELECT thread_id, last_failed_at FROM failed_threads ORDER BY last_failed_at LIMIT %s
+                    """, (limit,))
+                else:
+                    cursor.execute("""
+                        SELECT thread_id, last_failed_at FROM failed_threads
+                        WHERE status = 'pending' AND next_retry_at <= NOW()
+                        ORDER BY next_retry_at
+                        LIMIT %s
+                    """, (limit,))
+                due = {row[0]: row[1] for row in cursor.fetchall()}
+            conn.commit()
+            return due
+        except Exception as e:
+            logger.error(f"Failed to get failed threads: {e}")
+            conn.rollback()
+            raise
+
+    def clear_failed_threads(self, last_failures: Dict[int, datetime]) -> int:
+        """Drop dead letters of threads that have not failed again since the given last failures"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM failed_threads f
+                    USING unnest(%s::bigint[], %s::timestamptz[]) AS v(thread_id, last_failed_at)
+                    WHERE f.thread_id = v.thread_id AND f.last_failed_at = v.last_failed_at
+                """, (list(last_failures), list(last_failures.values())))
+                cleared = cursor.rowcount
+            conn.commit()
+            return cleared
+        except Exception as e:
+            logger.error(f"Failed to clear failed threads: {e}")
+            conn.rollback()
+            raise
+
+    def list_failed_threads(self) -> List[Dict[str, Any]]:
+        """Every dead-lettered thread, most recently failed first"""
+        conn = self.connect()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT thread_id, stage, error_class, error, attempts, status, next_retry_at, last_failed_at
+                    FROM failed_threads
+                    ORDER BY last_failed_at DESC
+                """)
+                rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except Exception as e:
+            logger.error(f"Failed to list failed threads: {e}")
+            conn.rollback()
+            raise
 
     def get_hidden_posts(self) -> set:
         """Get set of hidden post IDs"""
@@ -0,0 +1,293 @@
+"""
+Postgres-backed job queue shared by ingest workers
+
+Units of work (fetch a page of threads, process a thread, enrich links,
+download an attachment, ...) are rows in the jobs table. Workers on any
+number of nodes claim them with SELECT ... FOR UPDATE SKIP LOCKED, so no two
+workers ever take the same job, and hold each claimed job under a lease:
+
+- a claimed job stays invisible until its lease (locked_until) expires; a
+  worker that dies simply lets the lease run out and the job is claimed again
+- a failed job is retried with exponential backoff until max_attempts, then
+  marked failed with its last error
+- dedupe_key makes enqueueing idempotent: a second job with the same key is
+  dropped, so retried parents and concurrent schedulers cannot fan out twice
+
+Completion and failure are only recorded by the worker that still holds the
+lease, so a slow worker cannot overwrite the outcome of a job it lost. While
+a handler runs, the worker renews its lease every third of the lease period
+from a separate connection, so long jobs are not claimed a second time.
+"""
+import os
+import time
+import json
+import socket
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Callable, Iterable, NamedTuple, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+# Retry delay is BACKOFF_BASE_SECONDS * 2^(attempt - 1), capped at BACKOFF_MAX_SECONDS
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+
+class Job(NamedTuple):
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def backoff_seconds(attempts: int) -> int:
+    """Delay before retrying a job that has failed `attempts` times"""
+    return min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+
+
+class JobQueue:
+    """Enqueue, claim, complete and fail jobs in the jobs table"""
+
+    def __init__(self, db, worker_id: Optional[str] = None, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        self.db = db
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+
+    def enqueue(self, kind: str, payload: Optional[Dict[str, Any]] = None, dedupe_key: Optional[str] = None,
+                run_at: Optional[datetime] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """Add one job; returns 1, or 0 if a job with the same dedupe_key already exists"""
+        return self.enqueue_many([(kind, payload or {}, dedupe_key)], run_at=run_at, max_attempts=max_attempts)
+
+    def enqueue_many(self, jobs: Iterable[Tuple[str, Dict[str, Any], Optional[str]]],
+                     run_at: Optional[datetime] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """Add (kind, payload, dedupe_key) jobs in one statement, skipping duplicate keys"""
+        rows = [(kind, json.dumps(payload, default=str), dedupe_key, run_at, max_attempts)
+                for kind, payload, dedupe_key in jobs]
+        if not rows:
+            return 0
+
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                inserted = execute_values(cursor, """
+                    INSERT INTO jobs (kind, payload, dedupe_key, run_at, max_attempts)
+                    SELECT kind, payload::jsonb, dedupe_key, COALESCE(run_at::timestamptz, NOW()), max_attempts
+                    FROM (VALUES %s) AS v(kind, payload, dedupe_key, run_at, max_attempts)
+                    ON CONFLICT (dedupe_key) DO NOTHING
+                    RETURNING id
+                """, rows, fetch=True)
+            conn.commit()
+            return len(inserted)
+        except Exception as e:
+            logger.error(f"Failed to enqueue jobs: {e}")
+            conn.rollback()
+            raise
+
+    def claim(self, kinds: Optional[List[str]] = None, limit: int = 1) -> List[Job]:
+        """
+        Lease up to `limit` visible jobs to this worker.
+
+        Visible means queued and due, or running with an expired lease (its
+        worker died or stalled). Jobs whose lease expired on their last
+        attempt are marked failed instead of being handed out again.
+        """
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE jobs
+                    SET status = 'failed', locked_by = NULL, locked_until = NULL, finished_at = NOW(),
+                        last_error = COALESCE(last_error, 'Lease expired')
+                    WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+                """)
+                cursor.execute("""
+                    WITH next AS (
+                        SELECT id FROM jobs
+                        WHERE (%s::text[] IS NULL OR kind = ANY(%s::text[]))
+                          AND ((status = 'queued' AND run_at <= NOW())
+                               OR (status = 'running' AND locked_until < NOW()))
+                        ORDER BY run_at, id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE jobs j
+                    SET status = 'running', attempts = j.attempts + 1, locked_by = %s,
+                        locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+                    FROM next
+                    WHERE j.id = next.id
+                    RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts
+                """, (kinds, kinds, limit, self.worker_id, self.lease_seconds))
+                jobs = [Job(*row) for row in cursor.fetchall()]
+            conn.commit()
+            return sorted(jobs, key=lambda job: job.id)
+        except Exception as e:
+            logger.error(f"Failed to claim jobs: {e}")
+            conn.rollback()
+            raise
+
+    def detached(self) -> 'JobQueue':
+        """This worker's queue on a connection of its own, for use from another thread"""
+        from db import Database
+        return JobQueue(Database(self.db.connection_string), worker_id=self.worker_id,
+                        lease_seconds=self.lease_seconds)
+
+    def extend_lease(self, job: Job) -> bool:
+        """Push back a long-running job's lease; False if the lease was already lost"""
+        return self._update_held(job, """
+            UPDATE jobs SET locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+            WHERE id = %s AND locked_by = %s AND status = 'running'
+        """, (self.lease_seconds, job.id, self.worker_id))
+
+    def complete(self, job: Job) -> bool:
+        return self._update_held(job, """
+            UPDATE jobs
+            SET status = 'done', locked_by = NULL, locked_until = NULL, finished_at = NOW(), updated_at = NOW()
+            WHERE id = %s AND locked_by = %s AND status = 'running'
+        """, (job.id, self.worker_id))
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Schedule a retry with backoff, or mark the job failed after its last attempt"""
+        if job.attempts >= job.max_attempts:
+            return self._update_held(job, """
+                UPDATE jobs
+                SET status = 'failed', last_error = %s, locked_by = NULL, locked_until = NULL,
+                    finished_at = NOW(), updated_at = NOW()
+                WHERE id = %s AND locked_by = %s AND status = 'running'
+            """, (error, job.id, self.worker_id))
+
+        return self._update_held(job, """
+            UPDATE jobs
+            SET status = 'queued', last_error = %s, locked_by = NULL, locked_until = NULL,
+                run_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+            WHERE id = %s AND locked_by = %s AND status = 'running'
+        """, (error, backoff_seconds(job.attempts), job.id, self.worker_id))
+
+    def _update_held(self, job: Job, sql: str, params: tuple) -> bool:
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                held = cursor.rowcount == 1
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to update job {job.id}: {e}")
+            conn.rollback()
+            raise
+        if not held:
+            logger.warning(f"Lost the lease on job {job.id} ({job.kind}); another worker owns it now")
+        return held
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Number of jobs per kind and status"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status ORDER BY kind, status")
+                counts: Dict[str, Dict[str, int]] = {}
+                for kind, status, count in cursor.fetchall():
+                    counts.setdefault(kind, {})[status] = count
+            conn.commit()
+            return counts
+        except Exception as e:
+            logger.error(f"Failed to count jobs: {e}")
+            conn.rollback()
+            raise
+
+    def prune(self, keep_days: int) -> int:
+        """Delete finished (done or failed) jobs older than keep_days"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM jobs
+                    WHERE status IN ('done', 'failed') AND finished_at < NOW() - make_interval(days => %s)
+                """, (keep_days,))
+                deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to prune jobs: {e}")
+            conn.rollback()
+            raise
+
+
+class JobWorker:
+    """Claims jobs and runs them through per-kind handlers until stopped"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[Job], None]],
+                 batch_size: int = 1, poll_seconds: float = 5.0, on_poll: Optional[Callable[[], None]] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.on_poll = on_poll
+        self.stats = {'done': 0, 'retried': 0, 'failed': 0}
+        # Renews leases while handlers run; handlers own the main connection
+        self._heartbeat_queue: Optional[JobQueue] = None
+
+    def run_once(self) -> int:
+        """Claim and run one batch; returns the number of jobs claimed"""
+        jobs = self.queue.claim(list(self.handlers), limit=self.batch_size)
+        for job in jobs:
+            self._run_job(job)
+        return len(jobs)
+
+    def run(self, stop: Optional[threading.Event] = None, max_jobs: Optional[int] = None):
+        """Work until `stop` is set (or max_jobs have been claimed), sleeping when the queue is empty"""
+        stop = stop or threading.Event()
+        claimed = 0
+        while not stop.is_set() and (max_jobs is None or claimed < max_jobs):
+            if self.on_poll:
+                self.on_poll()
+            count = self.run_once()
+            claimed += count
+            if not count:
+                stop.wait(self.poll_seconds)
+
+    def close(self):
+        if self._heartbeat_queue:
+            self._heartbeat_queue.db.close()
+
+    def _heartbeat(self, job: Job, done: threading.Event):
+        """Extend the job's lease until `done` is set or the lease is lost"""
+        interval = max(self.queue.lease_seconds / 3.0, 1.0)
+        while not done.wait(interval):
+            try:
+                if not self._heartbeat_queue.extend_lease(job):
+                    return
+            except Exception as e:
+                logger.error(f"Failed to extend the lease on job {job.id} ({job.kind}): {e}")
+
+    def _run_job(self, job: Job):
+        started = time.monotonic()
+        if self._heartbeat_queue is None:
+            self._heartbeat_queue = self.queue.detached()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), name=f"lease-{job.id}", daemon=True)
+        heartbeat.start()
+        try:
+            self.handlers[job.kind](job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            final = job.attempts >= job.max_attempts
+            self.stats['failed' if final else 'retried'] += 1
+            logger.error(f"Job {job.id} ({job.kind}) attempt {job.attempts}/{job.max_attempts} failed: {error}")
+            self.queue.fail(job, error)
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+
+        self.queue.complete(job)
+        self.stats['done'] += 1
+        logger.info(f"Job {job.id} ({job.kind}) done in {time.monotonic() - started:.2f}s")
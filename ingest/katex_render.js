@@ -0,0 +1,26 @@
+// KaTeX bridge for render.py: reads one JSON request per line from stdin,
+// {"tex": "...", "display": false}, and answers each with one JSON line,
+// {"html": "..."} or {"error": "..."}. Exits when stdin closes.
+const readline = require('readline');
+const katex = require('katex');
+
+const lines = readline.createInterface({ input: process.stdin, terminal: false });
+
+lines.on('line', (line) => {
+  let reply;
+  try {
+    const request = JSON.parse(line);
+    reply = {
+      html: katex.renderToString(request.tex, {
+        displayMode: Boolean(request.display),
+        throwOnError: false,
+        output: 'htmlAndMathml',
+      }),
+    };
+  } catch (err) {
+    reply = { error: String(err && err.message ? err.message : err) };
+  }
+  process.stdout.write(JSON.stringify(reply) + '\n');
+});
+
+lines.on('close', () => process.exit(0));
@@ -0,0 +1,191 @@
+"""
+Per-term partitions of posts, attachments and links
+
+posts is range-partitioned by posted_at and its child tables by the copied
+post_posted_at, one partition per term (spring, summer, fall). There is no
+default partition: the ingest creates a term's partitions the first time it
+sees a post from that term. Finished terms can be detached and moved to the
+`archive` schema (or dropped), which keeps the hot-path indexes small.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Iterable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# (month, day, name) of each term's first day; a term runs until the next one starts
+TERM_STARTS = ((1, 1, 'spring'), (6, 1, 'summer'), (8, 15, 'fall'))
+
+# Tables partitioned by term and their partition key, children before parents
+PARTITIONED_TABLES = (('links', 'post_posted_at'), ('attachments', 'post_posted_at'), ('posts', 'posted_at'))
+
+ARCHIVE_SCHEMA = 'archive'
+
+
+class Term(NamedTuple):
+    name: str
+    start: datetime
+    end: datetime
+
+
+def _to_datetime(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def term_for(moment: Any) -> Term:
+    """The term containing a timestamp (datetime or ISO string, naive means UTC)"""
+    moment = _to_datetime(moment)
+    year = moment.year
+    starts = [datetime(year, month, day, tzinfo=timezone.utc) for month, day, _ in TERM_STARTS]
+    starts.append(datetime(year + 1, TERM_STARTS[0][0], TERM_STARTS[0][1], tzinfo=timezone.utc))
+
+    for index, (_, _, name) in enumerate(TERM_STARTS):
+        if starts[index] <= moment < starts[index + 1]:
+            return Term(f"{year}_{name}", starts[index], starts[index + 1])
+    raise ValueError(f"No term contains {moment}")
+
+
+def terms_between(start: Any, end: Any) -> List[Term]:
+    """Every term overlapping [start, end]"""
+    terms = [term_for(start)]
+    end = _to_datetime(end)
+    while terms[-1].end <= end:
+        terms.append(term_for(terms[-1].end))
+    return terms
+
+
+def term_by_name(name: str) -> Term:
+    """Parse a term name such as '2024_fall'"""
+    year, _, season = name.partition('_')
+    for month, day, term_name in TERM_STARTS:
+        if term_name == season and year.isdigit():
+            return term_for(datetime(int(year), month, day, tzinfo=timezone.utc))
+    raise ValueError(f"Unknown term {name!r}; expected e.g. 2024_fall")
+
+
+def existing_terms(cursor) -> List[str]:
+    """Names of terms that currently have a posts partition"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'posts'::regclass
+        ORDER BY c.relname
+    """)
+    return [row[0][len('posts_'):] for row in cursor.fetchall()]
+
+
+def create_term_partitions(cursor, term: Term):
+    """Create the posts, attachments and links partitions for a term if missing"""
+    for table, _ in reversed(PARTITIONED_TABLES):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_{term.name}
+            PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)
+        """, (term.start, term.end))
+
+
+def ensure_partitions(conn, timestamps: Iterable[Any], known: set) -> List[str]:
+    """
+    Create partitions for every term in `timestamps` not already in `known`.
+
+    Commits on its own so a later rolled-back write cannot undo the DDL;
+    `known` is updated in place and caches terms across calls.
+    """
+    wanted = {term_for(moment) for moment in timestamps if moment}
+    missing = [term for term in wanted if term.name not in known]
+    if not missing:
+        return []
+
+    with conn.cursor() as cursor:
+        existing = set(existing_terms(cursor))
+        created = []
+        for term in sorted(missing, key=lambda t: t.start):
+            if term.name not in existing:
+                create_term_partitions(cursor, term)
+                created.append(term.name)
+    conn.commit()
+
+    known.update(term.name for term in missing)
+    if created:
+        logger.info(f"Created partitions for terms: {', '.join(created)}")
+    return created
+
+
+def partition_sizes(cursor) -> List[Dict[str, Any]]:
+    """Row estimates and total size of each term's partitions"""
+    results = []
+    for term_name in existing_terms(cursor):
+        term = term_by_name(term_name)
+        row = {'term': term_name, 'start': term.start.date().isoformat(), 'end': term.end.date().isoformat()}
+        for table, _ in PARTITIONED_TABLES:
+            cursor.execute(
+                "SELECT reltuples::BIGINT, pg_total_relation_size(oid) FROM pg_class WHERE oid = %s::regclass",
+                (f"{table}_{term_name}",)
+            )
+            rows, size = cursor.fetchone()
+            row[f"{table}_rows"] = max(rows, 0)
+            row[f"{table}_bytes"] = size
+        results.append(row)
+    return results
+
+
+def archive_term(conn, term_name: str, drop: bool = False) -> Dict[str, Any]:
+    """
+    Detach a finished term's partitions and move them to the archive schema (or drop them).
+
+    Child partitions are detached first and lose their foreign keys, since
+    they no longer point into the live posts table. Related-post rows of the
+    archived posts are removed and recorded as deleted in post_changes;
+    callers should rebuild facet_counts and search_terms afterwards because
+    detaching does not fire row triggers.
+    """
+    term = term_by_name(term_name)
+    if term.end > datetime.now(timezone.utc):
+        raise ValueError(f"Term {term_name} has not finished yet")
+
+    try:
+        with conn.cursor() as cursor:
+            if term_name not in existing_terms(cursor):
+                raise ValueError(f"No partitions for term {term_name}")
+
+            cursor.execute(f"SELECT id FROM posts_{term_name}")
+            post_ids = [str(row[0]) for row in cursor.fetchall()]
+            # Detaching skips the change-feed triggers; consumers see the posts as deleted
+            cursor.execute(f"""
+                SELECT append_post_change(id, ed_post_id, posted_at, 'delete') FROM posts_{term_name}
+            """)
+
+            for table, _ in PARTITIONED_TABLES:
+                partition = f"{table}_{term_name}"
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+                cursor.execute("""
+                    SELECT conname FROM pg_constraint
+                    WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid = 'posts'::regclass
+                """, (partition,))
+                for (constraint,) in cursor.fetchall():
+                    cursor.execute(f'ALTER TABLE {partition} DROP CONSTRAINT "{constraint}"')
+
+            cursor.execute("""
+                DELETE FROM related_posts
+                WHERE post_id = ANY(%s::uuid[]) OR related_post_id = ANY(%s::uuid[])
+            """, (post_ids, post_ids))
+            cursor.execute("DELETE FROM related_posts_state WHERE post_id = ANY(%s::uuid[])", (post_ids,))
+
+            for table, _ in PARTITIONED_TABLES:
+                partition = f"{table}_{term_name}"
+                if drop:
+                    cursor.execute(f"DROP TABLE {partition}")
+                else:
+                    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                    cursor.execute(f"ALTER TABLE {partition} SET SCHEMA {ARCHIVE_SCHEMA}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    action = 'dropped' if drop else f"moved to {ARCHIVE_SCHEMA}"
+    logger.info(f"Archived term {term_name}: {len(post_ids)} posts {action}")
+    return {'term': term_name, 'posts': len(post_ids), 'dropped': drop}
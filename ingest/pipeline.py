@@ -0,0 +1,444 @@
+"""
+Fan-out ingestion pipeline for EdThing
+
+One pass over Ed threads (source -> filters -> transform) feeds any number
+of sinks. Each sink runs on its own thread behind a bounded queue, writes in
+its own batch size and fails on its own: an error in one sink disables that
+sink only, while the others keep receiving records.
+"""
+import os
+import csv
+import json
+import queue
+import shutil
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator, Tuple
+
+from records import CSV_FIELDNAMES, Post
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_ABORT = object()
+
+
+class EdThreadSource:
+    """Iterate over a course's threads, newest first, paging through the Ed API"""
+
+    def __init__(self, ed, course_id: int, page_size: int = 100, max_threads: Optional[int] = None):
+        self.ed = ed
+        self.course_id = course_id
+        self.page_size = page_size
+        self.max_threads = max_threads
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        offset = 0
+        while self.max_threads is None or offset < self.max_threads:
+            limit = self.page_size
+            if self.max_threads is not None:
+                limit = min(limit, self.max_threads - offset)
+
+            batch = self.ed.list_threads(course_id=self.course_id, limit=limit, offset=offset, sort="new")
+            if not batch:
+                break
+            logger.info(f"Fetched {len(batch)} threads (offset {offset}) for course {self.course_id}")
+            yield from batch
+
+            if len(batch) < limit:
+                break  # Last page
+            offset += limit
+
+
+class EdThreadIdSource:
+    """Fetch specific threads by ID, e.g. ones reported changed by a push event"""
+
+    def __init__(self, ed, course_id: int, thread_ids: Iterable[int]):
+        self.ed = ed
+        self.course_id = course_id
+        self.thread_ids = sorted(set(thread_ids))
+        self.errors: List[str] = []
+        # (thread ID, exception) of every thread that could not be fetched
+        self.failures: List[Tuple[int, Exception]] = []
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for thread_id in self.thread_ids:
+            try:
+                thread = self.ed.get_thread(thread_id)
+            except Exception as e:
+                error_msg = f"Failed to fetch thread {thread_id}: {e}"
+                logger.warning(error_msg)
+                self.errors.append(error_msg)
+                self.failures.append((thread_id, e))
+                continue
+
+            if thread.get('course_id') not in (None, self.course_id):
+                logger.warning(f"Ignoring thread {thread_id} from course {thread.get('course_id')}")
+                continue
+            yield thread
+
+
+class Sink:
+    """
+    Base class for pipeline sinks.
+
+    Subclasses implement write_batch(); open() and close() run on the sink's
+    own thread, so per-thread resources such as SQLite connections are safe.
+    """
+    name = 'sink'
+
+    def __init__(self, batch_size: int = 50, queue_size: int = 1000):
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.stats = {'received': 0, 'written': 0, 'failed': 0}
+        self.errors: List[str] = []
+        self.failed = False
+
+    def open(self):
+        """Prepare the sink before the first batch"""
+
+    def write_batch(self, records: List[Post]):
+        """Write a batch of processed posts"""
+        raise NotImplementedError
+
+    def close(self):
+        """Flush and release resources after the last batch"""
+
+    def abort(self):
+        """Release resources after a failure, discarding partial output"""
+
+
+class _SinkWorker:
+    """Runs one sink on a dedicated thread, isolating its failures"""
+
+    def __init__(self, sink: Sink):
+        self.sink = sink
+        self.queue: queue.Queue = queue.Queue(maxsize=sink.queue_size)
+        self.thread = threading.Thread(target=self._run, name=f"sink-{sink.name}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, record: Post):
+        self.queue.put(record)
+
+    def finish(self, abort: bool = False):
+        self.queue.put(_ABORT if abort else _STOP)
+        self.thread.join()
+
+    def _run(self):
+        sink = self.sink
+        batch: List[Post] = []
+        stopped = False
+        try:
+            sink.open()
+            while not stopped:
+                item = self.queue.get()
+                if item is _ABORT:
+                    # The run failed upstream: don't publish partial output
+                    sink.abort()
+                    return
+                stopped = item is _STOP
+                if not stopped:
+                    sink.stats['received'] += 1
+                    batch.append(item)
+                if batch and (stopped or len(batch) >= sink.batch_size):
+                    sink.write_batch(batch)
+                    batch = []
+            sink.close()
+        except Exception as e:
+            sink.failed = True
+            sink.stats['failed'] += len(batch)
+            error_msg = f"Sink {sink.name} failed: {str(e)}"
+            logger.error(error_msg)
+            sink.errors.append(error_msg)
+            try:
+                sink.abort()
+            except Exception as abort_error:
+                logger.warning(f"Sink {sink.name} abort failed: {abort_error}")
+            # Keep draining so the producer never blocks on a dead sink
+            while not stopped:
+                item = self.queue.get()
+                stopped = item is _STOP or item is _ABORT
+                if not stopped:
+                    sink.stats['received'] += 1
+                    sink.stats['failed'] += 1
+
+
+class Pipeline:
+    """source -> filters -> transform -> sinks, fetched once and fanned out"""
+
+    def __init__(self, source: Iterable[Dict[str, Any]],
+                 transform: Callable[[Dict[str, Any]], Optional[Post]],
+                 sinks: List[Sink],
+                 filters: Optional[List[Callable[[Dict[str, Any]], bool]]] = None):
+        self.source = source
+        self.transform = transform
+        self.sinks = sinks
+        self.filters = filters or []
+        self.stats = {'fetched': 0, 'filtered': 0, 'matched': 0, 'transform_errors': 0}
+        self.errors: List[str] = []
+        # (thread ID, exception) of every thread the transform failed on
+        self.failures: List[Tuple[Any, Exception]] = []
+
+    def run(self) -> Dict[str, Any]:
+        """Run the pipeline to completion and return per-stage and per-sink stats"""
+        workers = [_SinkWorker(sink) for sink in self.sinks]
+        for worker in workers:
+            worker.start()
+
+        completed = False
+        try:
+            for thread in self.source:
+                self.stats['fetched'] += 1
+
+                if not all(predicate(thread) for predicate in self.filters):
+                    self.stats['filtered'] += 1
+                    continue
+
+                try:
+                    record = self.transform(thread)
+                except Exception as e:
+                    self.stats['transform_errors'] += 1
+                    error_msg = f"Failed to process thread {thread.get('id')}: {str(e)}"
+                    logger.error(error_msg)
+                    self.errors.append(error_msg)
+                    self.failures.append((thread.get('id'), e))
+                    continue
+
+                if not record:
+                    self.stats['filtered'] += 1
+                    continue
+
+                self.stats['matched'] += 1
+                for worker in workers:
+                    worker.put(record)
+            completed = True
+        finally:
+            for worker in workers:
+                worker.finish(abort=not completed)
+
+        for sink in self.sinks:
+            self.errors.extend(sink.errors)
+
+        return {
+            **self.stats,
+            'sinks': {sink.name: {**sink.stats, 'ok': not sink.failed} for sink in self.sinks},
+        }
+
+
+class PostgresSink(Sink):
+    """Upserts students and posts into Postgres, skipping hidden posts and students"""
+    name = 'postgres'
+
+    def __init__(self, db, hidden_posts: Optional[set] = None, hidden_students: Optional[set] = None,
+                 batch_size: int = 50, queue_size: int = 1000):
+        super().__init__(batch_size=batch_size, queue_size=queue_size)
+        self.db = db
+        self.hidden_posts = hidden_posts
+        self.hidden_students = hidden_students
+        self.stats.update({'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0})
+
+    def open(self):
+        if self.hidden_posts is None:
+            self.hidden_posts = self.db.get_hidden_posts()
+        if self.hidden_students is None:
+            self.hidden_students = self.db.get_hidden_students()
+
+    def is_hidden(self, record: Post) -> bool:
+        return record.ed_post_id in self.hidden_posts or record.author_ed_user_id in self.hidden_students
+
+    def write_record(self, record: Post) -> Optional[str]:
+        """Upsert one post; returns 'skipped', the upsert status, or None on failure"""
+        if self.is_hidden(record):
+            return 'skipped'
+
+        author_id = None
+        if record.author:
+            author_id = self.db.upsert_student(
+                record.author.ed_user_id,
+                record.author.display_name,
+                record.author.email
+            )
+
+        return self.db.upsert_post(record, author_id=author_id)
+
+    def write_batch(self, records: List[Post]):
+        for record in records:
+            status = self.write_record(record)
+            if status == 'skipped':
+                self.stats['skipped'] += 1
+            elif status:
+                self.stats[status] += 1
+                self.stats['written'] += 1
+            else:
+                self.stats['failed'] += 1
+                self.errors.append(f"Failed to upsert post {record.ed_post_id}")
+
+
+class _FileSink(Sink):
+    """Writes to a temporary file that replaces the target only on success"""
+
+    def __init__(self, path: str, batch_size: int = 200, queue_size: int = 1000):
+        super().__init__(batch_size=batch_size, queue_size=queue_size)
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.file = None
+
+    def open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(self.tmp_path, 'w', newline='', encoding='utf-8')
+
+    def close(self):
+        self.file.close()
+        # Ensure the target is a file, not a directory (bind mounts can create one)
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self.file:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class CsvSink(_FileSink):
+    """Writes the CSV consumed by the web app"""
+    name = 'csv'
+
+    FIELDNAMES = CSV_FIELDNAMES
+
+    def open(self):
+        super().open()
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.FIELDNAMES)
+
+    def write_batch(self, records: List[Post]):
+        self.writer.writerows(record.csv_row() for record in records)
+        self.stats['written'] += len(records)
+
+
+class JsonlSink(_FileSink):
+    """Writes one JSON document per processed post"""
+    name = 'jsonl'
+
+    def write_batch(self, records: List[Post]):
+        self.file.writelines(json.dumps(record.to_dict(), default=str, ensure_ascii=False) + '\n' for record in records)
+        self.stats['written'] += len(records)
+
+
+class SqliteSink(Sink):
+    """Upserts processed posts into a local SQLite database"""
+    name = 'sqlite'
+
+    def __init__(self, path: str, batch_size: int = 500, queue_size: int = 1000):
+        super().__init__(batch_size=batch_size, queue_size=queue_size)
+        self.path = path
+        self.connection = None
+
+    def open(self):
+        import sqlite3
+
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS posts (
+                ed_post_id INTEGER PRIMARY KEY,
+                ed_thread_id INTEGER,
+                title TEXT NOT NULL,
+                content TEXT,
+                author_ed_user_id INTEGER,
+                author_name TEXT,
+                posted_at TEXT,
+                updated_at TEXT,
+                url TEXT,
+                category TEXT,
+                tags TEXT,
+                topics TEXT,
+                homework_number INTEGER,
+                links TEXT,
+                attachments TEXT
+            )
+        """)
+
+    def write_batch(self, records: List[Post]):
+        values = []
+        for record in records:
+            # Links and attachments keep the JSON shape of the JSONL sink
+            data = record.to_dict()
+            values.append((
+                record.ed_post_id,
+                record.ed_thread_id,
+                record.title,
+                record.content,
+                record.author_ed_user_id,
+                record.author.display_name if record.author else None,
+                _isoformat(record.posted_at),
+                _isoformat(record.updated_at),
+                record.url,
+                record.category,
+                json.dumps(record.tags),
+                json.dumps(record.topics),
+                record.homework_number,
+                json.dumps(data['links'], default=str),
+                json.dumps(data['attachments'], default=str),
+            ))
+
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ed_post_id) DO UPDATE SET
+                    ed_thread_id = excluded.ed_thread_id,
+                    title = excluded.title,
+                    content = excluded.content,
+                    author_ed_user_id = excluded.author_ed_user_id,
+                    author_name = excluded.author_name,
+                    posted_at = excluded.posted_at,
+                    updated_at = excluded.updated_at,
+                    url = excluded.url,
+                    category = excluded.category,
+                    tags = excluded.tags,
+                    topics = excluded.topics,
+                    homework_number = excluded.homework_number,
+                    links = excluded.links,
+                    attachments = excluded.attachments
+            """, values)
+        self.stats['written'] += len(values)
+
+    def close(self):
+        self.connection.close()
+
+    def abort(self):
+        if self.connection:
+            self.connection.close()
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def build_sink(spec: str, db_factory: Optional[Callable[[], Any]] = None) -> Sink:
+    """
+    Build a sink from a command-line spec.
+
+    `postgres`, `csv=PATH`, `jsonl=PATH`, `sqlite=PATH` or `shards=DIR`.
+    """
+    kind, _, path = spec.partition('=')
+    if kind == 'postgres':
+        if db_factory is None:
+            raise ValueError("postgres sink requires a database")
+        return PostgresSink(db_factory())
+    if not path:
+        raise ValueError(f"Sink '{kind}' requires a path, e.g. {kind}=output.{kind}")
+    if kind == 'csv':
+        return CsvSink(path)
+    if kind == 'jsonl':
+        return JsonlSink(path)
+    if kind == 'sqlite':
+        return SqliteSink(path)
+    if kind == 'shards':
+        from shards import ShardSink
+        return ShardSink(path)
+    raise ValueError(f"Unknown sink '{kind}'")
@@ -2,33 +2,169 @@
 Post processing and filtering for EdThing ingestion
 """
 import re
+import time
 import logging
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, List, Any, Optional
 from urllib.parse import urlparse
 from datetime import datetime
-import requests
-from bs4 import BeautifulSoup, NavigableString
+
+from records import Author, Attachment, Link, Post
+from rules import ParticipationRules
 
 logger = logging.getLogger(__name__)
 
+HOMEWORK_PATTERN = re.compile(r'(?:HW|Homework)\s*0*(\d+)', re.IGNORECASE)
+
+# Canonical topics, matched as lowercase substrings of title + content
+TOPIC_DEFINITIONS = [
+    ('Muon', ['muon']),
+    ('MuP', ['mup', 'μp']),
+    ('Shampoo', ['shampoo']),
+    ('SOAP', ['soap ']),
+    ('AdamW', ['adamw']),
+    ('Adam', [' adam', 'adam ']),
+    ('SGD', ['sgd']),
+    ('Lion', ['lion optimizer', ' lion']),
+    ('Polar Express', ['polar express']),
+    ('Adafactor', ['adafactor']),
+]
+
+
+def extract_homework_number(title: str) -> Optional[int]:
+    """Get the homework number from a title like HW06 or Homework 12"""
+    match = HOMEWORK_PATTERN.search(title or '')
+    return int(match.group(1)) if match else None
+
+
+def extract_topics(title: str, content: str) -> List[str]:
+    """Get the canonical topics mentioned in a post"""
+    text = f"{title or ''} {content or ''}".lower()
+    return [tag for tag, patterns in TOPIC_DEFINITIONS if any(p in text for p in patterns)]
+
+
+def convert_xml_to_markdown(content: str) -> str:
+    """Convert Ed XML content to markdown with proper LaTeX handling"""
+    if not content:
+        return ""
+    
+    try:
+        from bs4 import BeautifulSoup, NavigableString, FeatureNotFound
+        
+        # Try lxml-xml first, fallback to html.parser if lxml is not installed
+        try:
+            soup = BeautifulSoup(content, 'lxml-xml')
+        except FeatureNotFound:
+            soup = BeautifulSoup(content, 'html.parser')
+        
+        # Find document tag
+        doc = soup.find('document')
+        if not doc:
+            return content
+        
+        def process_element(elem):
+            """Recursively process XML elements to markdown"""
+            if isinstance(elem, NavigableString):
+                # Inline text keeps its spaces; only block elements are trimmed
+                return str(elem)
+            
+            if not hasattr(elem, 'name') or not elem.name:
+                return ""
+            
+            if elem.name == 'paragraph':
+                parts = []
+                for child in elem.children:
+                    part = process_element(child)
+                    if part:
+                        parts.append(part)
+                return "".join(parts).strip()
+            
+            elif elem.name == 'bold':
+                text = "".join(process_element(c) for c in elem.children)
+                return f"**{text}**"
+            
+            elif elem.name == 'italic':
+                text = "".join(process_element(c) for c in elem.children)
+                return f"*{text}*"
+            
+            elif elem.name == 'underline':
+                text = "".join(process_element(c) for c in elem.children)
+                return f"__{text}__"
+            
+            elif elem.name == 'code':
+                text = elem.get_text()
+                return f"`{text}`"
+            
+            elif elem.name == 'math':
+                latex = elem.get_text().strip()
+                # Use inline math syntax for KaTeX
+                return f"\\({latex}\\)"
+            
+            elif elem.name == 'link':
+                href = elem.get('href', '').strip()
+                text = "".join(process_element(c) for c in elem.children).strip() or href
+                return f"[{text}]({href})"
+            
+            elif elem.name == 'heading':
+                level = int(elem.get('level', 1))
+                text = "".join(process_element(c) for c in elem.children).strip()
+                return f"{'#' * level} {text}"
+            
+            elif elem.name == 'list':
+                style = elem.get('style', 'bullet')
+                items = []
+                for item in elem.find_all('list-item', recursive=False):
+                    item_text = "".join(process_element(c) for c in item.children).strip()
+                    prefix = "- " if style == 'bullet' else "1. "
+                    items.append(f"{prefix}{item_text}")
+                return "\n".join(items)
+            
+            elif elem.name == 'pre':
+                text = elem.get_text()
+                return f"```\n{text}\n```"
+            
+            elif elem.name == 'snippet':
+                language = elem.get('language', '')
+                text = elem.get_text()
+                return f"```{language}\n{text}\n```"
+            
+            elif elem.name == 'image':
+                src = elem.get('src', '')
+                return f"![Image]({src})"
+            
+            elif elem.name == 'figure':
+                img = elem.find('image')
+                if img:
+                    src = img.get('src', '')
+                    return f"![Image]({src})"
+                return ""
+            
+            else:
+                # Default: process children
+                return "".join(process_element(c) for c in elem.children)
+        
+        # Process all top-level elements in document
+        markdown_parts = []
+        for child in doc.children:
+            if hasattr(child, 'name') and child.name:
+                part = process_element(child)
+                if part:
+                    markdown_parts.append(part)
+        
+        return "\n\n".join(markdown_parts).strip()
+    except Exception as e:
+        logger.warning(f"Failed to convert XML to markdown: {e}")
+        return content
+
+
 class PostProcessor:
-    def __init__(self, rules: Dict[str, Any]):
+    def __init__(self, rules: Dict[str, Any], fetch_link_titles: bool = True):
         self.rules = rules
+        self.fetch_link_titles = fetch_link_titles
+        self.participation = ParticipationRules(rules)
 
     def is_participation_post(self, post: Dict[str, Any]) -> bool:
-        """Check if a post qualifies for Participation D - MUST have 'Participation D' in title"""
-        # Get title from various possible field names
-        title = (post.get('title') or post.get('subject') or '').strip()
-        
-        # Strict filter: title must contain "Participation D" (case-insensitive)
-        if not title:
-            return False
-            
-        title_lower = title.lower()
-        if 'participation d' in title_lower:
-            return True
-
-        return False
+        """Check if a post qualifies for Participation D under the configured rules"""
+        return self.participation.matches(post)
 
     def extract_tags(self, title: str, content: str) -> List[str]:
         """Extract tags like Muon, MuP, etc. from post content"""
@@ -43,9 +179,9 @@ class PostProcessor:
                     tags.append(tag_name)
                     break
 
-        return list(set(tags))  # Remove duplicates
+        return sorted(set(tags))  # Remove duplicates, stable order for change detection
 
-    def extract_links(self, content: str) -> List[Dict[str, Any]]:
+    def extract_links(self, content: str) -> List[Link]:
         """Extract and classify links from post content"""
         links = []
 
@@ -64,12 +200,15 @@ class PostProcessor:
                 # Classify link type
                 link_type = self._classify_link(url, domain)
 
-                links.append({
-                    'url': url,
-                    'domain': domain,
-                    'link_type': link_type,
-                    'title': self._extract_link_title(url) if link_type in ['github', 'personal'] else None
-                })
+                links.append(Link(
+                    url=url,
+                    domain=domain,
+                    link_type=link_type,
+                    title=(
+                        self.fetch_link_title(url)
+                        if self.fetch_link_titles and link_type in ['github', 'personal'] else None
+                    )
+                ))
             except Exception as e:
                 logger.warning(f"Failed to process URL {url}: {e}")
 
@@ -86,14 +225,20 @@ class PostProcessor:
         else:
             return 'other'
 
-    def _extract_link_title(self, url: str) -> Optional[str]:
+    def fetch_link_title(self, url: str) -> Optional[str]:
         """Try to extract a title from a URL (for GitHub repos, etc.)"""
         try:
             # Only attempt for GitHub repos to avoid rate limits
             if 'github.com' in url and '/blob/' not in url and '/tree/' not in url:
+                # Imported lazily: most runs never fetch a link title
+                import requests
+                from bs4 import BeautifulSoup
+
                 response = requests.get(url, timeout=5, headers={
                     'User-Agent': 'EdThing-Bot/1.0'
                 })
+                # Rate limiting for the external site
+                time.sleep(0.1)
                 if response.status_code == 200:
                     soup = BeautifulSoup(response.content, 'html.parser')
                     title_tag = soup.find('title')
@@ -104,7 +249,7 @@ class PostProcessor:
 
         return None
 
-    def process_attachments(self, attachments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def process_attachments(self, attachments: List[Dict[str, Any]]) -> List[Attachment]:
         """Process and enhance attachment metadata"""
         processed = []
 
@@ -112,22 +257,20 @@ class PostProcessor:
             filename = att.get('filename', '')
             file_type = att.get('file_type', '')
 
-            processed_att = {
-                'filename': filename,
-                'file_type': file_type,
-                'file_size': att.get('size'),
-                'ed_attachment_id': att.get('id'),
-                'download_url': att.get('download_url'),
-                'preview_url': att.get('preview_url'),
-                'is_image': file_type.startswith('image/'),
-                'is_pdf': file_type == 'application/pdf' or filename.lower().endswith('.pdf')
-            }
-
-            processed.append(processed_att)
+            processed.append(Attachment(
+                filename=filename,
+                file_type=file_type,
+                file_size=att.get('size'),
+                ed_attachment_id=att.get('id'),
+                download_url=att.get('download_url'),
+                preview_url=att.get('preview_url'),
+                is_image=file_type.startswith('image/'),
+                is_pdf=file_type == 'application/pdf' or filename.lower().endswith('.pdf')
+            ))
 
         return processed
 
-    def process_post(self, post: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def process_post(self, post: Dict[str, Any]) -> Optional[Post]:
         """Process a complete post for ingestion"""
         if not self.is_participation_post(post):
             return None
@@ -141,44 +284,44 @@ class PostProcessor:
             or ''
         )
         # Convert Ed XML document into markdown for nicer rendering
-        raw_content = self._convert_ed_document_to_markdown(raw_content_xml)
+        raw_content = convert_xml_to_markdown(raw_content_xml)
         raw_category = post.get('category') or post.get('folder') or post.get('type')
         raw_attachments = post.get('attachments') or post.get('files') or []
 
-        # Extract basic post data
-        processed_post = {
-            'ed_post_id': post['id'],
-            'ed_thread_id': post.get('thread_id'),
-            'title': raw_title,
-            'content': raw_content,
-            'posted_at': self._parse_datetime(
+        author_data = post.get('author') or post.get('user') or post.get('creator')
+
+        return Post(
+            ed_post_id=post['id'],
+            ed_thread_id=post.get('thread_id'),
+            title=raw_title,
+            content=raw_content,
+            posted_at=self._parse_datetime(
                 post.get('created_at')
                 or post.get('createdAt')
                 or post.get('created')
             ),
-            'updated_at': self._parse_datetime(
-                post.get('updated_at')
-                or post.get('updatedAt')
-                or post.get('edited_at')
-            ),
-            'url': post.get('url') or (f"https://edstem.org/us/courses/{post.get('course_id', '')}/discussion/{post['id']}" if post.get('id') else None),
-            'category': raw_category if isinstance(raw_category, str) else (raw_category.get('name') if isinstance(raw_category, dict) else ''),
-            'tags': self.extract_tags(raw_title, raw_content),
-            'attachments': self.process_attachments(raw_attachments),
-            'links': self.extract_links(raw_content)
-        }
-
-        # Handle author
-        author_data = post.get('author') or post.get('user') or post.get('creator')
-        if author_data:
-            processed_post['author_id'] = author_data.get('id')
-            processed_post['author_info'] = {
-                'ed_user_id': author_data.get('id'),
-                'display_name': author_data.get('name', 'Anonymous'),
-                'email': author_data.get('email')
-            }
+            updated_at=self.get_updated_at(post),
+            url=post.get('url') or (f"https://edstem.org/us/courses/{post.get('course_id', '')}/discussion/{post['id']}" if post.get('id') else None),
+            category=raw_category if isinstance(raw_category, str) else (raw_category.get('name') if isinstance(raw_category, dict) else ''),
+            tags=self.extract_tags(raw_title, raw_content),
+            topics=extract_topics(raw_title, raw_content),
+            homework_number=extract_homework_number(raw_title),
+            attachments=self.process_attachments(raw_attachments),
+            links=self.extract_links(raw_content),
+            author=Author(
+                ed_user_id=author_data.get('id'),
+                display_name=author_data.get('name', 'Anonymous'),
+                email=author_data.get('email')
+            ) if author_data else None,
+        )
 
-        return processed_post
+    def get_updated_at(self, post: Dict[str, Any]) -> Optional[datetime]:
+        """Get the last-edited time Ed reports for a thread"""
+        return self._parse_datetime(
+            post.get('updated_at')
+            or post.get('updatedAt')
+            or post.get('edited_at')
+        )
 
     def _parse_datetime(self, dt_str: Optional[str]) -> Optional[datetime]:
         """Parse datetime string from EdStem API"""
@@ -191,56 +334,3 @@ class PostProcessor:
         except Exception as e:
             logger.warning(f"Failed to parse datetime {dt_str}: {e}")
             return None
-
-    def _convert_ed_document_to_markdown(self, content: str) -> str:
-        """
-        Convert Ed's XML document format into a rough Markdown representation.
-        This is not perfect but makes posts readable and preserves LaTeX/math.
-        """
-        if not content or not content.lstrip().startswith("<document"):
-            return content
-
-        try:
-            soup = BeautifulSoup(content, "xml")
-            document = soup.find("document")
-            if not document:
-                return content
-
-            def render(node) -> str:
-                if isinstance(node, NavigableString):
-                    return str(node)
-
-                children_text = "".join(render(child) for child in node.children)
-
-                name = node.name
-                if name == "paragraph":
-                    return children_text + "\n\n"
-                if name == "bold":
-                    return f"**{children_text}**"
-                if name == "italic":
-                    return f"*{children_text}*"
-                if name == "code":
-                    return f"`{children_text}`"
-                if name in ("pre", "snippet"):
-                    return f"\n```text\n{children_text}\n```\n\n"
-                if name == "math":
-                    # Wrap LaTeX so remark-math / KaTeX can render it
-                    inner = children_text.strip()
-                    return f"\\({inner}\\)"
-                if name == "link":
-                    href = node.get("href", "").strip()
-                    text = children_text.strip() or href
-                    return f"[{text}]({href})"
-                if name == "list":
-                    # Flatten list items; we don't distinguish bullet vs number here
-                    return children_text + "\n"
-                if name == "list-item":
-                    return f"- {children_text.strip()}\n"
-                # Fallback: just render children
-                return children_text
-
-            markdown = "".join(render(child) for child in document.children)
-            return markdown.strip()
-        except Exception as e:
-            logger.warning(f"Failed to convert Ed document to markdown: {e}")
-            return content
@@ -0,0 +1,120 @@
+"""
+Per-run profiling for ingest syncs
+
+RunProfiler wraps one sync: cProfile on the thread driving the run (fetch,
+filters, transform and drain all run there; sink threads only append to the
+spool), tracemalloc for peak memory and the top allocation sites, and wall
+time per Ed thread through the transform. Artifacts go to one directory per
+run, named after the run's ingestion_runs id:
+
+    profile.pstats   load with pstats or snakeviz
+    profile.txt      top functions by cumulative time
+    memory.txt       peak traced memory and the top allocation sites
+    threads.json     the slowest threads
+
+summary() is stored on the ingestion_runs row next to the directory path.
+"""
+import os
+import io
+import json
+import time
+import heapq
+import pstats
+import logging
+import cProfile
+import tracemalloc
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class RunProfiler:
+    """cProfile, tracemalloc and per-thread timings for one ingest run"""
+
+    def __init__(self, output_dir: str, top_threads: int = 10):
+        self.output_dir = output_dir
+        self.top_threads = top_threads
+        self.profile = cProfile.Profile()
+        self.thread_count = 0
+        self._slowest: List[Tuple[float, int, Any, str]] = []
+        self._started: Optional[float] = None
+        self._stopped: Optional[float] = None
+        self._peak_memory = 0
+        self._owns_tracemalloc = False
+
+    def start(self):
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self._stopped = time.perf_counter()
+        self._peak_memory = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        try:
+            self._write(snapshot)
+            logger.info(f"Profile written to {self.output_dir}: {self.summary()}")
+        except OSError as e:
+            logger.error(f"Failed to write profile to {self.output_dir}: {e}")
+
+    def time_threads(self, transform: Callable[[Dict[str, Any]], Any]) -> Callable[[Dict[str, Any]], Any]:
+        """Wrap the pipeline transform to record wall time per Ed thread"""
+        def timed(thread: Dict[str, Any]):
+            started = time.perf_counter()
+            try:
+                return transform(thread)
+            finally:
+                self._record(thread, time.perf_counter() - started)
+        return timed
+
+    def _record(self, thread: Dict[str, Any], seconds: float):
+        self.thread_count += 1
+        entry = (seconds, self.thread_count, thread.get('id'), thread.get('title') or '')
+        if len(self._slowest) < self.top_threads:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def slowest_threads(self) -> List[Dict[str, Any]]:
+        return [
+            {'thread_id': thread_id, 'title': title[:120], 'seconds': round(seconds, 4)}
+            for seconds, _, thread_id, title in sorted(self._slowest, reverse=True)
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'wall_seconds': round((self._stopped or time.perf_counter()) - (self._started or 0), 3),
+            'peak_memory_bytes': self._peak_memory,
+            'threads_timed': self.thread_count,
+            'slowest_threads': self.slowest_threads(),
+        }
+
+    def _write(self, snapshot: 'tracemalloc.Snapshot'):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.profile.dump_stats(os.path.join(self.output_dir, 'profile.pstats'))
+
+        report = io.StringIO()
+        pstats.Stats(self.profile, stream=report).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        with open(os.path.join(self.output_dir, 'profile.txt'), 'w') as f:
+            f.write(report.getvalue())
+
+        with open(os.path.join(self.output_dir, 'memory.txt'), 'w') as f:
+            f.write(f"Peak traced memory: {self._peak_memory / (1024 * 1024):.1f} MiB\n\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+        with open(os.path.join(self.output_dir, 'threads.json'), 'w') as f:
+            json.dump(self.summary(), f, indent=1, default=str)
+
+        for entry in self.slowest_threads():
+            logger.info(f"Slow thread {entry['thread_id']}: {entry['seconds']:.3f}s {entry['title']!r}")
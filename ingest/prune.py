@@ -0,0 +1,104 @@
+"""
+Rule-driven pruning of posts that no longer match the participation filter
+
+Run it through `python -m sync prune`, which loads the same participation
+rules (defaults included) as the ingest.
+"""
+import time
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from rules import ParticipationRules
+
+logger = logging.getLogger(__name__)
+
+
+class Pruner:
+    """Delete non-matching posts in small keyset batches that skip locked rows"""
+
+    def __init__(self, connection, rules: Dict[str, Any], batch_size: int = 500,
+                 pause_seconds: float = 0.0):
+        self.connection = connection
+        self.rules = rules
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.predicate, self.params = ParticipationRules(rules).sql_predicate('p')
+
+    def count(self) -> Dict[str, int]:
+        """Count posts that would be pruned without modifying anything"""
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM posts")
+            total = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM posts p WHERE {self.predicate}", self.params)
+            matching = cursor.fetchone()[0]
+        self.connection.rollback()
+        return {'total': total, 'matching': matching, 'to_delete': total - matching}
+
+    def run(self) -> int:
+        """Prune posts batch by batch, committing after each batch"""
+        deleted_total = 0
+        cursor_id: Optional[str] = None
+
+        while True:
+            last_id, deleted = self._prune_batch(cursor_id)
+            if last_id is None:
+                break
+
+            deleted_total += deleted
+            cursor_id = last_id
+            if deleted:
+                logger.info(f"Pruned {deleted} posts (total {deleted_total}, cursor {cursor_id})")
+
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+
+        return deleted_total
+
+    def _prune_batch(self, after_id: Optional[str]) -> Tuple[Optional[str], int]:
+        """Scan the next id range and delete its non-matching, unlocked rows"""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"""
+                    WITH scanned AS (
+                        SELECT id FROM posts
+                        WHERE %s::uuid IS NULL OR id > %s::uuid
+                        ORDER BY id
+                        LIMIT %s
+                    ), doomed AS (
+                        SELECT p.id FROM posts p
+                        JOIN scanned s ON s.id = p.id
+                        WHERE NOT {self.predicate}
+                        FOR UPDATE OF p SKIP LOCKED
+                    ), deleted AS (
+                        DELETE FROM posts p
+                        USING doomed d
+                        WHERE p.id = d.id
+                        RETURNING p.id
+                    )
+                    SELECT
+                        (SELECT id FROM scanned ORDER BY id DESC LIMIT 1),
+                        (SELECT COUNT(*) FROM deleted)
+                """, [after_id, after_id, self.batch_size] + self.params)
+                last_id, deleted = cursor.fetchone()
+            self.connection.commit()
+            return (str(last_id) if last_id else None), deleted
+        except Exception:
+            self.connection.rollback()
+            raise
+
+
+def prune_posts(connection, rules: Dict[str, Any], batch_size: int = 500,
+                dry_run: bool = False, pause_seconds: float = 0.0) -> Dict[str, int]:
+    """Prune posts that do not satisfy the participation rules"""
+    pruner = Pruner(connection, rules, batch_size=batch_size, pause_seconds=pause_seconds)
+    counts = pruner.count()
+    logger.info(
+        f"Found {counts['to_delete']} of {counts['total']} posts that don't match the participation rules"
+    )
+
+    if dry_run or not counts['to_delete']:
+        return {**counts, 'deleted': 0}
+
+    deleted = pruner.run()
+    logger.info(f"Deleted {deleted} non-matching posts")
+    return {**counts, 'deleted': deleted}
@@ -0,0 +1,222 @@
+"""
+Typed records for processed posts
+
+PostProcessor.process_post returns a Post holding its Author, Attachments
+and Links. Every record is a slotted dataclass, so a post costs a fixed set
+of slots instead of a dict per post, author, attachment and link. Writers
+read fields straight off the records rather than copying them into an
+intermediate dict first:
+
+    Attachment.db_row(), Link.db_row()   tuples in ATTACHMENT_COLUMNS / LINK_COLUMNS order
+    Post.staging_row()                   a staging_posts COPY row
+    Post.csv_row()                       a CSV row in CSV_FIELDNAMES order
+    Post.to_spool() / Post.from_spool()  a compact positional form for the spool
+
+to_dict() keeps the old nested-dict shape for JSON outputs, and from_dict()
+reads it back (e.g. spool segments written before these records existed).
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Union
+
+CSV_FIELDNAMES = ['id', 'title', 'author', 'content', 'posted_at', 'url', 'links', 'attachments',
+                  'homework', 'topics', 'content_html']
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+@dataclass(slots=True)
+class Author:
+    ed_user_id: Optional[int]
+    display_name: str
+    email: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Attachment:
+    filename: str
+    file_type: str = ''
+    file_size: Optional[int] = None
+    ed_attachment_id: Optional[Any] = None
+    download_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    is_image: bool = False
+    is_pdf: bool = False
+
+    def db_row(self) -> tuple:
+        ed_attachment_id = self.ed_attachment_id
+        return (
+            self.filename, self.file_type, self.file_size,
+            str(ed_attachment_id) if ed_attachment_id is not None else None,
+            self.download_url, self.preview_url, self.is_image, self.is_pdf,
+        )
+
+
+@dataclass(slots=True)
+class Link:
+    url: str
+    title: Optional[str] = None
+    link_type: Optional[str] = None
+    domain: Optional[str] = None
+
+    def db_row(self) -> tuple:
+        return (self.url, self.title, self.link_type, self.domain)
+
+
+@dataclass(slots=True)
+class Post:
+    ed_post_id: int
+    title: str
+    posted_at: Optional[datetime]
+    ed_thread_id: Optional[int] = None
+    content: str = ''
+    updated_at: Optional[datetime] = None
+    url: Optional[str] = None
+    category: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    topics: List[str] = field(default_factory=list)
+    homework_number: Optional[int] = None
+    attachments: List[Attachment] = field(default_factory=list)
+    links: List[Link] = field(default_factory=list)
+    author: Optional[Author] = None
+    # Pre-rendered HTML of content, set by render.HtmlRenderer for file exports;
+    # Postgres renders its own into posts.content_html
+    content_html: Optional[str] = None
+
+    @property
+    def author_ed_user_id(self) -> Optional[int]:
+        return self.author.ed_user_id if self.author else None
+
+    def staging_row(self) -> tuple:
+        """Row for staging_posts (Database.bulk_upsert_posts)"""
+        return (
+            self.ed_post_id, self.ed_thread_id, self.title, self.content, self.author_ed_user_id,
+            self.posted_at, self.updated_at, self.url, self.category, self.tags, self.topics,
+            self.homework_number,
+        )
+
+    def csv_row(self) -> tuple:
+        """Row of the CSV consumed by the web app, in CSV_FIELDNAMES order"""
+        return (
+            self.ed_post_id,
+            self.title,
+            self.author.display_name if self.author else 'Unknown',
+            self.content,
+            _isoformat(self.posted_at) or '',
+            self.url or '',
+            '; '.join(link.url for link in self.links),
+            '; '.join(attachment.filename for attachment in self.attachments if attachment.filename),
+            self.homework_number if self.homework_number is not None else '',
+            '; '.join(self.topics),
+            self.content_html or '',
+        )
+
+    def to_spool(self) -> list:
+        """Positional JSON-ready form; from_spool() is its inverse"""
+        author = self.author
+        return [
+            self.ed_post_id, self.ed_thread_id, self.title, self.content,
+            _isoformat(self.posted_at), _isoformat(self.updated_at), self.url, self.category,
+            self.tags, self.topics, self.homework_number,
+            [[a.filename, a.file_type, a.file_size, a.ed_attachment_id, a.download_url, a.preview_url,
+              a.is_image, a.is_pdf] for a in self.attachments],
+            [[link.url, link.title, link.link_type, link.domain] for link in self.links],
+            [author.ed_user_id, author.display_name, author.email] if author else None,
+            self.content_html,
+        ]
+
+    @classmethod
+    def from_spool(cls, value: Union[list, Dict[str, Any]]) -> 'Post':
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        (ed_post_id, ed_thread_id, title, content, posted_at, updated_at, url, category,
+         tags, topics, homework_number, attachments, links, author) = value[:14]
+        return cls(
+            ed_post_id=ed_post_id, ed_thread_id=ed_thread_id, title=title, content=content,
+            posted_at=_parse_datetime(posted_at), updated_at=_parse_datetime(updated_at),
+            url=url, category=category, tags=tags, topics=topics, homework_number=homework_number,
+            attachments=[Attachment(*attachment) for attachment in attachments],
+            links=[Link(*link) for link in links],
+            author=Author(*author) if author else None,
+            # Absent from lines spooled before content_html existed
+            content_html=value[14] if len(value) > 14 else None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The nested-dict shape processed posts had before these records"""
+        data = {
+            'ed_post_id': self.ed_post_id,
+            'ed_thread_id': self.ed_thread_id,
+            'title': self.title,
+            'content': self.content,
+            'posted_at': self.posted_at,
+            'updated_at': self.updated_at,
+            'url': self.url,
+            'category': self.category,
+            'tags': self.tags,
+            'topics': self.topics,
+            'homework_number': self.homework_number,
+            'attachments': [
+                {
+                    'filename': a.filename, 'file_type': a.file_type, 'file_size': a.file_size,
+                    'ed_attachment_id': a.ed_attachment_id, 'download_url': a.download_url,
+                    'preview_url': a.preview_url, 'is_image': a.is_image, 'is_pdf': a.is_pdf,
+                }
+                for a in self.attachments
+            ],
+            'links': [
+                {'url': link.url, 'domain': link.domain, 'link_type': link.link_type, 'title': link.title}
+                for link in self.links
+            ],
+            'content_html': self.content_html,
+        }
+        if self.author:
+            data['author_id'] = self.author.ed_user_id
+            data['author_info'] = {
+                'ed_user_id': self.author.ed_user_id,
+                'display_name': self.author.display_name,
+                'email': self.author.email,
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Post':
+        author = data.get('author_info')
+        return cls(
+            ed_post_id=data['ed_post_id'],
+            ed_thread_id=data.get('ed_thread_id'),
+            title=data.get('title') or '',
+            content=data.get('content') or '',
+            posted_at=_parse_datetime(data.get('posted_at')),
+            updated_at=_parse_datetime(data.get('updated_at')),
+            url=data.get('url'),
+            category=data.get('category'),
+            tags=list(data.get('tags') or []),
+            topics=list(data.get('topics') or []),
+            homework_number=data.get('homework_number'),
+            attachments=[
+                Attachment(
+                    filename=a['filename'], file_type=a.get('file_type') or '', file_size=a.get('file_size'),
+                    ed_attachment_id=a.get('ed_attachment_id'), download_url=a.get('download_url'),
+                    preview_url=a.get('preview_url'), is_image=a.get('is_image', False),
+                    is_pdf=a.get('is_pdf', False),
+                )
+                for a in data.get('attachments') or []
+            ],
+            links=[
+                Link(url=link['url'], title=link.get('title'), link_type=link.get('link_type'),
+                     domain=link.get('domain'))
+                for link in data.get('links') or []
+            ],
+            author=Author(author.get('ed_user_id'), author.get('display_name', 'Anonymous'), author.get('email'))
+            if author else None,
+            content_html=data.get('content_html'),
+        )
@@ -0,0 +1,326 @@
+"""
+Related-posts index for EdThing ingestion
+
+Builds TF-IDF vectors for visible posts and stores the top-k cosine
+neighbours of each post in the related_posts table. Only posts whose text
+changed since the last build are re-scored, plus the unchanged posts whose
+lists they enter or leave, so a run touching a handful of posts costs
+O(changed x N) instead of O(N x N).
+
+Unchanged lists keep the scores of the IDF they were computed with, so
+every post is rescored when more than a quarter of the posts changed, or
+when the corpus size or its IDF has drifted too far from the last full
+build (related_posts_corpus).
+"""
+import re
+import logging
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from psycopg2.extras import execute_values, Json
+
+logger = logging.getLogger(__name__)
+
+# Above this share of dirty posts an incremental update costs more than rescoring everything
+FULL_RESCORE_FRACTION = 0.25
+# Rescore everything once the post count moved this far from the last full build...
+CORPUS_DRIFT = 0.10
+# ...or the mean absolute IDF change (weighted by document frequency) exceeds this
+IDF_DRIFT = 0.05
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_+-]*[a-z0-9]|[a-z0-9]")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its of on or so
+that the their then there these this to was we were which will with you your our
+participation special d hw homework
+""".split())
+
+Neighbours = Dict[int, List[Tuple[int, float]]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into content-bearing tokens"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def _idf(documents: int, frequency: np.ndarray) -> np.ndarray:
+    return np.log((1.0 + documents) / (1.0 + frequency)) + 1.0
+
+
+def build_tfidf(documents: List[str]) -> Tuple[sparse.csr_matrix, Dict[str, int], np.ndarray]:
+    """
+    Build an L2-normalised TF-IDF matrix (documents x vocabulary).
+
+    Uses sublinear term frequency and smoothed IDF so that long posts do not
+    dominate and terms present in every post still get a small weight.
+    Returns the matrix, the vocabulary (term -> column, in column order) and
+    each term's document frequency.
+    """
+    vocabulary: Dict[str, int] = {}
+    indptr = [0]
+    indices: List[int] = []
+    counts: List[float] = []
+
+    for document in documents:
+        for term, count in Counter(tokenize(document)).items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+        shape=(len(documents), len(vocabulary)),
+        dtype=np.float32,
+    )
+    matrix.data = 1.0 + np.log(matrix.data)
+
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    matrix = matrix.multiply(_idf(len(documents), document_frequency).astype(np.float32)).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+    return matrix, vocabulary, document_frequency
+
+
+def build_tfidf_matrix(documents: List[str]) -> sparse.csr_matrix:
+    """The TF-IDF matrix of build_tfidf alone"""
+    return build_tfidf(documents)[0]
+
+
+def idf_drift(old_documents: int, old_frequency: Dict[str, int], documents: int,
+              vocabulary: Dict[str, int], frequency: np.ndarray) -> float:
+    """Mean absolute IDF change of the current terms since `old_frequency`, weighted by how many posts use them"""
+    if not len(frequency):
+        return 0.0
+    previous = np.array([old_frequency.get(term, 0) for term in vocabulary], dtype=np.float64)
+    change = np.abs(_idf(documents, frequency) - _idf(old_documents, previous))
+    return float(np.average(change, weights=frequency))
+
+
+def _score_chunks(matrix: sparse.csr_matrix, positions: np.ndarray,
+                  batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """(positions, scores against every post) per batch, with self-similarity masked out"""
+    for start in range(0, len(positions), batch_size):
+        chunk = positions[start:start + batch_size]
+        scores = matrix[chunk].dot(matrix.T).toarray()
+        scores[np.arange(len(chunk)), chunk] = -1.0
+        yield chunk, scores
+
+
+def _top_k(chunk: np.ndarray, scores: np.ndarray, top_k: int, min_score: float) -> Neighbours:
+    k = min(top_k, scores.shape[1] - 1)
+    if k <= 0:
+        return {int(source): [] for source in chunk}
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    neighbours = {}
+    for row, source in enumerate(chunk):
+        order = top[row][np.argsort(-scores[row, top[row]])]
+        neighbours[int(source)] = [
+            (int(target), float(scores[row, target]))
+            for target in order if scores[row, target] >= min_score
+        ]
+    return neighbours
+
+
+def top_neighbours(matrix: sparse.csr_matrix, positions: np.ndarray, top_k: int,
+                   min_score: float, batch_size: int = 256) -> Neighbours:
+    """Top-k neighbours (position, score) of the posts at `positions`"""
+    neighbours: Neighbours = {}
+    for chunk, scores in _score_chunks(matrix, positions, batch_size):
+        neighbours.update(_top_k(chunk, scores, top_k, min_score))
+    return neighbours
+
+
+def incremental_neighbours(matrix: sparse.csr_matrix, dirty: np.ndarray, referencing: np.ndarray,
+                           thresholds: np.ndarray, top_k: int, min_score: float,
+                           batch_size: int = 256) -> Neighbours:
+    """
+    Fresh neighbour lists for every post a change can affect.
+
+    That is the dirty posts, the posts whose stored list references one of
+    them (`referencing`: the dirty post may drop out, and the slot is
+    refilled from the whole corpus) and the posts a dirty post now scores
+    above `thresholds` for (the score a newcomer must beat: the k-th stored
+    score of a full list, -inf otherwise).
+    """
+    is_dirty = np.zeros(matrix.shape[0], dtype=bool)
+    is_dirty[dirty] = True
+    gains = np.zeros(matrix.shape[0], dtype=bool)
+
+    neighbours: Neighbours = {}
+    for chunk, scores in _score_chunks(matrix, dirty, batch_size):
+        neighbours.update(_top_k(chunk, scores, top_k, min_score))
+        gains |= ((scores >= min_score) & (scores > thresholds)).any(axis=0)
+
+    gains[referencing] = True
+    gains &= ~is_dirty
+    neighbours.update(top_neighbours(matrix, np.flatnonzero(gains), top_k, min_score, batch_size))
+    return neighbours
+
+
+class RelatedPostsIndex:
+    """Maintains related_posts from TF-IDF cosine similarity"""
+
+    def __init__(self, db, top_k: int = 5, batch_size: int = 256, min_score: float = 0.05):
+        self.db = db
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.min_score = min_score
+
+    def update(self, full: bool = False) -> Dict[str, int]:
+        """Re-score changed posts (or every post with full=True) and store neighbours"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                # Two rescoring runs (e.g. a refresh job claimed twice) would overwrite each other's lists
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('edthing.related_posts'))")
+                cursor.execute("""
+                    SELECT p.id, md5(coalesce(p.title, '') || E'\\n' || coalesce(p.content, '')), s.content_hash
+                    FROM posts p
+                    LEFT JOIN related_posts_state s ON s.post_id = p.id
+                    WHERE p.is_hidden = false
+                """)
+                current = {str(row[0]): (row[1], row[2]) for row in cursor.fetchall()}
+                cursor.execute("SELECT post_id FROM related_posts_state")
+                indexed = {str(row[0]) for row in cursor.fetchall()}
+
+            gone = sorted(indexed - current.keys())
+            dirty = sorted(
+                post_id for post_id, (new_hash, old_hash) in current.items()
+                if full or new_hash != old_hash
+            )
+            if not full and len(dirty) > FULL_RESCORE_FRACTION * len(current):
+                logger.info(f"{len(dirty)} of {len(current)} posts changed, rescoring all of them")
+                full = True
+
+            if not dirty and not gone:
+                conn.rollback()
+                return {'posts': len(current), 'rescored': 0, 'removed': 0}
+
+            with conn.cursor() as cursor:
+                rescored = self._rescore(cursor, current, dirty, gone, full)
+                if gone:
+                    cursor.execute("""
+                        DELETE FROM related_posts
+                        WHERE post_id = ANY(%s::uuid[]) OR related_post_id = ANY(%s::uuid[])
+                    """, (gone, gone))
+                    cursor.execute("DELETE FROM related_posts_state WHERE post_id = ANY(%s::uuid[])", (gone,))
+
+            conn.commit()
+            logger.info(f"Related posts updated: {len(dirty)} changed, {rescored} lists rescored, {len(gone)} removed")
+            return {'posts': len(current), 'rescored': rescored, 'removed': len(gone)}
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _rescore(self, cursor, current: Dict[str, Tuple[str, str]], dirty: List[str],
+                 gone: List[str], full: bool) -> int:
+        """Recompute and store the neighbour lists a change can affect; returns how many"""
+        cursor.execute("""
+            SELECT id, title, content FROM posts WHERE is_hidden = false ORDER BY id
+        """)
+        rows = cursor.fetchall()
+        post_ids = [str(row[0]) for row in rows]
+        position = {post_id: i for i, post_id in enumerate(post_ids)}
+        matrix, vocabulary, frequency = build_tfidf([f"{row[1] or ''} {row[2] or ''}" for row in rows])
+
+        if not full:
+            reason = self._drift(cursor, len(post_ids), vocabulary, frequency)
+            if reason:
+                logger.info(f"{reason}, rescoring every post")
+                full = True
+
+        if full:
+            neighbours = top_neighbours(matrix, np.arange(len(post_ids)), self.top_k, self.min_score, self.batch_size)
+            dirty = post_ids
+        else:
+            dirty_positions = np.array([position[post_id] for post_id in dirty if post_id in position], dtype=np.int64)
+            neighbours = incremental_neighbours(
+                matrix, dirty_positions, self._referencing(cursor, dirty + gone, position),
+                self._thresholds(cursor, position), self.top_k, self.min_score, self.batch_size
+            )
+
+        self._write(cursor, {
+            post_ids[source]: [(post_ids[target], score) for target, score in related]
+            for source, related in neighbours.items()
+        })
+        execute_values(cursor, """
+            INSERT INTO related_posts_state (post_id, content_hash, computed_at)
+            VALUES %s
+            ON CONFLICT (post_id) DO UPDATE SET
+                content_hash = EXCLUDED.content_hash,
+                computed_at = EXCLUDED.computed_at
+        """, [(post_id, current[post_id][0]) for post_id in dirty if post_id in position and post_id in current],
+            template="(%s, %s, NOW())")
+
+        if full:
+            cursor.execute("""
+                INSERT INTO related_posts_corpus (id, post_count, document_frequency, built_at)
+                VALUES (true, %s, %s, NOW())
+                ON CONFLICT (id) DO UPDATE SET
+                    post_count = EXCLUDED.post_count,
+                    document_frequency = EXCLUDED.document_frequency,
+                    built_at = EXCLUDED.built_at
+            """, (len(post_ids), Json(dict(zip(vocabulary, frequency.tolist())))))
+        return len(neighbours)
+
+    def _drift(self, cursor, documents: int, vocabulary: Dict[str, int],
+               frequency: np.ndarray) -> Optional[str]:
+        """Why the corpus no longer matches the last full build, or None if it still does"""
+        cursor.execute("SELECT post_count, document_frequency FROM related_posts_corpus")
+        row = cursor.fetchone()
+        if row is None:
+            return "No full build recorded"
+        old_documents, old_frequency = row
+        if abs(documents - old_documents) > CORPUS_DRIFT * max(old_documents, 1):
+            return f"Corpus changed from {old_documents} to {documents} posts since the last full build"
+        drift = idf_drift(old_documents, old_frequency, documents, vocabulary, frequency)
+        if drift > IDF_DRIFT:
+            return f"IDF drifted by {drift:.3f} since the last full build"
+        return None
+
+    def _referencing(self, cursor, changed: List[str], position: Dict[str, int]) -> np.ndarray:
+        """Positions of visible posts whose stored list includes a changed or removed post"""
+        cursor.execute("""
+            SELECT DISTINCT post_id FROM related_posts WHERE related_post_id = ANY(%s::uuid[])
+        """, (changed,))
+        return np.array([position[str(row[0])] for row in cursor.fetchall() if str(row[0]) in position],
+                        dtype=np.int64)
+
+    def _thresholds(self, cursor, position: Dict[str, int]) -> np.ndarray:
+        """Per position, the score a new neighbour must beat to enter the stored list"""
+        thresholds = np.full(len(position), -np.inf)
+        cursor.execute("""
+            SELECT post_id, MIN(score) FROM related_posts
+            GROUP BY post_id
+            HAVING COUNT(*) >= %s
+        """, (self.top_k,))
+        for post_id, score in cursor.fetchall():
+            if str(post_id) in position:
+                thresholds[position[str(post_id)]] = score
+        return thresholds
+
+    def _write(self, cursor, neighbours: Dict[str, List[Tuple[str, float]]]):
+        """Replace the stored neighbour lists for the given posts"""
+        if not neighbours:
+            return
+
+        cursor.execute(
+            "DELETE FROM related_posts WHERE post_id = ANY(%s::uuid[])",
+            (sorted(neighbours),)
+        )
+        values = [
+            (post_id, related_id, score, rank)
+            for post_id, related in neighbours.items()
+            for rank, (related_id, score) in enumerate(related, start=1)
+        ]
+        if values:
+            execute_values(cursor, """
+                INSERT INTO related_posts (post_id, related_post_id, score, rank) VALUES %s
+            """, values)
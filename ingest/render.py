@@ -0,0 +1,250 @@
+"""
+Ingest-time Markdown -> HTML rendering
+
+Post bodies are stored as Markdown with \\( ... \\) and $$ ... $$ math, which
+every view would otherwise re-render. Posts are rendered once here, math
+included, into posts.content_html. content_html_hash records the md5 of the
+content (and RENDER_VERSION) the HTML came from, so only new or edited posts
+are rendered again.
+
+Markdown goes through markdown-it with raw HTML escaped and unsafe link
+schemes refused. Math goes through KaTeX in a long-lived Node process per
+worker (katex_render.js), with KaTeX's `trust` left off.
+
+File exports (CSV, shards) never reach Postgres, so HtmlRenderer renders
+their posts in-process as they come out of the pipeline transform.
+"""
+import os
+import json
+import html
+import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from psycopg2.extras import execute_batch
+
+logger = logging.getLogger(__name__)
+
+# Bump after changing the renderer to re-render every post on the next pass
+RENDER_VERSION = '1'
+
+KATEX_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'katex_render.js')
+
+INLINE_MATH_TOKENS = ('math_inline',)
+DISPLAY_MATH_TOKENS = ('math_inline_double', 'math_block', 'math_block_eqno', 'math_block_label')
+
+
+class KatexUnavailable(RuntimeError):
+    """The KaTeX Node process could not be started or died"""
+
+
+class KatexProcess:
+    """A Node process running katex_render.js, answering one expression at a time"""
+
+    def __init__(self, command: str = 'node'):
+        try:
+            self.process = subprocess.Popen(
+                [command, KATEX_SCRIPT],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                text=True, encoding='utf-8', bufsize=1
+            )
+        except OSError as e:
+            raise KatexUnavailable(f"Cannot start {command}: {e}")
+
+    def render(self, tex: str, display: bool = False) -> str:
+        try:
+            self.process.stdin.write(json.dumps({'tex': tex, 'display': display}) + '\n')
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except (BrokenPipeError, ValueError):
+            line = ''
+        if not line:
+            self.process.kill()
+            lines = (self.process.communicate()[1] or '').strip().splitlines()
+            reason = next((text for text in lines if 'Error' in text), lines[-1] if lines else 'no output')
+            raise KatexUnavailable(f"KaTeX process exited: {reason.strip()}")
+
+        reply = json.loads(line)
+        if 'error' in reply:
+            # Keep the source visible rather than dropping the expression
+            logger.debug(f"KaTeX failed on {tex!r}: {reply['error']}")
+            return f'<code class="math-error">{html.escape(tex)}</code>'
+        return reply['html']
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+
+
+def build_markdown(katex: KatexProcess):
+    """markdown-it configured like the web app (GFM tables/strikethrough, TeX math)"""
+    from markdown_it import MarkdownIt
+    from mdit_py_plugins.texmath import texmath_plugin
+    from mdit_py_plugins.dollarmath import dollarmath_plugin
+
+    md = MarkdownIt('commonmark', {'html': False}).enable(['table', 'strikethrough'])
+    texmath_plugin(md, delimiters='brackets')
+    dollarmath_plugin(md, double_inline=True)
+
+    def render_inline(self, tokens, idx, options, env):
+        return katex.render(tokens[idx].content.strip(), display=False)
+
+    def render_display(self, tokens, idx, options, env):
+        return katex.render(tokens[idx].content.strip(), display=True) + '\n'
+
+    for token_type in INLINE_MATH_TOKENS:
+        md.add_render_rule(token_type, render_inline)
+    for token_type in DISPLAY_MATH_TOKENS:
+        md.add_render_rule(token_type, render_display)
+    return md
+
+
+# Per-worker-process state, set up by _init_worker
+_markdown = None
+
+
+def _init_worker(katex_command: str):
+    global _markdown
+    _markdown = build_markdown(KatexProcess(katex_command))
+
+
+def _render_content(content: str) -> Tuple[Optional[str], Optional[str]]:
+    """(html, error) for one post body, run inside a worker process"""
+    try:
+        return _markdown.render(content or ''), None
+    except Exception as e:
+        return None, str(e)
+
+
+class HtmlRenderer:
+    """
+    Renders processed posts in-process for exports that bypass Postgres.
+
+    Without Node/KaTeX the posts are exported without content_html and the
+    web app renders their Markdown itself, as it did before.
+    """
+
+    def __init__(self, katex_command: str = 'node'):
+        self.katex_command = katex_command
+        self.unavailable = False
+        self._katex: Optional[KatexProcess] = None
+        self._markdown = None
+
+    def render(self, content: str) -> Optional[str]:
+        if self.unavailable:
+            return None
+        try:
+            if self._markdown is None:
+                self._katex = KatexProcess(self.katex_command)
+                self._markdown = build_markdown(self._katex)
+            return self._markdown.render(content or '')
+        except (KatexUnavailable, ImportError) as e:
+            logger.warning(f"Cannot render HTML, exporting posts without content_html: {e}")
+            self.unavailable = True
+            return None
+        except Exception as e:
+            logger.error(f"Failed to render post content: {e}")
+            return None
+
+    def wrap(self, transform: Callable[[Dict[str, Any]], Any]) -> Callable[[Dict[str, Any]], Any]:
+        """Wrap the pipeline transform to set content_html on every processed post"""
+        def rendered(thread: Dict[str, Any]):
+            record = transform(thread)
+            if record is not None and record.content:
+                record.content_html = self.render(record.content)
+            return record
+        return rendered
+
+    def close(self):
+        if self._katex:
+            self._katex.close()
+
+
+class ContentRenderer:
+    """Renders posts whose content changed since their HTML was stored"""
+
+    def __init__(self, db, workers: Optional[int] = None, batch_size: int = 200, katex_command: str = 'node'):
+        self.db = db
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.katex_command = katex_command
+        self.errors: List[str] = []
+
+    def update(self, full: bool = False) -> Dict[str, int]:
+        """Render stale posts (or every post with full=True) in a process pool"""
+        probe = KatexProcess(self.katex_command)
+        try:
+            probe.render('x')
+        finally:
+            probe.close()
+
+        stats = {'rendered': 0, 'failed': 0}
+        after = None
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.katex_command,)) as pool:
+            while True:
+                posts = self._stale_posts(after, full)
+                if not posts:
+                    break
+                after = posts[-1]['id']
+
+                results = pool.map(_render_content, [post['content'] for post in posts], chunksize=8)
+                rendered = []
+                for post, (content_html, error) in zip(posts, results):
+                    if error is not None:
+                        stats['failed'] += 1
+                        error_msg = f"Failed to render post {post['ed_post_id']}: {error}"
+                        logger.error(error_msg)
+                        self.errors.append(error_msg)
+                    else:
+                        rendered.append((post, content_html))
+
+                self._store(rendered)
+                stats['rendered'] += len(rendered)
+
+        if stats['rendered'] or stats['failed']:
+            logger.info(f"Rendered post content: {stats}")
+        return stats
+
+    def _stale_posts(self, after: Optional[str], full: bool) -> List[Dict[str, Any]]:
+        """Next batch of posts, in id order, whose stored HTML does not match their content"""
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, posted_at, ed_post_id, content, md5(%s || coalesce(content, ''))
+                    FROM posts
+                    WHERE (%s OR content_html_hash IS DISTINCT FROM md5(%s || coalesce(content, '')))
+                      AND (%s::uuid IS NULL OR id > %s::uuid)
+                    ORDER BY id
+                    LIMIT %s
+                """, (RENDER_VERSION, full, RENDER_VERSION, after, after, self.batch_size))
+                rows = cursor.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [
+            {'id': str(row[0]), 'posted_at': row[1], 'ed_post_id': row[2], 'content': row[3], 'hash': row[4]}
+            for row in rows
+        ]
+
+    def _store(self, rendered: List[Tuple[Dict[str, Any], str]]):
+        """Store HTML, skipping posts whose content was edited while they were being rendered"""
+        if not rendered:
+            return
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cursor:
+                execute_batch(cursor, """
+                    UPDATE posts SET content_html = %s, content_html_hash = %s
+                    WHERE id = %s AND posted_at = %s AND md5(%s || coalesce(content, '')) = %s
+                """, [
+                    (content_html, post['hash'], post['id'], post['posted_at'], RENDER_VERSION, post['hash'])
+                    for post, content_html in rendered
+                ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
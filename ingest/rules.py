@@ -0,0 +1,101 @@
+"""
+Participation rules compiled into reusable predicates
+
+site_config.participation_rules decides which Ed threads are participation
+posts:
+
+- title_patterns: case-insensitive substrings of the title
+- allowed_categories: Ed categories whose threads qualify regardless of title
+- keywords: case-insensitive substrings of title + content; only enforced
+  when require_keywords is true, since the default list doubles as topic hints
+
+A thread qualifies when it matches a title pattern or an allowed category,
+and, if required, at least one keyword. The same rules compile to a Python
+predicate for fetched threads and a SQL predicate for stored posts (prune).
+"""
+import re
+from typing import Dict, List, Any, Optional, Tuple
+
+DEFAULT_TITLE_PATTERNS = ['participation d']
+
+
+def _alternation(values: List[str]) -> Optional['re.Pattern']:
+    values = [value.lower() for value in values if value]
+    if not values:
+        return None
+    return re.compile('|'.join(re.escape(value) for value in values))
+
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so patterns are matched literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _category_name(thread: Dict[str, Any]) -> str:
+    """Category as stored in posts.category by PostProcessor"""
+    value = thread.get('category') or thread.get('folder')
+    if isinstance(value, dict):
+        value = value.get('name')
+    return value.lower() if isinstance(value, str) else ''
+
+
+class ParticipationRules:
+    """Participation rules compiled once into title, category and keyword matchers"""
+
+    def __init__(self, rules: Dict[str, Any]):
+        self.title_patterns = [p.lower() for p in (rules.get('title_patterns') or DEFAULT_TITLE_PATTERNS)]
+        self.categories = {c.lower() for c in rules.get('allowed_categories') or []}
+        self.require_keywords = bool(rules.get('require_keywords')) and bool(rules.get('keywords'))
+        self.keywords = [k.lower() for k in rules.get('keywords') or []] if self.require_keywords else []
+
+        self._title_re = _alternation(self.title_patterns)
+        self._keyword_re = _alternation(self.keywords)
+
+    def matches_listing(self, thread: Dict[str, Any]) -> bool:
+        """
+        Cheap check on fields present in Ed's thread listing (title, category).
+
+        Run before a thread is converted, so non-participation threads never
+        reach the transform.
+        """
+        title = (thread.get('title') or thread.get('subject') or '').lower()
+        if title and self._title_re.search(title):
+            return True
+        return _category_name(thread) in self.categories
+
+    def matches_content(self, title: str, content: str) -> bool:
+        """Keyword requirement on title + content (always true unless require_keywords is set)"""
+        if self._keyword_re is None:
+            return True
+        return self._keyword_re.search(f"{title} {content}".lower()) is not None
+
+    def matches(self, thread: Dict[str, Any]) -> bool:
+        """Full predicate for a raw Ed thread"""
+        if not self.matches_listing(thread):
+            return False
+        return self.matches_content(
+            thread.get('title') or thread.get('subject') or '',
+            thread.get('content') or thread.get('body') or thread.get('text') or ''
+        )
+
+    def sql_predicate(self, alias: str = 'posts') -> Tuple[str, List[Any]]:
+        """
+        SQL predicate over stored posts equivalent to matches().
+
+        Title patterns are matched against LOWER(title), which lets Postgres
+        answer each LIKE from the trigram expression index.
+        """
+        clauses = [f"LOWER({alias}.title) LIKE %s" for _ in self.title_patterns]
+        params: List[Any] = [f"%{_escape_like(pattern)}%" for pattern in self.title_patterns]
+        if self.categories:
+            clauses.append(f"LOWER(COALESCE({alias}.category, '')) = ANY(%s)")
+            params.append(sorted(self.categories))
+        sql = f"({' OR '.join(clauses)})"
+
+        if self.keywords:
+            sql += (
+                f" AND LOWER(COALESCE({alias}.title, '') || ' ' || COALESCE({alias}.content, ''))"
+                f" LIKE ANY(%s)"
+            )
+            params.append([f"%{_escape_like(keyword)}%" for keyword in self.keywords])
+        return sql, params
@@ -0,0 +1,227 @@
+"""
+Static JSON shards for the web read path
+
+Renders the hot browse queries (first pages sorted newest/oldest, per-topic
+and per-student lists, per-post details) as JSON documents shaped like the
+/api/posts responses. Each document is written under a content-hashed
+filename next to precompressed .gz/.br copies, so it can be served from disk
+or a CDN with immutable cache headers. manifest.json maps query keys to the
+current files and is the only file that needs revalidation.
+"""
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Callable
+from urllib.parse import urlparse
+
+from pipeline import Sink
+from records import Post
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# Top-level directories build_shards writes into; stale-file cleanup never leaves them
+SHARD_DIRECTORIES = ('newest', 'oldest', 'tag', 'student', 'post')
+
+
+def shard_key(*parts: Any) -> str:
+    """Manifest key for a query, e.g. shard_key('tag', 'Muon', 1) -> 'tag/muon/1'"""
+    return '/'.join(str(part).strip().lower() for part in parts)
+
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-') or 'x'
+
+
+def _brotli_compress() -> Optional[Callable[[bytes], bytes]]:
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return lambda data: brotli.compress(data, quality=11)
+
+
+def _posted_timestamp(post: Dict[str, Any]) -> float:
+    try:
+        return datetime.fromisoformat(post['posted_at'].replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return float('-inf')
+
+
+def to_api_post(record: Post) -> Dict[str, Any]:
+    """Shape a processed post like the /api/posts response items"""
+    return {
+        'id': str(record.ed_post_id),
+        'ed_post_id': str(record.ed_post_id),
+        'title': record.title,
+        'content': record.content,
+        'content_html': record.content_html,
+        'author': {'display_name': record.author.display_name if record.author else 'Unknown'},
+        'posted_at': record.posted_at.isoformat() if record.posted_at else '',
+        'url': record.url or '',
+        'links': [
+            {
+                'id': link.url,
+                'url': link.url,
+                'link_type': link.link_type or 'other',
+                'domain': link.domain or urlparse(link.url).netloc or link.url,
+            }
+            for link in record.links
+        ],
+        'attachments': [
+            {'id': att.filename, 'filename': att.filename}
+            for att in record.attachments if att.filename
+        ],
+        'tags': list(record.topics),
+    }
+
+
+class ShardWriter:
+    """Writes content-hashed, precompressed JSON documents and their manifest"""
+
+    def __init__(self, output_dir: str, hash_length: int = 12):
+        self.output_dir = output_dir
+        self.hash_length = hash_length
+        # name.<hash>.json and its precompressed copies, as written by write()
+        self.shard_pattern = re.compile(rf'^[\w-]+\.[0-9a-f]{{{hash_length}}}\.json(\.gz|\.br)?$')
+        self._check_output_dir()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.brotli = _brotli_compress()
+        if self.brotli is None:
+            logger.warning("brotli not installed; writing gzip shards only")
+
+    def write(self, key: str, document: Any, directory: str, name: str):
+        """Write one document under a hashed filename and register it in the manifest"""
+        body = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        relative_path = f"{directory}/{name}.{digest[:self.hash_length]}.json"
+        path = os.path.join(self.output_dir, relative_path)
+
+        # Identical content keeps its filename, so unchanged shards are left alone
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_file(path, body)
+            self._write_file(f"{path}.gz", gzip.compress(body, compresslevel=9, mtime=0))
+            if self.brotli:
+                self._write_file(f"{path}.br", self.brotli(body))
+
+        self.entries[key] = {'path': relative_path, 'bytes': len(body), 'sha256': digest}
+
+    def finish(self) -> Dict[str, Any]:
+        """Atomically publish the manifest, then delete shards it no longer references"""
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'encodings': ['gzip'] + (['br'] if self.brotli else []),
+            'entries': dict(sorted(self.entries.items())),
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._write_file(
+            os.path.join(self.output_dir, MANIFEST_NAME),
+            json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+        )
+        self._remove_stale()
+        return manifest
+
+    def _check_output_dir(self):
+        """Refuse a directory that holds anything but an earlier shard export"""
+        if not os.path.isdir(self.output_dir) or os.path.exists(os.path.join(self.output_dir, MANIFEST_NAME)):
+            return
+        foreign = sorted(name for name in os.listdir(self.output_dir)
+                         if name not in SHARD_DIRECTORIES and name != f"{MANIFEST_NAME}.tmp")
+        if foreign:
+            raise ValueError(
+                f"{self.output_dir} has no {MANIFEST_NAME} but holds other files ({', '.join(foreign[:5])}); "
+                f"shards need a directory of their own"
+            )
+
+    def _remove_stale(self):
+        """Delete shard files the manifest no longer references, leaving anything else alone"""
+        live = set()
+        for entry in self.entries.values():
+            path = os.path.join(self.output_dir, entry['path'])
+            live.update({path, f"{path}.gz", f"{path}.br"})
+
+        for directory in SHARD_DIRECTORIES:
+            for root, _, files in os.walk(os.path.join(self.output_dir, directory)):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    if path not in live and self.shard_pattern.match(filename):
+                        os.remove(path)
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class ShardSink(Sink):
+    """Pipeline sink that renders static shards once all posts have arrived"""
+    name = 'shards'
+
+    def __init__(self, output_dir: str, page_size: int = 20, pages: int = 5,
+                 batch_size: int = 500, queue_size: int = 1000):
+        super().__init__(batch_size=batch_size, queue_size=queue_size)
+        self.output_dir = output_dir
+        self.page_size = page_size
+        self.pages = pages
+        self.posts: List[Dict[str, Any]] = []
+
+    def write_batch(self, records: List[Post]):
+        self.posts.extend(to_api_post(record) for record in records)
+
+    def close(self):
+        manifest = build_shards(self.posts, self.output_dir, page_size=self.page_size, pages=self.pages)
+        self.stats['written'] = len(self.posts)
+        logger.info(f"Wrote {len(manifest['entries'])} shards to {self.output_dir}")
+
+
+def build_shards(posts: List[Dict[str, Any]], output_dir: str, page_size: int = 20,
+                 pages: int = 5) -> Dict[str, Any]:
+    """Render list pages and post details for API-shaped posts and publish a manifest"""
+    writer = ShardWriter(output_dir)
+    newest = sorted(posts, key=_posted_timestamp, reverse=True)
+
+    def write_pages(prefix: List[str], directory: str, ordered: List[Dict[str, Any]], limit: Optional[int]):
+        page_count = max(1, -(-len(ordered) // page_size))
+        if limit is not None:
+            page_count = min(page_count, limit)
+        for page in range(1, page_count + 1):
+            start = (page - 1) * page_size
+            document = {
+                'posts': ordered[start:start + page_size],
+                'total': len(ordered),
+                'page': page,
+                'page_size': page_size,
+            }
+            writer.write(shard_key(*prefix, page), document, directory, f"page-{page}")
+
+    write_pages(['newest'], 'newest', newest, pages)
+    write_pages(['oldest'], 'oldest', newest[::-1], pages)
+
+    by_tag: Dict[str, List[Dict[str, Any]]] = {}
+    by_student: Dict[str, List[Dict[str, Any]]] = {}
+    for post in newest:
+        for tag in post['tags']:
+            by_tag.setdefault(tag, []).append(post)
+        name = post['author']['display_name']
+        if name:
+            by_student.setdefault(name.strip().lower(), []).append(post)
+
+    # Per-tag and per-student lists are small, so every page is materialised
+    for tag, tagged in by_tag.items():
+        write_pages(['tag', tag], f"tag/{_slug(tag)}", tagged, None)
+    for name, authored in by_student.items():
+        write_pages(['student', name], f"student/{_slug(name)}", authored, None)
+
+    for post in posts:
+        writer.write(shard_key('post', post['id']), post, 'post', post['id'])
+
+    return writer.finish()
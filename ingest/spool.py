@@ -0,0 +1,246 @@
+"""
+Durable local spool between fetching and Postgres
+
+Processed posts are appended to segmented JSONL files (one Post.to_spool()
+array per line) and fsynced before a fetch is considered done. A drainer
+loads the spool into Postgres and checkpoints the (segment, offset) it
+reached, so a slow or unavailable database never stalls fetching and nothing
+is lost across outages or restarts. Replays after a crash are safe because every write is an upsert.
+"""
+import os
+import json
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Iterator, Optional, Tuple
+
+from pipeline import Sink, PostgresSink
+from records import Post
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+CHECKPOINT_NAME = 'checkpoint.json'
+LOCK_NAME = 'spool.lock'
+# Posts per COPY batch when draining in bulk mode
+BULK_BATCH_SIZE = 5000
+
+# (segment number, byte offset within that segment)
+Position = Tuple[int, int]
+
+
+class Spool:
+    """Append-only segmented JSONL log with a durable read checkpoint"""
+
+    def __init__(self, directory: str, segment_max_bytes: int = 8 * 1024 * 1024):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, records: List[Post]):
+        """Append records and fsync them before returning"""
+        if not records:
+            return
+
+        data = ''.join(
+            json.dumps(record.to_spool(), ensure_ascii=False, separators=(',', ':')) + '\n' for record in records
+        ).encode('utf-8')
+
+        with self._lock():
+            segment = self._active_segment(len(data))
+            with open(self._segment_path(segment), 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self, start: Position) -> Iterator[Tuple[Post, Position]]:
+        """Yield (record, position after it) for every complete record from `start`"""
+        start_segment, start_offset = start
+        for segment in self.segments():
+            if segment < start_segment:
+                continue
+
+            offset = start_offset if segment == start_segment else 0
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn write from a crash mid-append; it was never acknowledged
+                        break
+                    offset += len(line)
+                    yield Post.from_spool(json.loads(line)), (segment, offset)
+
+    def load_checkpoint(self) -> Position:
+        """Position up to which records have been drained"""
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_NAME)) as f:
+                checkpoint = json.load(f)
+            return checkpoint['segment'], checkpoint['offset']
+        except FileNotFoundError:
+            segments = self.segments()
+            return (segments[0] if segments else 1), 0
+
+    def save_checkpoint(self, position: Position):
+        """Durably record the drained position and drop fully drained segments"""
+        path = os.path.join(self.directory, CHECKPOINT_NAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': position[0], 'offset': position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        with self._lock():
+            for segment in self.segments():
+                if segment < position[0]:
+                    os.remove(self._segment_path(segment))
+
+    def pending(self) -> int:
+        """Number of spooled records not yet drained"""
+        return sum(1 for _ in self.read(self.load_checkpoint()))
+
+    def segments(self) -> List[int]:
+        numbers = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX):
+                numbers.append(int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+
+    def _active_segment(self, incoming_bytes: int) -> int:
+        segments = self.segments()
+        if not segments:
+            return self.load_checkpoint()[0]
+
+        segment = segments[-1]
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        if size and size + incoming_bytes > self.segment_max_bytes:
+            return segment + 1
+
+        if size:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                # Never append after a torn record; start a fresh segment instead
+                if f.read(1) != b'\n':
+                    return segment + 1
+        return segment
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:012d}{SEGMENT_SUFFIX}")
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.directory, LOCK_NAME), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SpoolSink(Sink):
+    """Pipeline sink that appends processed posts to the spool"""
+    name = 'spool'
+
+    def __init__(self, spool: Spool, batch_size: int = 100, queue_size: int = 1000):
+        super().__init__(batch_size=batch_size, queue_size=queue_size)
+        self.spool = spool
+
+    def write_batch(self, records: List[Post]):
+        self.spool.append(records)
+        self.stats['written'] += len(records)
+
+
+class SpoolDrainer:
+    """Loads spooled posts into Postgres, checkpointing after each batch"""
+
+    def __init__(self, spool: Spool, db, batch_size: Optional[int] = None, bulk: bool = False):
+        self.spool = spool
+        self.db = db
+        self.bulk = bulk
+        self.batch_size = batch_size or (BULK_BATCH_SIZE if bulk else 100)
+        self.errors: List[str] = []
+        # Set when the database was or became unreachable, leaving records spooled
+        self.interrupted = False
+        self.stats = {'drained': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+
+    def drain(self) -> Dict[str, int]:
+        """
+        Drain everything after the checkpoint.
+
+        Stops early, keeping the checkpoint before the failed batch, if the
+        database becomes unreachable; a record that fails while the database
+        is healthy is logged and skipped so it cannot block the spool.
+        """
+        if not self.db.is_available():
+            logger.warning("Database unavailable; leaving spool for a later drain")
+            self.interrupted = True
+            return self.stats
+
+        sink = PostgresSink(self.db)
+        sink.open()
+
+        batch: List[Tuple[Post, Position]] = []
+        for entry in self.spool.read(self.spool.load_checkpoint()):
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                if not self._load_batch(sink, batch):
+                    break
+                batch = []
+        else:
+            if batch:
+                self._load_batch(sink, batch)
+
+        if self.stats['drained']:
+            logger.info(f"Drained spool: {self.stats}")
+        return self.stats
+
+    def _load_batch(self, sink: PostgresSink, batch: List[Tuple[Post, Position]]) -> bool:
+        """Load one batch and checkpoint past whatever was handled; False if the database went away"""
+        if self.bulk and self._load_bulk(sink, [record for record, _ in batch]):
+            self.stats['drained'] += len(batch)
+            self.spool.save_checkpoint(batch[-1][1])
+            return True
+
+        # Row-by-row, also used to isolate a bad record after a failed bulk load
+        position = None
+        for record, next_position in batch:
+            status = sink.write_record(record)
+            if status is None:
+                if not self.db.is_available():
+                    logger.warning("Database became unavailable; stopping drain")
+                    self.interrupted = True
+                    if position:
+                        self.spool.save_checkpoint(position)
+                    return False
+                self.stats['failed'] += 1
+                error_msg = f"Failed to load spooled post {record.ed_post_id}"
+                logger.error(error_msg)
+                self.errors.append(error_msg)
+            else:
+                self.stats[status] += 1
+            self.stats['drained'] += 1
+            position = next_position
+
+        self.spool.save_checkpoint(position)
+        return True
+
+    def _load_bulk(self, sink: PostgresSink, records: List[Post]) -> bool:
+        visible = []
+        for record in records:
+            if sink.is_hidden(record):
+                self.stats['skipped'] += 1
+            else:
+                visible.append(record)
+
+        try:
+            result = self.db.bulk_upsert_posts(visible) if visible else {}
+        except Exception as e:
+            logger.warning(f"Bulk load failed, retrying batch row by row: {e}")
+            self.stats['skipped'] -= len(records) - len(visible)
+            return False
+
+        for key, count in result.items():
+            self.stats[key] += count
+        return True
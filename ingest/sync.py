@@ -2,18 +2,24 @@
 """
 Main ingestion sync script for EdThing
 """
+import os
 import time
+import uuid
 import logging
+import threading
 import click
-from datetime import datetime, timedelta
-import schedule
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterable, Optional
 
 # Note: this file is executed as a top-level module inside the container,
 # so we use absolute imports instead of package-relative imports.
-from config import config
+from config import config, DEFAULT_PARTICIPATION_RULES
 from db import Database
-from processor import PostProcessor
+from processor import PostProcessor, extract_topics, extract_homework_number
+from pipeline import Pipeline, EdThreadSource, EdThreadIdSource, build_sink
+from prune import prune_posts
+from spool import Spool, SpoolSink, SpoolDrainer
+from partitions import terms_between, partition_sizes, archive_term
 
 # Set up logging
 logging.basicConfig(
@@ -23,35 +29,41 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class EdStemIngestor:
-    def __init__(self):
+    def __init__(self, profile: bool = False, profile_top: int = 10):
         self.db = Database(config.database_url)
+        # Write cProfile/tracemalloc artifacts for every run
+        self.profile = profile or config.profile
+        self.profile_top = profile_top
         self.processor = None
+        # False while the processor runs on default rules because Postgres was down
+        self.rules_loaded = False
         self.last_sync = None
+        self._ed = None
+        # Scheduled and push-triggered syncs share one database connection
+        self._lock = threading.Lock()
 
     def initialize(self):
-        """Initialize the ingestor with current rules"""
-        conn = self.db.connect()
+        """Initialize the ingestor with current rules, or the default rules while Postgres is unreachable"""
+        try:
+            conn = self.db.connect()
+        except Exception as e:
+            logger.warning(f"Database unavailable, initializing with default participation rules: {e}")
+            self.processor = PostProcessor(DEFAULT_PARTICIPATION_RULES)
+            self.rules_loaded = False
+            return
+
         try:
             rules = config.get_participation_rules(conn)
             self.processor = PostProcessor(rules)
+            self.rules_loaded = True
             self.last_sync = self.db.get_last_ingestion_time()
             logger.info(f"Initialized with last sync: {self.last_sync}")
         finally:
             conn.close()
 
-    def sync_posts(self, since: Optional[datetime] = None, manual: bool = False) -> dict:
-        """Sync posts from EdStem"""
-        if not self.processor:
-            self.initialize()
-
-        run_id = self.db.start_ingestion_run()
-        stats = {'processed': 0, 'created': 0, 'updated': 0}
-        errors = []
-
-        try:
-            # Use the official edapi client for Ed API integration
-            from edapi import EdAPI
-
+    def sync_posts(self, since: Optional[datetime] = None, manual: bool = False, bulk: bool = False) -> dict:
+        """Sync posts from EdStem; `bulk` loads the spool with COPY (large initial imports)"""
+        def source(ed):
             # Get posts since last sync or specified time
             since_time = since or self.last_sync
             if since_time:
@@ -63,91 +75,267 @@ class EdStemIngestor:
 
             logger.info(f"Syncing posts since {since_time or '30 days ago'}")
 
-            # Initialize Ed API using ED_API_TOKEN from environment
-            ed = EdAPI()
-            ed.login()
-
             course_id = int(config.ed_course_id)
             logger.info(f"Fetching threads from EdAPI for course {course_id}")
-            threads = ed.list_threads(course_id=course_id, limit=100, offset=0, sort="new")
-            logger.info(f"Fetched {len(threads)} threads from EdAPI for course {course_id}")
-
-            hidden_posts = self.db.get_hidden_posts()
-            hidden_students = self.db.get_hidden_students()
-
-            participation_candidates = 0
-            stored_posts = 0
-
-            for thread in threads:
-                try:
-                    stats['processed'] += 1
-
-                    # Skip hidden posts
-                    if thread['id'] in hidden_posts:
-                        continue
-
-                    # Process the post
-                    processed_post = self.processor.process_post(thread)
-                    if not processed_post:
-                        # Debug: log a small sample of skipped threads for visibility
-                        if stats['processed'] <= 5:
-                            logger.info(
-                                "Thread %s skipped by participation filter; title=%r",
-                                thread.get('id'),
-                                thread.get('title') or thread.get('subject')
-                            )
-                        continue
-
-                    participation_candidates += 1
-
-                    # Skip posts by hidden students
-                    if processed_post.get('author_info', {}).get('ed_user_id') in hidden_students:
-                        continue
-
-                    # Upsert author if present
-                    author_info = processed_post.get('author_info')
-                    if author_info:
-                        author_id = self.db.upsert_student(
-                            author_info['ed_user_id'],
-                            author_info['display_name'],
-                            author_info.get('email')
-                        )
-                        processed_post['author_id'] = author_id
-
-                    # Upsert the post
-                    if self.db.upsert_post(processed_post):
-                        stats['created'] += 1
-                        stored_posts += 1
-                    else:
-                        stats['updated'] += 1
-
-                    # Rate limiting
-                    time.sleep(0.1)
-
-                except Exception as e:
-                    error_msg = f"Failed to process thread {thread.get('id')}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
+            return EdThreadSource(ed, course_id, max_threads=100)
+
+        with self._lock:
+            return self._ingest(source, manual=manual, bulk=bulk)
+
+    def sync_threads(self, thread_ids: Iterable[int]) -> dict:
+        """Targeted sync of specific threads, e.g. ones reported changed by a push event"""
+        def source(ed):
+            course_id = int(config.ed_course_id)
+            thread_source = EdThreadIdSource(ed, course_id, thread_ids)
+            logger.info(f"Syncing threads {thread_source.thread_ids} for course {course_id}")
+            return thread_source
+
+        # The caller says these threads changed, so skip the stored-version check
+        with self._lock:
+            return self._ingest(source, manual=True)
+
+    def retry_failed(self, limit: int = 100, include_dead: bool = False) -> dict:
+        """Re-fetch and reprocess dead-lettered threads whose retry is due, without a full sync"""
+        # The lookup and the clear commit on the shared connection too, so they
+        # must not interleave with a push-triggered sync's transaction
+        with self._lock:
+            due = self.db.get_due_failed_threads(limit, include_dead=include_dead)
+            if not due:
+                return {'retried': 0, 'recovered': 0}
+
+            def source(ed):
+                course_id = int(config.ed_course_id)
+                logger.info(f"Retrying {len(due)} failed threads for course {course_id}")
+                return EdThreadIdSource(ed, course_id, due)
+
+            stats = self._ingest(source, manual=True)
+            # Threads that did not fail again were stored, or no longer qualify
+            recovered = self.db.clear_failed_threads(due)
+        return {**stats, 'retried': len(due), 'recovered': recovered}
+
+    def _ingest(self, make_source: Callable[[Any], Iterable[dict]], manual: bool = False, bulk: bool = False) -> dict:
+        """
+        Fetch threads from `make_source(ed)` into the spool, then drain it into Postgres and refresh derived data.
+
+        Fetching never waits on Postgres: if it is down, threads are spooled
+        without the stored-version check and stay there until a later drain,
+        and the run is only recorded once a drain has reached the database.
+        """
+        if not self.processor or not self.rules_loaded:
+            self.initialize()
+
+        run_id = str(uuid.uuid4())
+        started_at = datetime.now(timezone.utc)
+        stats = {'processed': 0, 'created': 0, 'updated': 0, 'unchanged': 0}
+        errors = []
+        drained = failed = False
+
+        profiler = None
+        if self.profile:
+            from profiling import RunProfiler
+            profiler = RunProfiler(os.path.join(config.profile_dir, run_id), top_threads=self.profile_top)
+            profiler.start()
+
+        try:
+            config.validate()
+            source = make_source(self._ed_client())
+
+            # Stored Ed edit timestamps; threads that haven't changed are skipped
+            # unless this is a manual sync. Hidden posts are also dropped when the
+            # spool is drained, so both lookups are only an optimization.
+            try:
+                hidden_posts = self.db.get_hidden_posts()
+                known_versions = {} if manual else self.db.get_post_versions()
+            except Exception as e:
+                logger.warning(f"Database unavailable, spooling without version filtering: {e}")
+                hidden_posts, known_versions = set(), {}
+
+            # Fetching only waits on the local spool; Postgres is loaded by the drain below
+            spool = Spool(config.spool_dir)
+            sink = SpoolSink(spool)
+
+            def is_new_version(thread: dict) -> bool:
+                if thread['id'] in hidden_posts:
+                    return False
+                version = self.processor.get_updated_at(thread)
+                if version is not None and known_versions.get(thread['id']) == version:
+                    stats['unchanged'] += 1
+                    return False
+                return True
+
+            transform = self.processor.process_post
+            if profiler:
+                transform = profiler.time_threads(transform)
+
+            # The cheap title/category rules run first, so other threads are never checked or converted
+            pipeline = Pipeline(source, transform, [sink],
+                                filters=[self.processor.participation.matches_listing, is_new_version])
+            result = pipeline.run()
+            errors.extend(getattr(source, 'errors', []))
+            errors.extend(pipeline.errors)
+
+            stats['processed'] = result['fetched']
+
+            # Also picks up anything left spooled by earlier runs
+            drainer = SpoolDrainer(spool, self.db, bulk=bulk)
+            drain_stats = drainer.drain()
+            errors.extend(drainer.errors)
+            for key in ('created', 'updated', 'unchanged'):
+                stats[key] += drain_stats[key]
 
             logger.info(
-                "Sync completed: %s, participation_candidates=%d, stored_posts=%d",
+                "Sync completed: %s, participation_candidates=%d, spooled_posts=%d, pending_in_spool=%d",
                 stats,
-                participation_candidates,
-                stored_posts,
+                result['matched'],
+                sink.stats['written'],
+                spool.pending(),
             )
 
+            if drainer.interrupted:
+                logger.warning("Database unavailable; fetched posts stay spooled until the next drain")
+                return stats
+            drained = True
+
+            # Store failures are dead-lettered by upsert_post itself
+            self.db.record_failed_threads(
+                [(thread_id, 'fetch', e) for thread_id, e in getattr(source, 'failures', [])]
+                + [(thread_id, 'process', e) for thread_id, e in pipeline.failures]
+            )
+
+            if stats['created'] or stats['updated']:
+                errors.extend(self.refresh_derived())
+
         except Exception as e:
             error_msg = f"Sync failed: {str(e)}"
             logger.error(error_msg)
             errors.append(error_msg)
+            failed = True
             raise
         finally:
-            self.db.complete_ingestion_run(run_id, stats, errors)
+            if profiler:
+                profiler.stop()
+            # Posts left spooled by an outage are counted by the run that drains them
+            if drained or (failed and self.db.is_available()):
+                self._record_run(run_id, started_at, stats, errors, profiler)
 
         return stats
 
+    def _record_run(self, run_id: str, started_at: datetime, stats: dict, errors: list, profiler=None):
+        """Write a finished run to ingestion_runs; failures are logged, not raised"""
+        try:
+            self.db.start_ingestion_run(run_id, started_at)
+            if profiler:
+                self.db.record_run_profile(run_id, profiler.output_dir, profiler.summary())
+            self.db.complete_ingestion_run(run_id, stats, errors)
+        except Exception as e:
+            logger.error(f"Failed to record ingestion run {run_id}: {e}")
+
+    def refresh_derived(self) -> list:
+        """Update related posts, pre-rendered HTML and analytics rollups after posts changed, returning errors"""
+        errors = []
+        try:
+            # NumPy/SciPy are only imported when there is something to score
+            from related import RelatedPostsIndex
+            RelatedPostsIndex(self.db).update()
+        except Exception as e:
+            error_msg = f"Related posts update failed: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+
+        try:
+            self.render_content()
+        except Exception as e:
+            error_msg = f"Content rendering failed: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+
+        try:
+            self.update_rollups()
+        except Exception as e:
+            error_msg = f"Analytics rollup update failed: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+        return errors
+
+    def update_rollups(self, full: bool = False) -> dict:
+        """Merge changed posts into the dashboard's daily rollup tables"""
+        from analytics import AnalyticsRollups
+        return AnalyticsRollups(self.db, timezone=config.analytics_timezone).update(full=full)
+
+    def job_tasks(self, queue):
+        """Queue job handlers sharing this ingestor's database, rules and Ed client"""
+        from tasks import IngestTasks
+
+        if not self.processor:
+            self.initialize()
+        config.validate()
+
+        def refresh():
+            errors = self.refresh_derived()
+            if errors:
+                raise RuntimeError('; '.join(errors))
+
+        return IngestTasks(
+            self.db, queue,
+            # Link titles are fetched by separate enrich_links jobs
+            PostProcessor(self.processor.rules, fetch_link_titles=False),
+            self._ed_client, int(config.ed_course_id),
+            attachments_dir=config.attachments_dir, refresh=refresh,
+        )
+
+    def _ed_client(self):
+        """Logged-in Ed API client, reused across syncs"""
+        if self._ed is None:
+            # Use the official edapi client for Ed API integration
+            from edapi import EdAPI
+
+            # Initialize Ed API using ED_API_TOKEN from environment
+            ed = EdAPI()
+            ed.login()
+            self._ed = ed
+        return self._ed
+
+    def render_content(self, full: bool = False) -> dict:
+        """Pre-render Markdown/KaTeX HTML for new and edited posts"""
+        from render import ContentRenderer, KatexUnavailable
+
+        renderer = ContentRenderer(self.db, workers=config.render_workers, katex_command=config.katex_command)
+        try:
+            return renderer.update(full=full)
+        except KatexUnavailable as e:
+            # Pages fall back to rendering Markdown themselves; not worth failing a sync over
+            logger.warning(f"Skipping content rendering, KaTeX is unavailable: {e}")
+            return {'rendered': 0, 'failed': 0}
+
+    def start_trigger_server(self):
+        """Serve push events ("thread X changed", "sync now") alongside the schedule"""
+        if not config.trigger_port:
+            return None
+        if not config.sync_secret:
+            logger.warning("SYNC_SECRET is not set; push-triggered sync endpoint disabled")
+            return None
+
+        from trigger import TriggerServer
+
+        def triggered_sync(thread_ids: set, full: bool):
+            if full:
+                self.sync_posts()
+            else:
+                self.sync_threads(thread_ids)
+
+        server = TriggerServer(
+            triggered_sync, config.sync_secret,
+            host=config.trigger_host, port=config.trigger_port,
+            debounce_seconds=config.trigger_debounce_seconds,
+            max_wait_seconds=config.trigger_max_wait_seconds,
+        )
+        server.start()
+        return server
+
     def run_continuous(self):
         """Run continuous ingestion"""
+        import schedule
+
         logger.info("Starting continuous ingestion...")
 
         def sync_job():
@@ -156,8 +344,27 @@ class EdStemIngestor:
             except Exception as e:
                 logger.error(f"Sync job failed: {e}")
 
+            try:
+                self.retry_failed()
+            except Exception as e:
+                logger.error(f"Retry of failed threads failed: {e}")
+
+        def retention_job():
+            try:
+                from changes import ChangeFeed
+
+                with self._lock:
+                    deleted = self.db.prune_ingestion_runs(config.ingestion_runs_retention_days)
+                    changes_deleted = ChangeFeed(self.db).prune(config.ingestion_runs_retention_days)
+                logger.info(f"Pruned {deleted} old ingestion runs and {changes_deleted} consumed post changes")
+            except Exception as e:
+                logger.error(f"Retention job failed: {e}")
+
         # Schedule sync every configured interval
         schedule.every(config.sync_interval_minutes).minutes.do(sync_job)
+        schedule.every().day.do(retention_job)
+
+        self.start_trigger_server()
 
         # Run initial sync
         sync_job()
@@ -174,12 +381,19 @@ def cli():
 @cli.command()
 @click.option('--since', type=click.DateTime(), help='Sync posts since this datetime')
 @click.option('--manual', is_flag=True, help='Manual sync (ignore last sync time)')
-def sync(since, manual):
+@click.option('--bulk', is_flag=True, help='Load posts with COPY and set-based merges (large imports)')
+@click.option('--thread', 'thread_ids', type=int, multiple=True, help='Only sync this Ed thread ID (repeatable)')
+@click.option('--profile', is_flag=True, help='Write cProfile/tracemalloc artifacts to PROFILE_DIR/<run id>')
+@click.option('--profile-top', default=10, show_default=True, help='Slowest threads to report when profiling')
+def sync(since, manual, bulk, thread_ids, profile, profile_top):
     """Sync posts from EdStem"""
-    ingestor = EdStemIngestor()
+    ingestor = EdStemIngestor(profile=profile, profile_top=profile_top)
     try:
         ingestor.initialize()
-        stats = ingestor.sync_posts(since=since, manual=manual)
+        if thread_ids:
+            stats = ingestor.sync_threads(thread_ids)
+        else:
+            stats = ingestor.sync_posts(since=since, manual=manual, bulk=bulk)
         click.echo(f"Sync completed: {stats}")
     except Exception as e:
         click.echo(f"Sync failed: {e}", err=True)
@@ -188,9 +402,375 @@ def sync(since, manual):
         ingestor.db.close()
 
 @cli.command()
-def continuous():
-    """Run continuous ingestion"""
+@click.option('--dry-run', is_flag=True, help='Only count posts that would be pruned')
+@click.option('--batch-size', default=500, show_default=True, help='Posts scanned per transaction')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches')
+def prune(dry_run, batch_size, pause):
+    """Remove posts that no longer match the participation rules"""
+    db = Database(config.database_url)
+    try:
+        conn = db.connect()
+        rules = config.get_participation_rules(conn)
+        result = prune_posts(conn, rules, batch_size=batch_size, dry_run=dry_run, pause_seconds=pause)
+        click.echo(f"Prune completed: {result}")
+    except Exception as e:
+        click.echo(f"Prune failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--all', 'include_dead', is_flag=True, help='Retry every failed thread, dead or not yet due')
+@click.option('--limit', default=100, show_default=True, help='Most threads to retry')
+def retry(include_dead, limit):
+    """Re-fetch and reprocess threads whose last sync failed"""
+    ingestor = EdStemIngestor()
+    try:
+        ingestor.initialize()
+        result = ingestor.retry_failed(limit=limit, include_dead=include_dead)
+        click.echo(f"Retry completed: {result}")
+    except Exception as e:
+        click.echo(f"Retry failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        ingestor.db.close()
+
+@cli.command()
+def failed():
+    """List dead-lettered threads"""
+    db = Database(config.database_url)
+    try:
+        rows = db.list_failed_threads()
+        if not rows:
+            click.echo("No failed threads")
+        for row in rows:
+            retry_at = row['next_retry_at'].isoformat() if row['next_retry_at'] else 'never (dead)'
+            click.echo(
+                f"{row['thread_id']}: {row['stage']} {row['error_class']} x{row['attempts']}, "
+                f"next retry {retry_at}: {row['error']}"
+            )
+    except Exception as e:
+        click.echo(f"Listing failed threads failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--full', is_flag=True, help='Rescore every post instead of only changed ones')
+@click.option('--top-k', default=5, show_default=True, help='Neighbours stored per post')
+def related(full, top_k):
+    """Rebuild the related-posts index"""
+    from related import RelatedPostsIndex
+
+    db = Database(config.database_url)
+    try:
+        result = RelatedPostsIndex(db, top_k=top_k).update(full=full)
+        click.echo(f"Related posts updated: {result}")
+    except Exception as e:
+        click.echo(f"Related posts update failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--batch-size', type=int, help='Posts loaded between checkpoints (default: 100, or 5000 with --bulk)')
+@click.option('--bulk', is_flag=True, help='Load posts with COPY and set-based merges (large imports)')
+def drain(batch_size, bulk):
+    """Load spooled posts into Postgres"""
+    db = Database(config.database_url)
+    try:
+        spool = Spool(config.spool_dir)
+        result = SpoolDrainer(spool, db, batch_size=batch_size, bulk=bulk).drain()
+        click.echo(f"Drain completed: {result}, pending={spool.pending()}")
+    except Exception as e:
+        click.echo(f"Drain failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--full', is_flag=True, help='Re-render every post instead of only new and edited ones')
+@click.option('--workers', type=int, help='Render processes (default: RENDER_WORKERS or one per CPU)')
+def render(full, workers):
+    """Pre-render post content to HTML with KaTeX math"""
+    from render import ContentRenderer
+
+    db = Database(config.database_url)
+    try:
+        renderer = ContentRenderer(db, workers=workers or config.render_workers,
+                                   katex_command=config.katex_command)
+        result = renderer.update(full=full)
+        click.echo(f"Render completed: {result}")
+    except Exception as e:
+        click.echo(f"Render failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--full', is_flag=True, help='Rebuild the rollups from every post instead of merging changes')
+def rollups(full):
+    """Update the dashboard's daily participation rollups"""
+    from analytics import AnalyticsRollups
+
+    db = Database(config.database_url)
+    try:
+        result = AnalyticsRollups(db, timezone=config.analytics_timezone).update(full=full)
+        click.echo(f"Rollups completed: {result}")
+    except Exception as e:
+        click.echo(f"Rollups failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+def facets():
+    """Backfill extracted facets and rebuild facet counts"""
+    db = Database(config.database_url)
+    try:
+        backfilled = db.backfill_facets(
+            lambda title, content: (extract_topics(title, content), extract_homework_number(title))
+        )
+        values = db.rebuild_facet_counts()
+        click.echo(f"Facets rebuilt: backfilled={backfilled}, facet_values={values}")
+    except Exception as e:
+        click.echo(f"Facet rebuild failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command('search-terms')
+def search_terms_command():
+    """Rebuild the autocomplete search terms"""
+    db = Database(config.database_url)
+    try:
+        terms = db.rebuild_search_terms()
+        click.echo(f"Search terms rebuilt: terms={terms}")
+    except Exception as e:
+        click.echo(f"Search term rebuild failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.argument('query')
+@click.option('--limit', default=10, show_default=True, help='Suggestions to show')
+@click.option('--kind', 'kinds', multiple=True,
+              type=click.Choice(['title', 'author', 'tag', 'topic', 'homework']),
+              help='Only suggest terms of this kind (repeatable)')
+def suggest(query, limit, kinds):
+    """Show autocomplete suggestions for a partial query"""
+    db = Database(config.database_url)
+    try:
+        for suggestion in db.suggest_search_terms(query, limit, list(kinds) or None):
+            click.echo(f"{suggestion['kind']:<9} {suggestion['post_count']:>5}  {suggestion['term']}")
+    except Exception as e:
+        click.echo(f"Suggest failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--sink', 'sinks', multiple=True, required=True,
+              help='Output to feed: postgres, csv=PATH, jsonl=PATH, sqlite=PATH or shards=DIR (repeatable)')
+@click.option('--max-threads', type=int, help='Stop after this many threads (default: all)')
+def pipeline(sinks, max_threads):
+    """Fetch once from EdStem and fan out to several sinks"""
+    from edapi import EdAPI
+
+    db = Database(config.database_url)
+    try:
+        config.validate()
+        # Rules live in Postgres; file-only runs use the defaults and need no database
+        if 'postgres' in sinks:
+            rules = config.get_participation_rules(db.connect())
+        else:
+            rules = DEFAULT_PARTICIPATION_RULES
+        processor = PostProcessor(rules)
+
+        ed = EdAPI()
+        ed.login()
+        source = EdThreadSource(ed, int(config.ed_course_id), max_threads=max_threads)
+
+        transform = processor.process_post
+        renderer = None
+        if any(spec != 'postgres' for spec in sinks):
+            # File outputs carry pre-rendered HTML; Postgres renders its own after storing
+            from render import HtmlRenderer
+            renderer = HtmlRenderer(config.katex_command)
+            transform = renderer.wrap(transform)
+
+        try:
+            result = Pipeline(source, transform,
+                              [build_sink(spec, lambda: db) for spec in sinks],
+                              filters=[processor.participation.matches_listing]).run()
+        finally:
+            if renderer:
+                renderer.close()
+        click.echo(f"Pipeline completed: {result}")
+        if not all(sink['ok'] for sink in result['sinks'].values()):
+            raise click.ClickException("One or more sinks failed")
+    except click.ClickException:
+        raise
+    except Exception as e:
+        click.echo(f"Pipeline failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--ensure-from', type=click.DateTime(), help='Create term partitions from this date...')
+@click.option('--ensure-to', type=click.DateTime(), help='...up to this date (default: now)')
+def partitions(ensure_from, ensure_to):
+    """List term partitions, optionally creating them for a date range"""
+    db = Database(config.database_url)
+    try:
+        if ensure_from:
+            terms = terms_between(ensure_from, ensure_to or datetime.utcnow())
+            created = db.ensure_partitions(term.start for term in terms)
+            click.echo(f"Created partitions: {', '.join(created) or 'none'}")
+        with db.connect().cursor() as cursor:
+            for row in partition_sizes(cursor):
+                click.echo(
+                    f"{row['term']:<14} {row['start']} .. {row['end']}  "
+                    f"posts={row['posts_rows']} ({row['posts_bytes'] // 1024} KiB)  "
+                    f"attachments={row['attachments_rows']}  links={row['links_rows']}"
+                )
+    except Exception as e:
+        click.echo(f"Partition listing failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.argument('term')
+@click.option('--drop', is_flag=True, help='Drop the partitions instead of moving them to the archive schema')
+def archive(term, drop):
+    """Detach a finished term such as 2024_fall from the live tables"""
+    db = Database(config.database_url)
+    try:
+        result = archive_term(db.connect(), term, drop=drop)
+        # Detaching skips the facet and search term triggers
+        db.rebuild_facet_counts()
+        db.rebuild_search_terms()
+        click.echo(f"Archive completed: {result}")
+    except Exception as e:
+        click.echo(f"Archive failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--keep-days', type=int, help='Days of ingestion runs, finished jobs and consumed post changes to keep (default: INGESTION_RUNS_RETENTION_DAYS)')
+@click.option('--keep-latest', default=20, show_default=True, help='Always keep this many most recent runs')
+def retention(keep_days, keep_latest):
+    """Delete old ingestion run records, finished jobs and consumed post changes"""
+    db = Database(config.database_url)
+    try:
+        from jobs import JobQueue
+        from changes import ChangeFeed
+
+        keep_days = keep_days or config.ingestion_runs_retention_days
+        deleted = db.prune_ingestion_runs(keep_days, keep_latest)
+        jobs_deleted = JobQueue(db).prune(keep_days)
+        changes_deleted = ChangeFeed(db).prune(keep_days)
+        click.echo(f"Deleted {deleted} ingestion runs, {jobs_deleted} finished jobs and {changes_deleted} consumed post changes")
+    except Exception as e:
+        click.echo(f"Retention failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command('changes')
+@click.option('--seek', 'seek_to', type=(str, int), help='Move CONSUMER to SEQ (e.g. to replay changes)')
+def changes_command(seek_to):
+    """Show change-feed consumers and how far behind they are"""
+    from changes import ChangeFeed
+
+    db = Database(config.database_url)
+    try:
+        feed = ChangeFeed(db)
+        if seek_to:
+            feed.seek(*seek_to)
+        offsets = feed.offsets()
+        if not offsets:
+            click.echo("No change consumers registered")
+        for name, offset in offsets.items():
+            click.echo(f"{name}: offset {offset['offset']}, {offset['pending']} pending")
+    except Exception as e:
+        click.echo(f"Changes failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        db.close()
+
+@cli.command()
+@click.option('--batch-size', default=1, show_default=True, help='Jobs claimed per round trip')
+@click.option('--lease', default=300, show_default=True, help='Seconds a claimed job stays hidden from other workers')
+@click.option('--poll', default=5.0, show_default=True, help='Seconds to wait when no job is due')
+@click.option('--no-schedule', is_flag=True, help='Do not enqueue the periodic sync pass')
+def worker(batch_size, lease, poll, no_schedule):
+    """Run jobs from the shared Postgres queue (start any number, on any host)"""
+    from jobs import JobQueue, JobWorker
+    from tasks import sync_slot_key
+
     ingestor = EdStemIngestor()
+    try:
+        queue = JobQueue(ingestor.db, lease_seconds=lease)
+        tasks = ingestor.job_tasks(queue)
+        scheduled = set()
+
+        def schedule_sync():
+            # Every worker tries; the dedupe key lets one pass per interval through
+            key = sync_slot_key(config.sync_interval_minutes)
+            if key not in scheduled:
+                tasks.enqueue_sync(key)
+                scheduled.add(key)
+
+        job_worker = JobWorker(queue, tasks.handlers(), batch_size=batch_size, poll_seconds=poll,
+                               on_poll=None if no_schedule else schedule_sync)
+        logger.info(f"Worker {queue.worker_id} handling {', '.join(sorted(job_worker.handlers))}")
+        try:
+            job_worker.run()
+        finally:
+            job_worker.close()
+    except KeyboardInterrupt:
+        click.echo("Worker stopped")
+    except Exception as e:
+        click.echo(f"Worker failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        ingestor.db.close()
+
+@cli.command('jobs')
+@click.option('--sync', 'start_sync', is_flag=True, help='Enqueue a full sync pass')
+@click.option('--thread', 'thread_ids', type=int, multiple=True, help='Enqueue a sync of this Ed thread ID (repeatable)')
+def jobs_command(start_sync, thread_ids):
+    """Enqueue ingest jobs and show the queue"""
+    from jobs import JobQueue
+
+    ingestor = EdStemIngestor()
+    try:
+        queue = JobQueue(ingestor.db)
+        if start_sync or thread_ids:
+            tasks = ingestor.job_tasks(queue)
+            if start_sync:
+                tasks.enqueue_sync(f"manual:{datetime.now().isoformat()}")
+            if thread_ids:
+                tasks.enqueue_threads(list(thread_ids))
+        for kind, counts in queue.counts().items():
+            click.echo(f"{kind:20} " + '  '.join(f"{status}={count}" for status, count in counts.items()))
+    except Exception as e:
+        click.echo(f"Jobs failed: {e}", err=True)
+        raise click.Abort()
+    finally:
+        ingestor.db.close()
+
+@cli.command()
+@click.option('--profile', is_flag=True, help='Write cProfile/tracemalloc artifacts to PROFILE_DIR/<run id> for every run')
+@click.option('--profile-top', default=10, show_default=True, help='Slowest threads to report when profiling')
+def continuous(profile, profile_top):
+    """Run continuous ingestion"""
+    ingestor = EdStemIngestor(profile=profile, profile_top=profile_top)
     try:
         ingestor.initialize()
         ingestor.run_continuous()
@@ -0,0 +1,205 @@
+"""
+Ingest work split into queue jobs
+
+Each handler does one small, retryable unit of work and enqueues the next
+ones with dedupe keys, so a retried or duplicated parent never fans out
+twice:
+
+    fetch_page       one page of Ed threads -> process_thread per new version,
+                     plus the next page
+    process_thread   convert and upsert one thread (from the payload, or
+                     fetched by thread_id) -> enrich_links, download_attachment
+    enrich_links     fetch titles of a post's GitHub/personal links
+    download_attachment  copy an attachment into ATTACHMENTS_DIR
+    refresh_derived  related posts and pre-rendered HTML, coalesced per minute
+"""
+import os
+import re
+import time
+import logging
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Callable, Optional
+
+from jobs import Job, JobQueue
+from pipeline import PostgresSink
+
+logger = logging.getLogger(__name__)
+
+ENRICHED_LINK_TYPES = ('github', 'personal')
+# Derived data is refreshed at most once per window after posts change
+REFRESH_WINDOW_SECONDS = 60
+MAX_ATTACHMENT_BYTES = 100 * 1024 * 1024
+
+
+def _safe_filename(filename: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.basename(filename or '')).strip('._') or 'attachment'
+
+
+class IngestTasks:
+    """Job handlers for the ingest pipeline"""
+
+    def __init__(self, db, queue: JobQueue, processor, ed_client: Callable[[], Any], course_id: int,
+                 page_size: int = 100, max_threads: Optional[int] = 100, attachments_dir: Optional[str] = None,
+                 refresh: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.queue = queue
+        self.processor = processor
+        self.ed_client = ed_client
+        self.course_id = course_id
+        self.page_size = page_size
+        self.max_threads = max_threads
+        self.attachments_dir = attachments_dir
+        self.refresh = refresh
+
+    def handlers(self) -> Dict[str, Callable[[Job], None]]:
+        handlers = {
+            'fetch_page': self.fetch_page,
+            'process_thread': self.process_thread,
+            'enrich_links': self.enrich_links,
+            'refresh_derived': self.refresh_derived,
+        }
+        if self.attachments_dir:
+            handlers['download_attachment'] = self.download_attachment
+        return handlers
+
+    def enqueue_sync(self, key: str) -> int:
+        """Start a sync pass at the first page; `key` names the pass so it is only enqueued once"""
+        return self.queue.enqueue('fetch_page', {'sync': key, 'offset': 0}, dedupe_key=f"{key}:page:0")
+
+    def enqueue_threads(self, thread_ids: List[int]) -> int:
+        """Queue a targeted sync of specific threads"""
+        return self.queue.enqueue_many(
+            ('process_thread', {'thread_id': thread_id}, None) for thread_id in sorted(set(thread_ids))
+        )
+
+    def fetch_page(self, job: Job):
+        sync_key = job.payload.get('sync') or f"job-{job.id}"
+        offset = job.payload.get('offset', 0)
+        limit = self.page_size
+        if self.max_threads is not None:
+            limit = min(limit, self.max_threads - offset)
+
+        threads = self.ed_client().list_threads(course_id=self.course_id, limit=limit, offset=offset, sort="new")
+        logger.info(f"Fetched {len(threads)} threads (offset {offset}) for course {self.course_id}")
+
+        hidden_posts = self.db.get_hidden_posts()
+        known_versions = self.db.get_post_versions()
+        children = []
+        for thread in threads:
+            if thread['id'] in hidden_posts or not self.processor.participation.matches_listing(thread):
+                continue
+            version = self.processor.get_updated_at(thread)
+            if version is not None and known_versions.get(thread['id']) == version:
+                continue
+            dedupe_key = f"thread:{thread['id']}:{version.isoformat()}" if version else None
+            children.append(('process_thread', {'thread': thread}, dedupe_key))
+
+        last_page = len(threads) < limit or (self.max_threads is not None and offset + limit >= self.max_threads)
+        if threads and not last_page:
+            next_offset = offset + limit
+            children.append((
+                'fetch_page', {'sync': sync_key, 'offset': next_offset}, f"{sync_key}:page:{next_offset}"
+            ))
+        self.queue.enqueue_many(children)
+
+    def process_thread(self, job: Job):
+        thread = job.payload.get('thread')
+        if thread is None:
+            thread = self.ed_client().get_thread(job.payload['thread_id'])
+            if not self.processor.participation.matches_listing(thread):
+                return
+
+        record = self.processor.process_post(thread)
+        if not record:
+            return
+
+        # Titles come from enrich_links; keep the ones already fetched
+        known_titles = self.db.get_link_titles(record.ed_post_id)
+        for link in record.links:
+            link.title = link.title or known_titles.get(link.url)
+
+        sink = PostgresSink(self.db)
+        sink.open()
+        status = sink.write_record(record)
+        if status is None:
+            raise RuntimeError(f"Failed to store post {record.ed_post_id}")
+        if status not in ('created', 'updated'):
+            return
+
+        version = record.updated_at or record.posted_at
+        children = []
+        urls = [link.url for link in record.links if link.link_type in ENRICHED_LINK_TYPES and not link.title]
+        if urls:
+            # Without a timestamp, one pending enrichment per post covers every version
+            dedupe_key = f"links:{record.ed_post_id}:{version.isoformat()}" if version else f"links:{record.ed_post_id}"
+            children.append((
+                'enrich_links',
+                {'ed_post_id': record.ed_post_id,
+                 'posted_at': record.posted_at.isoformat() if record.posted_at else None, 'urls': urls},
+                dedupe_key
+            ))
+        if self.attachments_dir:
+            for attachment in record.attachments:
+                if attachment.download_url:
+                    children.append((
+                        'download_attachment',
+                        {'ed_post_id': record.ed_post_id, **asdict(attachment)},
+                        f"attachment:{attachment.ed_attachment_id or attachment.download_url}"
+                    ))
+        self.queue.enqueue_many(children)
+
+        # One refresh at the end of the current window covers every post stored during it
+        window = int(time.time() // REFRESH_WINDOW_SECONDS)
+        run_at = datetime.fromtimestamp((window + 1) * REFRESH_WINDOW_SECONDS, timezone.utc)
+        self.queue.enqueue('refresh_derived', dedupe_key=f"refresh:{window}", run_at=run_at)
+
+    def enrich_links(self, job: Job):
+        titles = {}
+        for url in job.payload['urls']:
+            title = self.processor.fetch_link_title(url)
+            if title:
+                titles[url] = title
+        if titles:
+            posted_at = job.payload['posted_at'] and datetime.fromisoformat(job.payload['posted_at'])
+            self.db.update_link_titles(job.payload['ed_post_id'], posted_at, titles)
+
+    def download_attachment(self, job: Job):
+        # Imported lazily: only workers with ATTACHMENTS_DIR download anything
+        import requests
+
+        payload = job.payload
+        owner = str(payload.get('ed_attachment_id') or payload['ed_post_id'])
+        directory = os.path.join(self.attachments_dir, _safe_filename(owner))
+        path = os.path.join(directory, _safe_filename(payload.get('filename')))
+        if os.path.exists(path):
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{job.id}.tmp"
+        try:
+            with requests.get(payload['download_url'], stream=True, timeout=30) as response:
+                response.raise_for_status()
+                size = 0
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        size += len(chunk)
+                        if size > MAX_ATTACHMENT_BYTES:
+                            raise ValueError(f"Attachment larger than {MAX_ATTACHMENT_BYTES} bytes")
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def refresh_derived(self, job: Job):
+        if self.refresh:
+            self.refresh()
+
+
+def sync_slot_key(interval_minutes: int, now: Optional[datetime] = None) -> str:
+    """Name of the scheduled sync pass covering `now`, shared by every worker"""
+    now = now or datetime.now(timezone.utc)
+    interval = timedelta(minutes=interval_minutes)
+    slot = int((now - datetime(1970, 1, 1, tzinfo=timezone.utc)) / interval)
+    return f"sync:{interval_minutes}m:{slot}"
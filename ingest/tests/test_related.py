@@ -0,0 +1,46 @@
+import numpy as np
+
+from related import build_tfidf_matrix, incremental_neighbours, top_neighbours
+
+TOP_K = 2
+MIN_SCORE = 0.05
+
+POSTS = [
+    "muon optimizer orthogonal updates",
+    "muon optimizer newton schulz iteration",
+    "muon orthogonal newton schulz",
+    "adam optimizer momentum orthogonal",
+    "orthogonal updates newton muon",
+    "pizza cheese tomato",
+]
+
+
+def stored_state(neighbours):
+    """Thresholds as RelatedPostsIndex._thresholds derives them from stored lists"""
+    thresholds = np.full(len(POSTS), -np.inf)
+    for source, related in neighbours.items():
+        if len(related) >= TOP_K:
+            thresholds[source] = related[-1][1]
+    return thresholds
+
+
+def test_edit_removing_a_neighbour_keeps_list_at_k():
+    before = build_tfidf_matrix(POSTS)
+    stored = top_neighbours(before, np.arange(len(POSTS)), TOP_K, MIN_SCORE)
+    assert len(stored[0]) == TOP_K
+
+    # Edit post 0's best neighbour so it no longer resembles anything
+    edited = stored[0][0][0]
+    posts = list(POSTS)
+    posts[edited] = "sourdough bread recipe"
+    after = build_tfidf_matrix(posts)
+
+    referencing = np.array([source for source, related in stored.items()
+                            if source != edited and any(target == edited for target, _ in related)])
+    neighbours = incremental_neighbours(
+        after, np.array([edited]), referencing, stored_state(stored), TOP_K, MIN_SCORE
+    )
+
+    assert len(neighbours[0]) == TOP_K
+    assert edited not in [target for target, _ in neighbours[0]]
+    assert neighbours[0] == top_neighbours(after, np.array([0]), TOP_K, MIN_SCORE)[0]
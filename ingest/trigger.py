@@ -0,0 +1,182 @@
+"""
+Push-triggered syncs for the continuous worker
+
+A small authenticated HTTP endpoint accepts "thread X changed" and "sync
+now" events. Bursts are coalesced: a sync runs once no new event has
+arrived for `debounce_seconds` (or at the latest `max_wait_seconds` after
+the first event of a burst) and covers every thread reported meanwhile.
+
+    POST /sync
+    Authorization: Bearer $SYNC_SECRET
+
+    {"thread_id": 123} or {"thread_ids": [123, 456]}   targeted sync
+    {} or {"full": true}                                full sync
+"""
+import hmac
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class Debouncer:
+    """Collects changed thread IDs and full-sync requests and hands them to `handler` after a quiet period"""
+
+    def __init__(self, handler: Callable[[Set[int], bool], None],
+                 debounce_seconds: float = 5.0, max_wait_seconds: float = 30.0):
+        self.handler = handler
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._condition = threading.Condition()
+        self._thread_ids: Set[int] = set()
+        self._full = False
+        self._first_event: Optional[float] = None
+        self._last_event: Optional[float] = None
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name='sync-debouncer', daemon=True)
+
+    def start(self):
+        self._worker.start()
+
+    def submit(self, thread_ids: Iterable[int] = (), full: bool = False):
+        with self._condition:
+            now = time.monotonic()
+            self._thread_ids.update(thread_ids)
+            self._full = self._full or full
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._worker.join()
+
+    def _seconds_until_due(self) -> Optional[float]:
+        if self._first_event is None:
+            return None
+        due = min(self._last_event + self.debounce_seconds, self._first_event + self.max_wait_seconds)
+        return due - time.monotonic()
+
+    def _take(self) -> Optional[Tuple[Set[int], bool]]:
+        """Wait until a burst is due and take it; None once stopped"""
+        with self._condition:
+            while not self._stopped:
+                remaining = self._seconds_until_due()
+                if remaining is not None and remaining <= 0:
+                    batch = (self._thread_ids, self._full)
+                    self._thread_ids, self._full = set(), False
+                    self._first_event = self._last_event = None
+                    return batch
+                self._condition.wait(remaining)
+            return None
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            thread_ids, full = batch
+            try:
+                self.handler(thread_ids, full)
+            except Exception as e:
+                logger.error(f"Triggered sync failed: {e}")
+
+
+def parse_event(body: Dict[str, Any]) -> Tuple[Set[int], bool]:
+    """(thread IDs, full sync?) from a request body; raises ValueError if malformed"""
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object")
+
+    thread_ids = body.get('thread_ids') or []
+    if not isinstance(thread_ids, list):
+        raise ValueError("thread_ids must be a list")
+    thread_ids = list(thread_ids)
+    if body.get('thread_id') is not None:
+        thread_ids.append(body['thread_id'])
+    if any(isinstance(value, bool) for value in thread_ids):
+        raise ValueError("Thread IDs must be integers")
+    thread_ids = {int(value) for value in thread_ids}
+
+    full = bool(body.get('full')) or not thread_ids
+    return thread_ids, full
+
+
+class _TriggerRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'edthing-ingest'
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/sync':
+            return self._reply(404, {'error': 'Not found'})
+        if not self._authorized():
+            return self._reply(401, {'error': 'Unauthorized'})
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return self._reply(400, {'error': 'Invalid Content-Length'})
+        if length > MAX_BODY_BYTES:
+            return self._reply(413, {'error': 'Request body too large'})
+
+        try:
+            thread_ids, full = parse_event(json.loads(self.rfile.read(length) or b'{}'))
+        except (ValueError, TypeError) as e:
+            return self._reply(400, {'error': f"Invalid event: {e}"})
+
+        self.server.debouncer.submit(thread_ids, full)
+        logger.info(f"Queued {'full sync' if full else f'sync of threads {sorted(thread_ids)}'}")
+        self._reply(202, {'queued': sorted(thread_ids), 'full': full})
+
+    def _authorized(self) -> bool:
+        expected = f"Bearer {self.server.secret}".encode('utf-8')
+        return hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'), expected)
+
+    def _reply(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class TriggerServer:
+    """HTTP endpoint feeding a Debouncer, served from a background thread"""
+
+    def __init__(self, handler: Callable[[Set[int], bool], None], secret: str,
+                 host: str = '127.0.0.1', port: int = 8765,
+                 debounce_seconds: float = 5.0, max_wait_seconds: float = 30.0):
+        if not secret:
+            raise ValueError("A shared secret is required for the sync trigger endpoint")
+        self.secret = secret
+        self.address = (host, port)
+        self.debouncer = Debouncer(handler, debounce_seconds, max_wait_seconds)
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer(self.address, _TriggerRequestHandler)
+        self._server.secret = self.secret
+        self._server.debouncer = self.debouncer
+        self.debouncer.start()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='sync-trigger', daemon=True)
+        self._thread.start()
+        host, port = self._server.server_address[:2]
+        logger.info(f"Sync trigger endpoint listening on http://{host}:{port}/sync")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        self.debouncer.stop()
@@ -6,16 +6,27 @@ set -a
 source .env
 set +a
 
+IMAGE=${INGEST_IMAGE:-edthing-ingest}
+
+# Dependencies are baked into the image instead of pip installing on every
+# run. Rebuild every time so code changes are picked up; unchanged layers
+# come from the build cache, so this is quick when nothing changed.
+echo "📦 Building ingest image $IMAGE..."
+docker build -q -t "$IMAGE" ingest >/dev/null || exit 1
+
 echo "🔄 Running EdThing data ingestion..."
 
+# Keep the spool on the host so posts fetched during a database outage
+# are loaded by the next run
+mkdir -p ingest/spool
+
 docker run --rm \
-  -v $(pwd)/ingest:/app \
   --link edthing-db:db \
+  -v "$PWD/ingest/spool:/app/spool" \
   -e DATABASE_URL=postgresql://edthing:edthing@db:5432/edthing \
-  -e ED_USERNAME=$ED_USERNAME \
-  -e ED_PASSWORD=$ED_PASSWORD \
+  -e ED_API_TOKEN=$ED_API_TOKEN \
   -e ED_COURSE_ID=$ED_COURSE_ID \
-  python:3.11-slim \
-  sh -c "cd /app && pip install -r requirements.txt && python -m ingest.sync --manual"
+  "$IMAGE" \
+  python -m sync sync
 
 echo "✅ Ingestion completed!"
@@ -21,9 +21,17 @@ mkdir -p web/data
 cp ingest/participation_d_posts.csv web/data/participation_d_posts.csv
 
 echo "✅ CSV copied to web/data/participation_d_posts.csv"
+
+# Copy static JSON shards (content-hashed, precompressed) if the export produced them
+if [ -f "ingest/shards/manifest.json" ]; then
+    rm -rf web/public/shards
+    mkdir -p web/public
+    cp -R ingest/shards web/public/shards
+    echo "✅ Shards copied to web/public/shards"
+fi
 echo ""
 echo "📝 Next steps:"
 echo "   1. Review the changes: git diff web/data/participation_d_posts.csv"
-echo "   2. Commit: git add web/data/participation_d_posts.csv"
+echo "   2. Commit: git add web/data/participation_d_posts.csv web/public/shards"
 echo "   3. Push: git push"
 echo "   4. Vercel will automatically redeploy with the new CSV"
@@ -2,12 +2,19 @@ import { NextRequest, NextResponse } from 'next/server';
 import { readFile } from 'fs/promises';
 import { join } from 'path';
 import { parse } from 'csv-parse/sync';
+import { readShard, shardKey } from '@/lib/shards';
 
 export async function GET(
   request: NextRequest,
   { params }: { params: { id: string } }
 ) {
   try {
+    // Post detail documents are exported as static shards
+    const shard = await readShard(shardKey('post', params.id));
+    if (shard) {
+      return NextResponse.json(shard, { headers: { 'X-Shard': shardKey('post', params.id) } });
+    }
+
     const csvPath = join(process.cwd(), 'data', 'participation_d_posts.csv');
     
     try {
@@ -32,6 +39,7 @@ export async function GET(
         ed_post_id: post.id,
         title: post.title,
         content: post.content,
+        content_html: post.content_html || null,
         author: {
           display_name: post.author,
         },
@@ -2,6 +2,10 @@ import { NextRequest, NextResponse } from 'next/server';
 import { readFile } from 'fs/promises';
 import { join } from 'path';
 import { parse } from 'csv-parse/sync';
+import { readShard, shardKey } from '@/lib/shards';
+
+// Page size the exporter renders shards with (ingest/shards.py)
+const SHARD_PAGE_SIZE = 20;
 
 // Topic definitions based on optimizer and keyword mentions
 const TOPIC_DEFINITIONS = [
@@ -28,8 +32,55 @@ const extractTopics = (title: string | undefined, content: string | undefined):
   return tags;
 };
 
+// Prefer facets precomputed by the exporter; older CSVs lack these columns
+const postTopics = (post: any): string[] =>
+  post.topics !== undefined
+    ? post.topics.split('; ').filter(Boolean)
+    : extractTopics(post.title, post.content);
+
+const postHomework = (post: any): number | null => {
+  if (post.homework !== undefined) {
+    const num = parseInt(post.homework, 10);
+    return Number.isNaN(num) ? null : num;
+  }
+  const match = post.title?.match(/(?:HW|Homework)\s*0*(\d+)/i);
+  if (!match) return null;
+  const num = parseInt(match[1], 10);
+  return Number.isNaN(num) ? null : num;
+};
+
+// Key of the exported static shard that answers this query, if it is a hot browse path
+const hotShardKey = (searchParams: URLSearchParams): string | null => {
+  if (searchParams.get('q') || searchParams.get('homework')) return null;
+  if (parseInt(searchParams.get('page_size') || '20') !== SHARD_PAGE_SIZE) return null;
+
+  const page = parseInt(searchParams.get('page') || '1');
+  if (Number.isNaN(page) || page < 1) return null;
+
+  const sortBy = searchParams.get('sort_by') || 'newest';
+  const student = searchParams.get('student_id') || '';
+  const tags = (searchParams.get('tags') || '').split(',').filter(Boolean);
+
+  if (!student && tags.length === 0 && (sortBy === 'newest' || sortBy === 'oldest')) {
+    return shardKey(sortBy, page);
+  }
+  if (sortBy !== 'newest') return null;
+  if (student && tags.length === 0) return shardKey('student', student, page);
+  if (!student && tags.length === 1) return shardKey('tag', tags[0], page);
+  return null;
+};
+
 export async function GET(request: NextRequest) {
   try {
+    // Serve common browse paths straight from the precomputed shards
+    const key = hotShardKey(new URL(request.url).searchParams);
+    if (key) {
+      const shard = await readShard(key);
+      if (shard) {
+        return NextResponse.json(shard, { headers: { 'X-Shard': key } });
+      }
+    }
+
     // Read CSV file
     const csvPath = join(process.cwd(), 'data', 'participation_d_posts.csv');
     
@@ -83,12 +134,8 @@ export async function GET(request: NextRequest) {
 
         if (homeworkNums.length > 0) {
           filtered = filtered.filter((post: any) => {
-            if (!post.title) return false;
-            const match = post.title.match(/(?:HW|Homework)\s*0*(\d+)/i);
-            if (!match) return false;
-            const num = parseInt(match[1], 10);
-            if (Number.isNaN(num)) return false;
-            return homeworkNums.includes(num);
+            const num = postHomework(post);
+            return num !== null && homeworkNums.includes(num);
           });
         }
       }
@@ -96,7 +143,7 @@ export async function GET(request: NextRequest) {
       // Filter by topics/tags if provided
       if (tagsFilter.length > 0) {
         filtered = filtered.filter((post: any) => {
-          const postTags = extractTopics(post.title, post.content);
+          const postTags = postTopics(post);
           if (postTags.length === 0) return false;
           const lower = postTags.map((t) => t.toLowerCase());
           return tagsFilter.some((tag) => lower.includes(tag));
@@ -121,12 +168,13 @@ export async function GET(request: NextRequest) {
 
       return NextResponse.json({
         posts: paginated.map((post: any) => {
-          const tags = extractTopics(post.title, post.content);
+          const tags = postTopics(post);
           return {
             id: post.id,
             ed_post_id: post.id,
             title: post.title,
             content: post.content,
+            content_html: post.content_html || null,
             author: {
               display_name: post.author,
             },
@@ -0,0 +1,19 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { getParticipationStats } from '@/lib/db';
+
+export async function GET(request: NextRequest) {
+  // Rollups live in Postgres; CSV-only deployments have none
+  if (!process.env.DATABASE_URL) {
+    return NextResponse.json({ error: 'Participation stats need DATABASE_URL' }, { status: 503 });
+  }
+
+  try {
+    const { searchParams } = new URL(request.url);
+    const days = parseInt(searchParams.get('days') || '30');
+    const stats = await getParticipationStats(Number.isNaN(days) || days < 1 ? 30 : Math.min(days, 365));
+    return NextResponse.json(stats);
+  } catch (error) {
+    console.error('Error fetching participation stats:', error);
+    return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
+  }
+}
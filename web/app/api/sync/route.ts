@@ -3,10 +3,12 @@ import { writeFile } from 'fs/promises';
 import { join } from 'path';
 
 /**
- * API route to regenerate CSV from EdStem
- * This can be called manually or via a cron job
- * 
- * To use: POST /api/sync with ED_API_TOKEN and ED_COURSE_ID in env vars
+ * API route to trigger a sync
+ * This can be called manually, via a cron job or from an Ed webhook
+ *
+ * When INGEST_TRIGGER_URL points at the continuous ingest worker's /sync
+ * endpoint, the body ({"thread_id": 123} or {} for a full sync) is forwarded
+ * there with SYNC_SECRET. Otherwise ED_API_TOKEN and ED_COURSE_ID must be set.
  */
 export async function POST(request: NextRequest) {
   try {
@@ -18,6 +20,20 @@ export async function POST(request: NextRequest) {
       return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
     }
 
+    const triggerUrl = process.env.INGEST_TRIGGER_URL;
+    if (triggerUrl) {
+      if (!expectedToken) {
+        return NextResponse.json({ error: 'SYNC_SECRET must be set to forward sync events' }, { status: 500 });
+      }
+      const body = await request.text();
+      const response = await fetch(triggerUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${expectedToken}` },
+        body: body || '{}',
+      });
+      return NextResponse.json(await response.json(), { status: response.status });
+    }
+
     const edApiToken = process.env.ED_API_TOKEN;
     const courseId = process.env.ED_COURSE_ID;
 
@@ -43,7 +43,10 @@ export async function GET(request: NextRequest) {
 
     const tagSet = new Set<string>();
     records.forEach((post: any) => {
-      extractTopics(post.title, post.content).forEach((tag) => tagSet.add(tag));
+      const topics = post.topics !== undefined
+        ? post.topics.split('; ').filter(Boolean)
+        : extractTopics(post.title, post.content);
+      topics.forEach((tag: string) => tagSet.add(tag));
     });
 
     const tags = Array.from(tagSet).sort((a, b) => a.localeCompare(b));
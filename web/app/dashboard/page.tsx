@@ -25,6 +25,52 @@ interface DashboardStats {
   topStudents: { student: Student; count: number }[];
 }
 
+// Client-side counts over a page of posts, used when /api/stats is unavailable
+const statsFromPosts = (posts: Post[]): DashboardStats => {
+  const thirtyDaysAgo = new Date();
+  thirtyDaysAgo.setDate(thirtyDaysAgo.getDate() - 30);
+  const recentPostsCount = posts.filter((p: Post) =>
+    new Date(p.posted_at) > thirtyDaysAgo
+  ).length;
+
+  // Count tags
+  const tagCounts: { [key: string]: number } = {};
+  posts.forEach((post: Post) => {
+    post.tags.forEach((tag: string) => {
+      tagCounts[tag] = (tagCounts[tag] || 0) + 1;
+    });
+  });
+  const popularTags = Object.entries(tagCounts)
+    .map(([tag, count]) => ({ tag, count }))
+    .sort((a, b) => b.count - a.count)
+    .slice(0, 10);
+
+  // Count students
+  const studentCounts: { [key: string]: { student: Student; count: number } } = {};
+  posts.forEach((post: Post) => {
+    if (post.author) {
+      const name = post.author.display_name;
+      if (!studentCounts[name]) {
+        studentCounts[name] = { student: post.author, count: 0 };
+      }
+      studentCounts[name].count++;
+    }
+  });
+  const topStudents = Object.values(studentCounts)
+    .sort((a, b) => b.count - a.count)
+    .slice(0, 10);
+
+  const uniqueStudents = new Set(posts.map((p: Post) => p.author?.display_name).filter(Boolean));
+
+  return {
+    totalPosts: posts.length,
+    totalStudents: uniqueStudents.size,
+    recentPosts: recentPostsCount,
+    popularTags,
+    topStudents,
+  };
+};
+
 export default function DashboardPage() {
   const { data: session, status } = useSession();
   const router = useRouter();
@@ -42,69 +88,51 @@ export default function DashboardPage() {
   const loadDashboardData = async () => {
     setLoading(true);
     try {
-      // Load posts
-      const postsResponse = await fetch('/api/posts?page_size=100');
-      if (postsResponse.status === 401) {
+      // Counts come from the ingest's rollup tables; posts are only loaded for the lists
+      const [statsResponse, postsResponse] = await Promise.all([
+        fetch('/api/stats?days=30'),
+        fetch('/api/posts?page_size=20'),
+      ]);
+      if (statsResponse.status === 401 || postsResponse.status === 401) {
         router.push('/auth/signin');
         return;
       }
 
       if (postsResponse.ok) {
         const postsData = await postsResponse.json();
-        const posts = postsData.posts || [];
-
-        // Calculate stats
-        const thirtyDaysAgo = new Date();
-        thirtyDaysAgo.setDate(thirtyDaysAgo.getDate() - 30);
-        const recentPostsCount = posts.filter((p: Post) => 
-          new Date(p.posted_at) > thirtyDaysAgo
-        ).length;
-
-        // Count tags
-        const tagCounts: { [key: string]: number } = {};
-        posts.forEach((post: Post) => {
-          post.tags.forEach((tag: string) => {
-            tagCounts[tag] = (tagCounts[tag] || 0) + 1;
-          });
-        });
-        const popularTags = Object.entries(tagCounts)
-          .map(([tag, count]) => ({ tag, count }))
-          .sort((a, b) => b.count - a.count)
-          .slice(0, 10);
-
-        // Count students
-        const studentCounts: { [key: string]: { student: Student; count: number } } = {};
-        posts.forEach((post: Post) => {
-          if (post.author) {
-            const name = post.author.display_name;
-            if (!studentCounts[name]) {
-              studentCounts[name] = { student: post.author, count: 0 };
-            }
-            studentCounts[name].count++;
-          }
-        });
-        const topStudents = Object.values(studentCounts)
-          .sort((a, b) => b.count - a.count)
-          .slice(0, 10);
-
-        const uniqueStudents = new Set(posts.map((p: Post) => p.author?.display_name).filter(Boolean));
+        setRecentPosts((postsData.posts || []).slice(0, 5));
+      }
 
+      if (statsResponse.ok) {
+        const data = await statsResponse.json();
         setStats({
-          totalPosts: posts.length,
-          totalStudents: uniqueStudents.size,
-          recentPosts: recentPostsCount,
-          popularTags,
-          topStudents,
+          totalPosts: data.totalPosts,
+          totalStudents: data.totalStudents,
+          recentPosts: data.daily.reduce((sum: number, row: any) => sum + row.post_count, 0),
+          popularTags: data.popularTags.map((row: any) => ({ tag: row.tag, count: row.post_count })),
+          topStudents: data.topStudents.map((row: any) => ({
+            student: { id: row.id, display_name: row.display_name } as Student,
+            count: row.post_count,
+          })),
         });
-
-        // Get recent posts (last 5)
-        setRecentPosts(posts.slice(0, 5));
-
-        // Load bookmarked posts
-        const bookmarks = JSON.parse(localStorage.getItem('bookmarks') || '[]');
-        const bookmarkedPostsData = posts.filter((p: Post) => bookmarks.includes(p.id));
-        setBookmarkedPosts(bookmarkedPostsData.slice(0, 5));
+      } else {
+        // No rollups without Postgres (CSV-only deployments); count the latest posts instead
+        const fallbackResponse = await fetch('/api/posts?page_size=100');
+        if (fallbackResponse.ok) {
+          const fallbackData = await fallbackResponse.json();
+          setStats(statsFromPosts(fallbackData.posts || []));
+        }
       }
+
+      // Load bookmarked posts one by one; post details are served from static shards
+      const bookmarks: string[] = JSON.parse(localStorage.getItem('bookmarks') || '[]');
+      const bookmarkedPostsData = await Promise.all(
+        bookmarks.slice(0, 5).map(async (id) => {
+          const response = await fetch(`/api/posts/${encodeURIComponent(id)}`);
+          return response.ok ? ((await response.json()) as Post) : null;
+        })
+      );
+      setBookmarkedPosts(bookmarkedPostsData.filter((post): post is Post => post !== null));
     } catch (error) {
       console.error('Failed to load dashboard data:', error);
     } finally {
@@ -167,7 +167,13 @@ export function PostCard({ post }: PostCardProps) {
         </div>
       </div>
 
-      {post.content && (
+      {post.content_html ? (
+        // Rendered at ingest with raw HTML escaped and KaTeX trust off; clipped like the Markdown preview
+        <div
+          className="text-gray-700 mb-4 prose prose-sm max-w-none max-h-48 overflow-hidden"
+          dangerouslySetInnerHTML={{ __html: post.content_html }}
+        />
+      ) : post.content && (
         <div className="text-gray-700 mb-4 prose prose-sm max-w-none">
           <ReactMarkdown
             // eslint-disable-next-line @typescript-eslint/no-explicit-any
@@ -210,7 +210,13 @@ export function PostDetail({ post }: PostDetailProps) {
       )}
 
       {/* Content */}
-      {post.content && (
+      {post.content_html ? (
+        // Rendered at ingest with raw HTML escaped and KaTeX trust off
+        <div
+          className="prose prose-lg max-w-none mb-8"
+          dangerouslySetInnerHTML={{ __html: post.content_html }}
+        />
+      ) : post.content && (
         <div className="prose prose-lg max-w-none mb-8">
           {/* Cast plugins to any to avoid type mismatches between unified versions */}
           <ReactMarkdown
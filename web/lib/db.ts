@@ -35,6 +35,19 @@ export async function getPosts(filters: SearchFilters = {}, page = 1, pageSize =
       paramIndex++;
     }
 
+    // Homework filter (comma-separated numbers, e.g. "6,12")
+    if (filters.homework) {
+      const homeworkNums = filters.homework
+        .split(',')
+        .map((v) => parseInt(v, 10))
+        .filter((v) => !Number.isNaN(v));
+      if (homeworkNums.length > 0) {
+        whereConditions.push(`p.homework_number = ANY($${paramIndex})`);
+        params.push(homeworkNums);
+        paramIndex++;
+      }
+    }
+
     // Has attachments filter
     if (filters.has_attachments) {
       whereConditions.push(`EXISTS (SELECT 1 FROM attachments a WHERE a.post_id = p.id)`);
@@ -153,16 +166,47 @@ export async function getPostById(id: string): Promise<Post | null> {
   }
 }
 
+export async function getRelatedPosts(id: string, limit = 5): Promise<Post[]> {
+  const client = await pool.connect();
+
+  try {
+    const query = `
+      SELECT
+        p.*,
+        s.display_name as author_name,
+        r.score as related_score
+      FROM related_posts r
+      JOIN posts p ON p.id = r.related_post_id
+      LEFT JOIN students s ON p.author_id = s.id
+      WHERE r.post_id = $1 AND p.is_hidden = false
+      ORDER BY r.rank
+      LIMIT $2
+    `;
+
+    const result = await client.query(query, [id, limit]);
+    return result.rows.map(row => ({
+      ...row,
+      attachments: [],
+      links: [],
+      author: row.author_id ? {
+        id: row.author_id,
+        display_name: row.author_name,
+      } : undefined,
+    }));
+  } finally {
+    client.release();
+  }
+}
+
 export async function getStudents(): Promise<Student[]> {
   const client = await pool.connect();
 
   try {
     const query = `
-      SELECT s.*, COUNT(p.id) as post_count
+      SELECT s.*, COALESCE(f.post_count, 0) as post_count
       FROM students s
-      LEFT JOIN posts p ON s.id = p.author_id AND p.is_hidden = false
+      LEFT JOIN facet_counts f ON f.facet = 'author' AND f.value = s.id::text
       WHERE s.is_hidden = false
-      GROUP BY s.id
       ORDER BY s.display_name
     `;
 
@@ -178,10 +222,10 @@ export async function getTags(): Promise<string[]> {
 
   try {
     const query = `
-      SELECT DISTINCT unnest(tags) as tag
-      FROM posts
-      WHERE is_hidden = false
-      ORDER BY tag
+      SELECT value as tag
+      FROM facet_counts
+      WHERE facet = 'tag' AND post_count > 0
+      ORDER BY value
     `;
 
     const result = await client.query(query);
@@ -191,6 +235,101 @@ export async function getTags(): Promise<string[]> {
   }
 }
 
+export async function getHomeworkNumbers(): Promise<string[]> {
+  const client = await pool.connect();
+
+  try {
+    const query = `
+      SELECT value as homework
+      FROM facet_counts
+      WHERE facet = 'homework' AND post_count > 0
+      ORDER BY value::int
+    `;
+
+    const result = await client.query(query);
+    return result.rows.map(row => row.homework);
+  } finally {
+    client.release();
+  }
+}
+
+export async function getSearchSuggestions(query: string, limit = 10) {
+  const normalized = query.trim().toLowerCase();
+  if (!normalized) {
+    return [];
+  }
+  const prefix = normalized.replace(/[\\%_]/g, '\\$&') + '%';
+  const client = await pool.connect();
+
+  try {
+    // search_terms is maintained by ingest; prefix matches first, then typo-tolerant trigram matches
+    const result = await client.query(`
+      SELECT kind, term, post_count
+      FROM search_terms
+      WHERE LOWER(term) LIKE $2 OR $1 <% LOWER(term)
+      ORDER BY LOWER(term) LIKE $2 DESC, weight * word_similarity($1, LOWER(term)) DESC, post_count DESC, term
+      LIMIT $3
+    `, [normalized, prefix, limit]);
+    return result.rows;
+  } finally {
+    client.release();
+  }
+}
+
+export async function getParticipationStats(days = 30) {
+  const client = await pool.connect();
+
+  try {
+    // Pre-aggregated by ingest/analytics.py; each query reads a few hundred rows at most
+    const students = await client.query(`
+      SELECT s.id, s.display_name, SUM(d.post_count)::int as post_count
+      FROM daily_student_posts d
+      JOIN students s ON s.id = d.author_id AND s.is_hidden = false
+      GROUP BY s.id, s.display_name
+      ORDER BY post_count DESC
+      LIMIT 10
+    `);
+    const tags = await client.query(`
+      SELECT tag, SUM(post_count)::int as post_count
+      FROM daily_tag_posts
+      GROUP BY tag
+      ORDER BY post_count DESC
+      LIMIT 10
+    `);
+    const homework = await client.query(`
+      SELECT h.homework_number, SUM(d.post_count)::int as post_count, h.students,
+             h.opened_at, h.median_hours_to_first_submission, h.p90_hours_to_first_submission
+      FROM homework_submission_stats h
+      LEFT JOIN daily_homework_posts d ON d.homework_number = h.homework_number
+      GROUP BY h.homework_number
+      ORDER BY h.homework_number
+    `);
+    const daily = await client.query(`
+      SELECT day, SUM(post_count)::int as post_count
+      FROM daily_student_posts
+      WHERE day >= CURRENT_DATE - $1::int
+      GROUP BY day
+      ORDER BY day
+    `, [days]);
+    // One narrow row per counted post
+    const totals = await client.query(`
+      SELECT COUNT(*)::int as total_posts, COUNT(DISTINCT author_id)::int as total_students
+      FROM analytics_rollup_state
+    `);
+
+    return {
+      totalPosts: totals.rows[0].total_posts,
+      totalStudents: totals.rows[0].total_students,
+      topStudents: students.rows,
+      popularTags: tags.rows,
+      homework: homework.rows,
+      daily: daily.rows,
+    };
+  } finally {
+    client.release();
+  }
+}
+
 export async function getSiteConfig(): Promise<SiteConfig> {
   const client = await pool.connect();
 
@@ -0,0 +1,62 @@
+import { readFile, stat } from 'fs/promises';
+import { join } from 'path';
+
+// Static JSON shards written by the ingest exporter (ingest/shards.py).
+// manifest.json maps query keys like "newest/1", "tag/muon/2" or "post/123"
+// to content-hashed files that never change once written.
+const SHARDS_DIR = join(process.cwd(), 'public', 'shards');
+const SHARDS_URL = '/shards';
+
+interface ShardEntry {
+  path: string;
+  bytes: number;
+  sha256: string;
+}
+
+interface ShardManifest {
+  version: number;
+  generated_at: string;
+  encodings: string[];
+  entries: Record<string, ShardEntry>;
+}
+
+let cachedManifest: { mtimeMs: number; manifest: ShardManifest } | null = null;
+
+async function loadManifest(): Promise<ShardManifest | null> {
+  try {
+    const manifestPath = join(SHARDS_DIR, 'manifest.json');
+    const { mtimeMs } = await stat(manifestPath);
+    if (!cachedManifest || cachedManifest.mtimeMs !== mtimeMs) {
+      const manifest = JSON.parse(await readFile(manifestPath, 'utf-8'));
+      cachedManifest = { mtimeMs, manifest };
+    }
+    return cachedManifest.manifest;
+  } catch {
+    return null;
+  }
+}
+
+// Build the manifest key for a query, matching shard_key() in ingest/shards.py
+export function shardKey(...parts: (string | number)[]): string {
+  return parts.map((part) => String(part).trim().toLowerCase()).join('/');
+}
+
+// Public URL of a shard (for CDN redirects), or null if it wasn't exported
+export async function getShardUrl(key: string): Promise<string | null> {
+  const manifest = await loadManifest();
+  const entry = manifest?.entries[key];
+  return entry ? `${SHARDS_URL}/${entry.path}` : null;
+}
+
+// Read and parse a shard from disk, or null if it wasn't exported
+export async function readShard<T = any>(key: string): Promise<T | null> {
+  const manifest = await loadManifest();
+  const entry = manifest?.entries[key];
+  if (!entry) return null;
+
+  try {
+    return JSON.parse(await readFile(join(SHARDS_DIR, entry.path), 'utf-8'));
+  } catch {
+    return null;
+  }
+}
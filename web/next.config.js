@@ -6,6 +6,24 @@ const nextConfig = {
   images: {
     domains: ['avatars.githubusercontent.com', 'github.com'],
   },
+  async headers() {
+    return [
+      {
+        // Shard filenames are content-hashed, so their contents never change
+        source: '/shards/:path*',
+        headers: [
+          { key: 'Cache-Control', value: 'public, max-age=31536000, immutable' },
+        ],
+      },
+      {
+        // The manifest is the only mutable file; later rules override earlier ones
+        source: '/shards/manifest.json',
+        headers: [
+          { key: 'Cache-Control', value: 'public, max-age=0, must-revalidate' },
+        ],
+      },
+    ]
+  },
   async rewrites() {
     return [
       {
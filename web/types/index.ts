@@ -39,6 +39,7 @@ export interface Post {
   ed_thread_id?: number;
   title: string;
   content?: string;
+  content_html?: string | null; // content pre-rendered to HTML (Markdown + KaTeX) at ingest
   author_id?: string;
   author?: Student;
   posted_at: string;
@@ -47,6 +48,8 @@ export interface Post {
   url?: string;
   category?: string;
   tags: string[];
+  topics?: string[];
+  homework_number?: number;
   attachments: Attachment[];
   links: Link[];
   search_vector?: string;